@@ -10,23 +10,34 @@
 # Remarques:
 # - Pas de connexion: ne fonctionne pas avec les posts privés / restreints.
 # - Les stories ne sont pas prises en charge.
+# - Ce fichier ne contient que l'interface: la logique est dans le paquet `igdl`,
+#   aussi utilisable sans Streamlit (python -m igdl --help).
 # Start the app : python -m streamlit run app.py
 
-import io
-import re
-import time
-import zipfile
-import unicodedata
-from typing import List, Optional, Dict
+import json
+import os
+import shutil
+from typing import Callable, List, Optional
 
-import os, html, random
-import requests
 import streamlit as st
-from instaloader import Instaloader, Post
-from instaloader.exceptions import ConnectionException, BadResponseException
-from urllib.parse import urlparse
 
-import hashlib
+from igdl.accounts import get_account_pool
+from igdl.auth import (cache_scope, extract_sessionid_from_cookie_string, set_sessionid_provider,
+                       set_sessionids_provider, split_sessionids)
+from igdl.cache import MEDIA_CACHE_MAX_BYTES, get_bundle_cache, get_media_cache
+from igdl.checkpoint import JobManifest, read_manifest
+from igdl.clients import get_client_pool
+from igdl.ingest import UrlIngest
+from igdl.metrics import start_metrics_server
+from igdl.download import DL_MAX_PER_HOST, DL_MAX_WORKERS, ZIP_COMPRESSLEVEL, ZIP_DEFLATE_PNG, ZIP_VOLUME_BYTES
+from igdl.jobs import JOB_ACTIVE, JOB_POLL_S, get_job_runner
+from igdl.preview import PREVIEW_PAGE_SIZE, preview_source
+from igdl.ratelimit import RL_CONFIG
+from igdl.renditions import RenditionPolicy
+from igdl.resolve import get_resolver_chain
+from igdl.strategies import RESOLVE_RACE
+from igdl.transcode import TRANSCODE_QUALITY, TranscodePolicy, supported_formats
+from igdl.urls import extract_username
 
 
 st.set_page_config(page_title="IG Media Downloader (HQ, Batch)", page_icon="📸", layout="centered")
@@ -37,13 +48,6 @@ st.caption("Colle **un ou plusieurs liens** de publications Instagram **publique
 # =========================
 # Helpers AUTH (sessionid)
 # =========================
-def _extract_sessionid_from_cookie_string(cookie_str: str) -> Optional[str]:
-    """Permet de coller un 'cookie string' complet (copié du navigateur) et d'en extraire la valeur de sessionid."""
-    if not cookie_str:
-        return None
-    m = re.search(r"(?:^|;\s*)sessionid=([^;]+)", cookie_str)
-    return m.group(1).strip() if m else None
-
 def _get_current_sessionid() -> Optional[str]:
     """Ordre de priorité :
     1) valeur saisie par l'utilisateur (session_state)
@@ -76,322 +80,96 @@ def _get_current_sessionid() -> Optional[str]:
     # 3) Variable d'environnement
     return os.getenv("IG_SESSIONID", None)
 
-def _build_browsery_session() -> requests.Session:
-    """Session HTTP avec UA navigateur + cookie sessionid si dispo."""
-    s = requests.Session()
-    s.headers.update({
-        "User-Agent": ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                       "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.0 Safari/605.1.15"),
-        "Accept": "*/*",
-        "Accept-Language": "fr,en;q=0.9",
-        "Referer": "https://www.instagram.com/",
-    })
-    sid = _get_current_sessionid()
-    if sid:
-        s.cookies.set("sessionid", sid, domain=".instagram.com")
-    return s
-
-def _get_instaloader_with_auth(use_auth: bool) -> Instaloader:
-    """Instaloader avec les mêmes headers/cookies (si use_auth=True)."""
-    L = Instaloader(
-        download_comments=False,
-        save_metadata=False,
-        post_metadata_txt_pattern="",
-        quiet=True,
-        max_connection_attempts=3,
-    )
-    if use_auth:
-        s = L.context._session
-        s.headers.update({
-            "User-Agent": ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                           "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.0 Safari/605.1.15"),
-            "Accept": "*/*",
-            "Accept-Language": "fr,en;q=0.9",
-            "Referer": "https://www.instagram.com/",
-        })
-        sid = _get_current_sessionid()
-        if sid:
-            s.cookies.set("sessionid", sid, domain=".instagram.com")
-    return L
 
-def _scrape_og_from_reel(shortcode: str) -> Optional[Dict[str, str]]:
-    """Fallback minimal: lit og:video / og:image de la page du Reel si Instaloader ne renvoie rien."""
+def _get_sessionids() -> list:
+    """Comptes du pool: la saisie UI (un seul compte) prime, puis secrets
+    (instagram.sessionids: liste ou chaîne, ou IG_SESSIONIDS), puis variable IG_SESSIONIDS."""
     try:
-        sess = _build_browsery_session()
-        url = f"https://www.instagram.com/reel/{shortcode}/"
-        r = sess.get(url, timeout=20)
-        r.raise_for_status()
-        html_text = r.text
-        # (fix regex: \s au lieu de \\s)
-        m = re.search(r'property="og:video"\s+content="([^"]+)"', html_text)
-        if m:
-            return {"kind": "video", "url": html.unescape(m.group(1))}
-        m = re.search(r'property="og:image"\s+content="([^"]+)"', html_text)
-        if m:
-            return {"kind": "photo", "url": html.unescape(m.group(1))}
+        sid_user = st.session_state.get("IG_SESSIONID_USER")
+        if sid_user:
+            return [sid_user]
     except Exception:
         pass
-    return None
-
-# =========================
-# Cache scope par session
-# =========================
-def _cache_scope() -> str:
-    sid = _get_current_sessionid()
-    return hashlib.sha256(sid.encode()).hexdigest()[:10] if sid else "anon"
-
-# =========================
-# URL / filename helpers
-# =========================
-def extract_shortcode(url: str) -> str:
-    if not url:
-        raise ValueError("URL vide.")
-    clean = url.split("?")[0].split("#")[0]
-    u = urlparse(clean)
-    parts = [p for p in u.path.split("/") if p]
-
-    for tag in ("p", "reel", "tv"):
-        if tag in parts:
-            i = parts.index(tag)
-            if i + 1 < len(parts):
-                code = parts[i + 1]
-                if re.fullmatch(r"[A-Za-z0-9_\-]+", code):
-                    return code
-
-    m = re.search(r"(?:^|/)(?:p|reel|tv)/([A-Za-z0-9_\-]+)(?:/|$)", u.path)
-    if m:
-        return m.group(1)
-
-    raise ValueError("URL invalide. Exemple: https://www.instagram.com/p/XXXXXXXXX/ ou https://www.instagram.com/<user>/p/XXXXXXXXX/")
-
-def sanitize_filename(text: str, max_len: int = 90) -> str:
-    if not text:
-        text = "sans_legende"
-    text = " ".join(text.split())
-    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
-    text = re.sub(r"[\\/:*?\"<>|#%&{}$!'@`+=~]", "", text)
-    text = re.sub(r"[^\w\s\-\.\(\)\[\]]", "", text)
-    text = text.strip()
-    if len(text) > max_len:
-        text = text[:max_len].rstrip()
-    return text or "sans_legende"
-
-def _best_from_display_resources(node_dict: dict) -> Optional[str]:
-    resources = None
-    if isinstance(node_dict, dict):
-        resources = node_dict.get("display_resources") or node_dict.get("thumbnail_resources")
-    if not resources or not isinstance(resources, list):
-        return None
-    try:
-        best = max(resources, key=lambda r: (r.get("config_width", 0), r.get("config_height", 0)))
-        return best.get("src")
-    except Exception:
-        return None
-
-def _best_from_video_versions(node_dict: dict) -> Optional[str]:
-    if not isinstance(node_dict, dict):
-        return None
-    versions = node_dict.get("video_versions") or node_dict.get("video_resources") or None
-    if not versions or not isinstance(versions, list):
-        url = node_dict.get("video_url")
-        return url
     try:
-        def keyfun(v):
-            return (v.get("width", 0), v.get("height", 0), v.get("bitrate", 0))
-        best = max(versions, key=keyfun)
-        return best.get("url") or best.get("src")
+        secrets_obj = st.secrets
+        InstaDict = secrets_obj.get("instagram", {})
+        sids = InstaDict.get("sessionids") if isinstance(InstaDict, dict) else None
+        sids = sids or secrets_obj.get("IG_SESSIONIDS")
+        if sids:
+            return split_sessionids(sids if isinstance(sids, str) else ",".join(sids))
     except Exception:
-        return node_dict.get("video_url")
-
-def _node_to_best_photo_url(node) -> Optional[str]:
-    node_dict = getattr(node, "_node", None)
-    best = None
-    if isinstance(node_dict, dict):
-        best = _best_from_display_resources(node_dict)
-        if best:
-            return best
-    return getattr(node, "display_url", None) or getattr(node, "url", None)
-
-def _node_to_best_video_url(node) -> Optional[str]:
-    node_dict = getattr(node, "_node", None)
-    url = getattr(node, "video_url", None)
-    if url:
-        return url
-    if isinstance(node_dict, dict):
-        best = _best_from_video_versions(node_dict)
-        if best:
-            return best
-    return None
-
-def _post_best_single_photo_url(post: Post) -> Optional[str]:
-    node_dict = getattr(post, "_node", None)
-    if isinstance(node_dict, dict):
-        best = _best_from_display_resources(node_dict)
-        if best:
-            return best
-    if not post.is_video:
-        return post.url
-    return None
-
-def _post_best_single_video_url(post: Post) -> Optional[str]:
-    if getattr(post, "video_url", None):
-        return post.video_url
-    node_dict = getattr(post, "_node", None)
-    if isinstance(node_dict, dict):
-        best = _best_from_video_versions(node_dict) or node_dict.get("video_url")
-        if best:
-            return best
-    return None
+        pass
+    sids = split_sessionids(os.getenv("IG_SESSIONIDS", ""))
+    if sids:
+        return sids
+    sid = _get_current_sessionid()
+    return [sid] if sid else []
 
-# =========================
-# Backoff / retries anti-429
-# =========================
-def _post_from_shortcode_with_backoff(L: Instaloader, shortcode: str, max_attempts: int = 5) -> Post:
-    """
-    Essaie de récupérer le Post avec exponentiel backoff si IG renvoie
-    'Please wait a few minutes', Unauthorized, 429, etc.
-    """
-    last_exc = None
-    for attempt in range(max_attempts):
-        try:
-            return Post.from_shortcode(L.context, shortcode)
-        except (ConnectionException, BadResponseException, Exception) as e:
-            last_exc = e
-            msg = str(e)
-            transient = any(s in msg for s in [
-                "Please wait a few minutes", "Too many requests", "429",
-                "Unauthorized", "checkpoint", "try again later"
-            ])
-            if transient and attempt < max_attempts - 1:
-                sleep_s = min(60.0, (1.6 ** attempt) + random.uniform(0.2, 0.8))
-                time.sleep(sleep_s)
-                continue
-            break
-    raise last_exc if last_exc else RuntimeError("Échec de récupération du post.")
 
-# =========================
-# Fetch bundle (avec auth)
-# =========================
-@st.cache_data(show_spinner=False)
-def fetch_post_bundle(shortcode: str, use_auth: bool, scope: str, max_attempts: int) -> dict:
-    """
-    Retourne un dict:
-    {
-        "shortcode": str,
-        "username": str,
-        "caption": str,
-        "media": List[{"kind": "photo"|"video", "url": str}]
-    }
-    """
-    # 'scope' n'est pas utilisé dans le corps : il sert à isoler le cache par utilisateur
-    L = _get_instaloader_with_auth(use_auth)
-    post = _post_from_shortcode_with_backoff(L, shortcode, max_attempts=max_attempts)
-    caption = post.caption or ""
-    username = getattr(post, "owner_username", "") or ""
-    media: List[Dict[str, str]] = []
-
-    # Carrousel
-    try:
-        nodes = list(post.get_sidecar_nodes())
-        if nodes:
-            for node in nodes:
-                if getattr(node, "is_video", False):
-                    vurl = _node_to_best_video_url(node)
-                    if vurl:
-                        media.append({"kind": "video", "url": vurl})
-                else:
-                    purl = _node_to_best_photo_url(node)
-                    if purl:
-                        media.append({"kind": "photo", "url": purl})
-    except Exception:
-        pass
+# Le cœur (igdl) lit le sessionid via ces fournisseurs: saisie UI > secrets > env
+set_sessionid_provider(_get_current_sessionid)
+set_sessionids_provider(_get_sessionids)
 
-    # Single
-    if not media:
-        if post.is_video:
-            v = _post_best_single_video_url(post)
-            if v:
-                media.append({"kind": "video", "url": v})
-        else:
-            p = _post_best_single_photo_url(post)
-            if p:
-                media.append({"kind": "photo", "url": p})
+# Export Prometheus des totaux du processus (http://127.0.0.1:<port>/metrics) si demandé
+if os.getenv("IGDL_METRICS_PORT"):
+    start_metrics_server(int(os.environ["IGDL_METRICS_PORT"]))
 
-    # Fallback OG si toujours rien (utile pour certains Reels)
-    if not media:
-        og = _scrape_og_from_reel(shortcode)
-        if og:
-            media.append(og)
+# File de lots (igdl.jobs): workers démarrés une fois par processus serveur, reprend les lots en attente
+get_job_runner()
 
-    return {"shortcode": shortcode, "username": username, "caption": caption, "media": media}
 
-# =========================
-# Download zip
-# =========================
-def _ext_from_content_type(ct: str, fallback: str) -> str:
-    ct = (ct or "").lower()
-    if "png" in ct:
-        return ".png"
-    if "webp" in ct:
-        return ".webp"
-    if "jpeg" in ct or "jpg" in ct:
-        return ".jpg"
-    if "gif" in ct:
-        return ".gif"
-    if "mp4" in ct:
-        return ".mp4"
-    if "quicktime" in ct or "mov" in ct:
-        return ".mov"
-    if "webm" in ct:
-        return ".webm"
-    return fallback
-
-def download_all_as_zip(bundles: List[Dict[str, object]]) -> bytes:
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        session = _build_browsery_session()
-        for bidx, b in enumerate(bundles, start=1):
-            caption = b["caption"] or ""
-            shortcode = b["shortcode"]
-            folder_caption = sanitize_filename(caption, 40)
-            folder = f"{shortcode}_{folder_caption or 'post'}"
-            base = sanitize_filename(caption)
-            media = b["media"]
-            for midx, item in enumerate(media, start=1):
-                url = item["url"]
-                kind = item["kind"]
-                err = None
-                content = None
-                ctype = None
-                for attempt in range(3):
-                    try:
-                        r = session.get(url, timeout=30)
-                        r.raise_for_status()
-                        content = r.content
-                        ctype = r.headers.get("Content-Type", "")
-                        break
-                    except Exception as e:
-                        err = e
-                        time.sleep(0.7 * (attempt + 1))
-                if content is not None:
-                    ext = _ext_from_content_type(ctype, ".mp4" if kind == "video" else ".jpg")
-                    filename = f"{folder}/{base}_{midx:02d}{ext}"
-                    zf.writestr(filename, content)
+def _show_metrics_report(snap: dict, sleep_s: float, prometheus: str) -> None:
+    """Rapport de performance du lot (BatchMetrics.snapshot du worker): où est passé le temps (résolution, pauses, CDN, ZIP)."""
+    timings, counters = snap["timings"], snap["counters"]
+    with st.expander("📊 Rapport de performance du lot"):
+        mb = counters.get("download.bytes", 0) / 1e6
+        st.caption(f"Durée {snap['elapsed_s']:.1f} s — {mb:.1f} Mo téléchargés"
+                   + (f" ({mb / snap['elapsed_s']:.1f} Mo/s)" if snap["elapsed_s"] else "")
+                   + f" — pauses cumulées {sleep_s:.1f} s (tous threads)")
+        if timings:
+            st.dataframe([{"étape": name, "appels": t["count"], "total (s)": t["total_s"],
+                           "p50 (ms)": t["p50_ms"], "p95 (ms)": t["p95_ms"], "max (ms)": t["max_ms"]}
+                          for name, t in timings.items()], hide_index=True, width="stretch")
+        if counters:
+            st.caption(" · ".join(f"{k} {v:g}" for k, v in counters.items()))
+        col_json, col_prom = st.columns(2)
+        col_json.download_button("Exporter (JSON)", data=json.dumps(snap, indent=2, ensure_ascii=False),
+                                 file_name="igdl_metrics.json", mime="application/json", on_click="ignore")
+        col_prom.download_button("Exporter (Prometheus)", data=prometheus, file_name="igdl_metrics.prom",
+                                 mime="text/plain", on_click="ignore")
+
+
+PREVIEW_COLUMNS = 4
+
+
+@st.fragment
+def _show_previews(bundles: list, job: JobManifest, media_cache) -> None:
+    """
+    Aperçus paginés (premier média de chaque post): petites renditions Instagram ou miniatures
+    faites depuis les fichiers du lot (igdl.preview). Changer de page ne relance que ce fragment,
+    et seuls les aperçus de la page affichée sont calculés / chargés.
+    """
+    posts = [b for b in bundles if b["media"]]
+    pages = max(1, -(-len(posts) // PREVIEW_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = int(st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, value=1, step=1,
+                                   key="IG_PREVIEW_PAGE"))
+    shown = posts[(page - 1) * PREVIEW_PAGE_SIZE:page * PREVIEW_PAGE_SIZE]
+    for row in range(0, len(shown), PREVIEW_COLUMNS):
+        for col, b in zip(st.columns(PREVIEW_COLUMNS), shown[row:row + PREVIEW_COLUMNS]):
+            first = b["media"][0]
+            local = job.completed(f"{b['shortcode']}_01", first["url"], media_cache)
+            src = preview_source(first, local and local["path"])
+            label = f"{b['shortcode']} – {first['kind']} 1"
+            with col:
+                if src:
+                    st.image(src, caption=label, width="stretch")
                 else:
-                    zf.writestr(f"{folder}/ERREUR_{midx:02d}.txt", f"Impossible de telecharger {url}\n{err}")
-    buf.seek(0)
-    return buf.read()
-
-def parse_urls(text: str) -> List[str]:
-    raw = re.split(r"[,\s;]+", text.strip())
-    urls = [u for u in raw if u]
-    seen = set()
-    dedup = []
-    for u in urls:
-        if u not in seen:
-            dedup.append(u)
-            seen.add(u)
-    return dedup
+                    st.caption(label)
+                if first["kind"] == "video":
+                    st.markdown(f"[▶ Ouvrir la vidéo]({first['url']})")
+
 
 # =========================
 # Sidebar: Connexion + Mode Safe
@@ -412,6 +190,7 @@ with st.sidebar:
         sid_input = st.text_input("sessionid", type="password", placeholder="ex: 123456789%3Aabcdefghijklmnop%3A1%3A...")
         if st.button("Enregistrer le cookie dans cette session"):
             if sid_input.strip():
+                get_client_pool().invalidate(cache_scope())
                 st.session_state["IG_SESSIONID_USER"] = sid_input.strip()
                 st.success("Cookie enregistré en mémoire (tactique).")
             else:
@@ -419,8 +198,9 @@ with st.sidebar:
     else:
         cookie_str = st.text_area("Colle ici la ligne de cookies complète copiée du navigateur", height=80, placeholder="csrftoken=...; sessionid=...; mid=...;")
         if st.button("Extraire & enregistrer"):
-            sid = _extract_sessionid_from_cookie_string(cookie_str or "")
+            sid = extract_sessionid_from_cookie_string(cookie_str or "")
             if sid:
+                get_client_pool().invalidate(cache_scope())
                 st.session_state["IG_SESSIONID_USER"] = sid
                 st.success("Cookie `sessionid` extrait et enregistré en mémoire.")
             else:
@@ -428,91 +208,299 @@ with st.sidebar:
 
     # Bouton de suppression du cookie (BYO-cookie propre)
     if st.button("🔓 Supprimer le cookie de cette session"):
+        get_client_pool().invalidate(cache_scope())
         st.session_state.pop("IG_SESSIONID_USER", None)
         st.success("Cookie retiré de la mémoire de session.")
 
     current_sid = _get_current_sessionid()
-    if current_sid:
+    account_pool = get_account_pool() if current_sid else None
+    if account_pool:
+        st.success(f"✅ Authentifié ({len(account_pool)} comptes en rotation).")
+    elif current_sid:
         st.success("✅ Authentifié (cookie actif).")
     else:
         st.info("🚫 Non authentifié (mode invité). Certains Reels/vidéos peuvent échouer.")
 
     st.subheader("⚙️ Mode Safe (anti rate-limit)")
-    SAFE_DELAY_S = st.number_input("Délai min entre posts (secondes)", min_value=0.0, max_value=5.0, value=1.0, step=0.1)
+    SAFE_DELAY_S = st.number_input("Délai initial entre requêtes (secondes)", min_value=0.0, max_value=5.0, value=1.0, step=0.1,
+                                   help="Rythme de départ du limiteur adaptatif (appliqué dès qu'il change): il ralentit sur 429 / « Please wait » "
+                                        "puis réaccélère progressivement.")
     MAX_ATTEMPTS = st.number_input("Tentatives max / post", min_value=1, max_value=10, value=5, step=1)
+    meta_rate = (1.0 / SAFE_DELAY_S) if SAFE_DELAY_S > 0 else RL_CONFIG["meta"]["max_rate"]
+    # les lots tournent dans les workers: état affiché = celui qu'ils enregistrent dans la file
+    rl_scopes = list(dict.fromkeys([cache_scope()] + ([a.scope for a in account_pool.accounts] if account_pool else [])))
+    rl_states = get_job_runner().queue.limiter_states(rl_scopes)
+    if account_pool:
+        rows = []
+        for a in account_pool.accounts:
+            s = {"rate": round(meta_rate, 3), "open": False, "quarantined_for_s": 0, "ok": 0, "failures": 0,
+                 **rl_states.get(a.scope, {})}
+            rows.append({"compte": a.label, "sain": "⛔" if s["open"] or s["quarantined_for_s"] else "✅",
+                         "req/s": s["rate"], "ok": s["ok"], "échecs": s["failures"],
+                         "quarantaine (s)": s["quarantined_for_s"]})
+        st.dataframe(rows, hide_index=True, width="stretch")
+    else:
+        rl_state = {"rate": round(meta_rate, 3), "open": False, "blocked_for_s": 0, **rl_states.get(cache_scope(), {})}
+        if rl_state["open"]:
+            st.error("⛔ Disjoncteur ouvert: Instagram bloque ce compte, les lots échouent immédiatement.")
+        else:
+            st.caption(f"Débit actuel: {rl_state['rate']} req/s"
+                       + (f" — pause imposée {rl_state['blocked_for_s']} s" if rl_state["blocked_for_s"] else ""))
+    if st.button("🔁 Réarmer le limiteur"):
+        get_job_runner().queue.reset_limiters(rl_scopes)
+        st.success("Limiteur réarmé.")
+    if st.button("🧹 Vider le cache des métadonnées"):
+        get_bundle_cache().clear()
+        st.success("Cache des métadonnées vidé.")
+
+    RESOLVE_RACE_UI = st.checkbox("Course des résolveurs légers", value=RESOLVE_RACE,
+                                  help="Page embed et balises OG interrogées ensemble, la première réponse complète "
+                                       "gagne: plus rapide, un peu plus de requêtes.")
+    with st.expander("🧭 Stratégies de résolution (ordre appris)"):
+        st.dataframe(get_resolver_chain().state(), hide_index=True, width="stretch")
+
+    jobs_state = get_job_runner().state()
+    st.caption(f"File de lots: {jobs_state['running']} en cours, {jobs_state['queued']} en attente "
+               f"({jobs_state['workers']} processus workers).")
+
+    st.subheader("🚀 Téléchargement parallèle")
+    DL_WORKERS = st.number_input("Connexions simultanées (total)", min_value=1, max_value=32, value=DL_MAX_WORKERS, step=1)
+    DL_PER_HOST = st.number_input("Connexions simultanées par hôte CDN", min_value=1, max_value=16, value=DL_MAX_PER_HOST, step=1)
+
+    st.subheader("📉 Taille des médias")
+    RENDITION_MODE = st.radio("Rendition", ["Originaux (qualité max)", "Résolution cible", "Débit vidéo max", "Budget par lot"],
+                              help="Choisie parmi les tailles proposées par Instagram: moins d'octets à télécharger "
+                                   "et une archive plus légère (revue, vignettes d'index...).")
+    RENDITION_POLICY = RenditionPolicy()
+    if RENDITION_MODE == "Résolution cible":
+        RENDITION_POLICY = RenditionPolicy(max_side=int(st.number_input("Grand côté max (pixels)", min_value=100,
+                                                                        max_value=4096, value=640, step=20)))
+    elif RENDITION_MODE == "Débit vidéo max":
+        RENDITION_POLICY = RenditionPolicy(max_bitrate=1000 * int(st.number_input("Débit max (kbit/s)", min_value=100,
+                                                                                  max_value=20000, value=1500, step=100)))
+    elif RENDITION_MODE == "Budget par lot":
+        RENDITION_POLICY = RenditionPolicy(byte_budget=int(1e6 * st.number_input("Budget du lot (Mo, estimé)", min_value=1,
+                                                                                 max_value=100000, value=500, step=50)))
+
+    st.subheader("🖼️ Réencodage des photos")
+    TRANSCODE_FORMATS_UI = supported_formats()
+    TRANSCODE_POLICY = TranscodePolicy()
+    if TRANSCODE_FORMATS_UI:
+        fmt = st.selectbox("Format", ["Originaux"] + [f.upper() for f in TRANSCODE_FORMATS_UI],
+                           help="Photos réencodées avant l'archive (tous les cœurs): bien plus légères pour "
+                                "l'archivage. Vidéos inchangées; une photo déjà plus petite reste l'originale.")
+        if fmt != "Originaux":
+            TRANSCODE_POLICY = TranscodePolicy(
+                fmt.lower(), int(st.slider("Qualité", min_value=30, max_value=100, value=TRANSCODE_QUALITY)),
+                int(st.number_input("Grand côté max (pixels, 0 = inchangé)", min_value=0, max_value=8192,
+                                    value=0, step=64)) or None)
+    else:
+        st.caption("Indisponible: Pillow n'est pas installé.")
+
+    st.subheader("📦 Archive")
+    VOLUME_MODE = st.radio("Format", ["Un seul ZIP", "ZIP découpé en volumes"],
+                           help="Volumes: des ZIP autonomes de taille bornée, téléchargeables dès qu'ils sont "
+                                "prêts, pendant que le lot continue (gros lots).")
+    VOLUME_BYTES = None
+    if VOLUME_MODE == "ZIP découpé en volumes":
+        VOLUME_BYTES = 1024 * 1024 * int(st.number_input("Taille max d'un volume (Mo)", min_value=10, max_value=10000,
+                                                         value=ZIP_VOLUME_BYTES // (1024 * 1024), step=50))
+
+    st.subheader("🗜️ Compression du ZIP")
+    st.caption("Photos et vidéos sont déjà compressées: elles sont stockées telles quelles.")
+    ZIP_LEVEL = st.slider("Niveau de compression (texte / PNG)", min_value=0, max_value=9, value=ZIP_COMPRESSLEVEL)
+    ZIP_PNG = st.checkbox("Compresser aussi les PNG", value=ZIP_DEFLATE_PNG)
+
+    st.subheader("💾 Cache disque des médias")
+    USE_MEDIA_CACHE = st.checkbox("Réutiliser les médias déjà téléchargés", value=True,
+                                  help=f"Limite: {MEDIA_CACHE_MAX_BYTES // (1024 * 1024)} Mo (IGDL_MEDIA_CACHE_MAX_MB), éviction LRU.")
 
 # =========================
 # Formulaire principal
 # =========================
 with st.form("batch_form"):
     url_text = st.text_area("Colle tes liens de publications Instagram (un par ligne, ou séparés par espaces/virgules)", height=160, placeholder="https://www.instagram.com/p/AAA/\nhttps://www.instagram.com/reel/BBB/\nhttps://www.instagram.com/p/CCC/")
+    link_files = st.file_uploader("… ou envoie des fichiers de liens (TXT, CSV ou JSONL, des dizaines de milliers de lignes possibles)",
+                                  type=["txt", "csv", "jsonl", "ndjson", "json"], accept_multiple_files=True)
+    profile_text = st.text_input("… et/ou un profil à synchroniser: seuls ses posts pas encore archivés sont téléchargés",
+                                 placeholder="@utilisateur")
     submit = st.form_submit_button("Télécharger en lot (photos + vidéos)")
 
 if submit:
-    urls = parse_urls(url_text or "")
-    if not urls:
+    # Liens normalisés et dédupliqués par shortcode (igdl.ingest): un post collé sous plusieurs
+    # formes (/p/X/, /reel/X/?igsh=...) n'est résolu qu'une fois. Les fichiers sont lus en flux.
+    ingest = UrlIngest().feed_text(url_text or "", source="texte")
+    if link_files:
+        with st.spinner("Lecture des fichiers de liens…"):
+            for f in link_files:
+                ingest.feed(f, source=f.name)
+    urls = ingest.urls
+    if ingest.duplicates or ingest.invalid_count:
+        st.caption(f"{len(urls)} post(s) distinct(s) sur {ingest.links} lien(s): "
+                   f"{ingest.duplicates} doublon(s) ignoré(s), {ingest.invalid_count} ligne(s) invalide(s).")
+    if ingest.invalid:
+        with st.expander(f"⚠️ Lignes invalides ({ingest.invalid_count})"):
+            st.dataframe([l._asdict() for l in ingest.invalid], width="stretch")
+    username = None
+    if (profile_text or "").strip():
+        try:
+            username = extract_username(profile_text)
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
+    if not urls and not username:
         st.error("Ajoute au moins un lien.")
     else:
-        st.info(f"{len(urls)} lien(s) détecté(s). Analyse en cours…")
-        bundles = []
-        errors = []
-        prog = st.progress(0)
-        scope = _cache_scope()  # <— isole le cache par utilisateur
-        for i, u in enumerate(urls, 1):
-            try:
-                # Throttle global pour éviter les 401/429
-                if i > 1 and SAFE_DELAY_S > 0:
-                    time.sleep(SAFE_DELAY_S + random.uniform(0, SAFE_DELAY_S * 0.25))
-
-                shortcode = extract_shortcode(u)
-                use_auth = bool(_get_current_sessionid())
-                bundle = fetch_post_bundle(shortcode, use_auth=use_auth, scope=scope, max_attempts=int(MAX_ATTEMPTS))
-                if not bundle["media"]:
-                    errors.append((u, "Aucun média trouvé (post privé ou non accessible)."))
-                else:
-                    bundles.append(bundle)
-                    st.write(f"✅ {u} → {len(bundle['media'])} média(s).")
-            except Exception as e:
-                msg = str(e)
-                if ("Please wait a few minutes" in msg) or ("Unauthorized" in msg) or ("429" in msg):
-                    msg = ("Limite Instagram atteinte (rate-limit). "
-                           "Active le Mode Safe, augmente le délai entre posts, "
-                           "et vérifie ton cookie `sessionid`.")
-                errors.append((u, msg))
-            prog.progress(i / len(urls))
-            # petit yield UI
-            time.sleep(0.05)
-
-        if errors:
-            with st.expander("⚠️ Liens en erreur"):
-                for (u, e) in errors:
-                    st.write(f"- {u} → {e}")
-
-        if not bundles:
-            st.error("Aucun média téléchargeable trouvé.")
+        # Le lot part dans la file (igdl.jobs): un processus worker le résout, télécharge et écrit
+        # l'archive sur disque. Les interactions et rechargements de page n'interrompent plus rien;
+        # l'id du lot est gardé dans l'URL de la page (?job=...).
+        # Lot reprenable: mêmes liens + mêmes options = même point de reprise (igdl.checkpoint).
+        # La synchro de profil (posts pas encore archivés) est faite par le worker.
+        use_auth = bool(_get_current_sessionid())
+        spec = {"urls": urls, "scope": cache_scope(), "format": "zip",
+                "compresslevel": int(ZIP_LEVEL), "deflate_png": bool(ZIP_PNG)}
+        if RENDITION_POLICY.active:
+            spec["renditions"] = RENDITION_POLICY._asdict()
+        if TRANSCODE_POLICY.active:
+            spec["transcode"] = TRANSCODE_POLICY._asdict()
+        if VOLUME_BYTES:
+            spec.update(format="volumes", volume_bytes=VOLUME_BYTES)
+        options = {"use_auth": use_auth, "profile": username, "max_attempts": int(MAX_ATTEMPTS),
+                   "workers": int(DL_WORKERS), "per_host": int(DL_PER_HOST), "use_media_cache": bool(USE_MEDIA_CACHE),
+                   "resolve_workers": len(account_pool) if account_pool else 1, "meta_rate": meta_rate,
+                   "kinds": ingest.kinds, "race": bool(RESOLVE_RACE_UI)}
+        job_id = get_job_runner().submit(spec, options, sessionids=_get_sessionids() if use_auth else None)
+        # On supprime le lot terminé précédent de cette session (s'il s'agit d'un autre lot).
+        old = get_job_runner().queue.get(st.session_state.get("IG_LAST_JOB") or "")
+        old_dir = old and old["result"] and old["result"].get("checkpoint")
+        if old and old["id"] != job_id and old["status"] not in JOB_ACTIVE and old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        st.session_state["IG_LAST_JOB"] = job_id
+        st.query_params["job"] = job_id
+        st.info(f"{len(urls)} lien(s) détecté(s)" + (f" + profil @{username}" if username else "")
+                + ". Lot envoyé à la file de traitement."
+                + (f" (renditions: {RENDITION_POLICY.describe()})" if RENDITION_POLICY.active else "")
+                + (f" (réencodage: {TRANSCODE_POLICY.describe()})" if TRANSCODE_POLICY.active else ""))
+
+
+def _file_reader(path: str) -> Callable[[], bytes]:
+    """Lecture différée (au clic): la page ne relit pas les volumes à chaque rafraîchissement."""
+    def _read() -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+    return _read
+
+
+def _volume_buttons(paths: List[str], key: str) -> None:
+    for i, path in enumerate(paths, start=1):
+        st.download_button(f"📦 Volume {i}/{len(paths)} ({os.path.getsize(path) / 1e6:.0f} Mo)",
+                           data=_file_reader(path), file_name=f"instagram_medias_batch.{i:03d}.zip",
+                           mime="application/zip", key=f"{key}_{i}", on_click="ignore")
+
+
+@st.fragment(run_every=JOB_POLL_S)
+def _poll_job(job_id: str) -> None:
+    """Avancement d'un lot en file / en cours (relu chaque seconde); relance la page quand il se termine."""
+    runner = get_job_runner()
+    job = runner.queue.get(job_id)
+    if job is None or job["status"] not in JOB_ACTIVE:
+        st.rerun()
+    if job["status"] == "queued":
+        ahead = runner.queue.position(job_id)
+        st.info("⏳ Lot en file d'attente" + (f" ({ahead} lot(s) avant lui)." if ahead else ": démarrage imminent."))
+    else:
+        p = job["progress"] or {}
+        if p.get("stage") == "profile":
+            st.info(f"Recherche des nouveaux posts de @{job['options']['profile']}…")
         else:
-            st.success(f"Prêt: {len(bundles)} post(s) valides, {sum(len(b['media']) for b in bundles)} média(s) au total.")
-            with st.expander("Aperçu rapide (premier média de chaque post)"):
-                for b in bundles:
-                    if b["media"]:
-                        first = b["media"][0]
-                        if first["kind"] == "photo":
-                            st.image(first["url"], caption=f"{b['shortcode']} – photo 1", use_container_width=True)
-                        else:
-                            try:
-                                st.video(first["url"])
-                            except Exception:
-                                st.write(f"{b['shortcode']} – vidéo 1: {first['url']}")
-
-            zip_bytes = download_all_as_zip(bundles)
-            zip_name = "instagram_medias_batch.zip"
-            st.download_button(
-                "📦 Télécharger le ZIP (qualité max)",
-                data=zip_bytes,
-                file_name=zip_name,
-                mime="application/zip",
-                type="primary"
-            )
+            total, total_media = p.get("total") or 0, p.get("total_media") or 0
+            st.progress(p.get("resolved", 0) / total if total else 0.0,
+                        text=f"Résolution: {p.get('resolved', 0)}/{total} post(s)")
+            st.progress(p.get("written", 0) / total_media if total_media else 0.0,
+                        text=f"Téléchargement: {p.get('written', 0)}/{total_media} média(s)")
+            volumes = [v for v in p.get("volumes") or [] if os.path.exists(v)]
+            if volumes:
+                st.caption(f"{len(volumes)} volume(s) prêt(s), téléchargeable(s) sans attendre la fin du lot:")
+                _volume_buttons(volumes, "IG_VOL_LIVE")
+    if st.button("⛔ Annuler le lot", key="IG_JOB_CANCEL"):
+        runner.queue.cancel(job_id)
+
+
+def _show_job_result(job: dict) -> None:
+    """Issue d'un lot terminé: erreurs, aperçus et archive servie depuis le disque."""
+    if job["status"] == "cancelled":
+        st.warning("Lot annulé. Le relancer reprend là où il s'était arrêté.")
+        return
+    if job["status"] == "failed":
+        st.error(job["error"] or "Le lot a échoué.")
+        return
+    res = job["result"]
+    prof = res.get("profile")
+    if prof:
+        st.caption(f"@{prof['username']}: {prof['new']} nouveau(x) post(s), {prof['pending']} en attente, "
+                   f"{prof['archived']} déjà archivé(s).")
+        if not res["urls"]:
+            st.success(f"Rien de nouveau sur @{prof['username']}.")
+            return
+        done = prof.get("record")
+        if done:
+            st.caption(f"Index de @{prof['username']}: {done['archived']} post(s) archivé(s)"
+                       + (f", {done['pending']} à retenter à la prochaine synchro." if done["pending"] else "."))
+    if res.get("reused"):
+        st.caption("Lot déjà terminé: archive reprise telle quelle.")
+    elif res.get("resumed"):
+        r = res["resumed"]
+        st.caption(f"Reprise du lot: {r['resolved']} post(s) déjà résolu(s), "
+                   f"{r['media_done']} média(s) déjà téléchargé(s), {r['partial']} partiel(s).")
+    st.caption("Cache métadonnées: " + ", ".join(f"{k} {v}" for k, v in res["bundle_cache"].items()))
+    if res["metrics"]["timings"]:
+        _show_metrics_report(res["metrics"], res["sleep_s"], res["metrics_prometheus"])
+
+    if res["errors"]:
+        with st.expander("⚠️ Liens en erreur"):
+            for (u, e) in res["errors"]:
+                st.write(f"- {u} → {e}")
+
+    zip_path = res.get("archive")
+    outputs = res.get("volumes") or ([zip_path] if zip_path else [])
+    if not outputs or not all(os.path.exists(p) for p in outputs):
+        st.error("Aucun média téléchargeable trouvé." if not outputs else "Archive expirée: relance le lot.")
+        return
+    st.success(f"Prêt: {res['posts']} post(s) valides, {res['media']} média(s) au total.")
+    if res.get("bytes_saved"):
+        st.caption(f"Réencodage des photos: {res['bytes_saved'] / 1e6:.1f} Mo gagnés "
+                   f"(archive: {sum(os.path.getsize(p) for p in outputs) / 1e6:.1f} Mo).")
+    # Manifeste du lot en lecture seule (un worker peut reprendre le même lot): bundles et médias des aperçus
+    manifest = read_manifest(res["checkpoint"])
+    bundles = manifest.bundles() if manifest else []
+    if bundles:
+        with st.expander("Aperçu rapide (premier média de chaque post)"):
+            _show_previews(bundles, manifest, get_media_cache() if USE_MEDIA_CACHE else None)
+
+    if res.get("volumes"):
+        _volume_buttons(res["volumes"], "IG_VOL")
+        return
+    zip_name = "instagram_medias_batch.zip"
+    with open(zip_path, "rb") as zip_file:
+        st.download_button(
+            "📦 Télécharger le ZIP (qualité max)",
+            data=zip_file,
+            file_name=zip_name,
+            mime="application/zip",
+            type="primary"
+        )
+
+
+# Lot courant (soumis à l'instant, ou retrouvé depuis l'URL après un rechargement)
+current_job_id = st.query_params.get("job")
+if current_job_id:
+    current_job = get_job_runner().queue.get(current_job_id)
+    if current_job is None:
+        st.warning("Lot introuvable (expiré ou supprimé).")
+    elif current_job["status"] in JOB_ACTIVE:
+        _poll_job(current_job_id)
+    else:
+        _show_job_result(current_job)
 
 st.divider()
 with st.expander("ℹ️ Conseils et limites"):
@@ -0,0 +1,336 @@
+# bench/__main__.py
+# Benchmarks hors ligne: python -m bench [--posts 30] [--json resultats.json] [--compare base.json]
+#
+# Scénarios (caches froids, dossiers temporaires):
+# - resolve: fetch_post_bundle post par post (métadonnées seules);
+# - zip    : download_all_as_zip sur des bundles déjà résolus (CDN + ZIP seuls);
+# - batch  : chemin complet de l'UI (pipeline, ZipBatchWriter sur disque, cache médias, reprise).
+# Rapport: posts/s, Mo/s, pic de RSS, latences p50/p95 (par post, requêtes meta, requêtes CDN),
+# pauses cumulées et détail par étape (igdl.metrics, dans le rapport JSON).
+# Les limiteurs de débit sont levés par défaut (--limits prod pour garder ceux de production):
+# on mesure le code, pas la politesse envers Instagram.
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from bench.fake_instagram import FakeConfig, FakeInstagram, redirect_to
+
+SCENARIOS = ("resolve", "zip", "batch")
+
+
+# =========================
+# Mesures
+# =========================
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # hors Linux: pic du processus entier (ru_maxrss en Ko sous Linux, en octets sous macOS)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+class PeakRSS:
+    """Échantillonne la RSS du processus (toutes les 10 ms) pendant un scénario."""
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-rss", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRSS":
+        self.peak = _rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+class Latencies:
+    """Latences collectées par catégorie ("post", "meta", "cdn"), thread-safe."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: {"n": len(v), "p50_ms": round(_percentile(v, 50) * 1000, 2),
+                           "p95_ms": round(_percentile(v, 95) * 1000, 2)}
+                    for name, v in sorted(self.samples.items()) if v}
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    s = sorted(values)
+    k = (len(s) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# =========================
+# Scénarios
+# =========================
+def _shortcodes(n: int) -> List[str]:
+    return [f"BENCH{i:05d}" for i in range(n)]
+
+
+def _urls(n: int, fake: FakeInstagram) -> List[str]:
+    """Liens comme les colleraient les utilisateurs: /reel/ pour les posts vidéo, /p/ sinon."""
+    return [f"https://www.instagram.com/{'reel' if fake.post_kind(sc) == 'video' else 'p'}/{sc}/"
+            for sc in _shortcodes(n)]
+
+
+def _run_scenario(name: str, fn: Callable[[Latencies], dict], fake: FakeInstagram) -> dict:
+    from igdl import metrics
+
+    lat = Latencies()
+    before = fake.stats.snapshot()
+    with redirect_to(fake, on_response=lat.add), PeakRSS() as rss, metrics.collect() as m:
+        t0 = time.perf_counter()
+        out = fn(lat)
+        elapsed = time.perf_counter() - t0
+    after = fake.stats.snapshot()
+    out.update({
+        "elapsed_s": round(elapsed, 3),
+        "posts_per_s": round(out.get("posts", 0) / elapsed, 3) if elapsed else 0.0,
+        "mb_per_s": round(out.get("bytes", 0) / 1e6 / elapsed, 3) if elapsed else 0.0,
+        "peak_rss_mb": round(rss.peak / 1e6, 1),
+        "latency": lat.summary(),
+        "sleep_s": round(m.sleep_total(), 3),
+        "metrics": m.snapshot(),
+        "server": {"throttled": after["throttled"] - before["throttled"],
+                   "dropped": after["dropped"] - before["dropped"],
+                   "requests": {k: v - before["requests"].get(k, 0) for k, v in after["requests"].items()}},
+    })
+    return out
+
+
+def scenario_resolve(n: int, workdir: str, fake: FakeInstagram, args: argparse.Namespace) -> Callable[[Latencies], dict]:
+    from igdl.auth import cache_scope
+    from igdl.cache import BundleCache
+    from igdl.resolve import fetch_post_bundle
+    from igdl.urls import extract_shortcode, post_kind
+
+    def run(lat: Latencies) -> dict:
+        cache = BundleCache(os.path.join(workdir, "resolve.sqlite"))
+        posts = media = errors = 0
+        for u in _urls(n, fake):
+            t0 = time.perf_counter()
+            try:
+                b = fetch_post_bundle(extract_shortcode(u), False, cache_scope(), 5, cache=cache,
+                                      kind=post_kind(u), race=args.race or None)
+                posts += 1
+                media += len(b["media"])
+            except Exception:
+                errors += 1
+            lat.add("post", time.perf_counter() - t0)
+        return {"posts": posts, "media": media, "errors": errors}
+    return run
+
+
+def scenario_zip(n: int, fake: FakeInstagram, args: argparse.Namespace) -> Callable[[Latencies], dict]:
+    from igdl.download import download_all_as_zip
+
+    # bundles construits directement (pas de résolution): seul le chemin CDN + ZIP est mesuré
+    bundles = []
+    for sc in _shortcodes(n):
+        item = fake.media_item(sc)
+        if item is None:
+            continue
+        nodes = item.get("carousel_media") or [item]
+        media = [{"kind": "video", "url": nd["video_versions"][0]["url"]} if nd.get("video_versions") else
+                 {"kind": "photo", "url": nd["image_versions2"]["candidates"][0]["url"]} for nd in nodes]
+        bundles.append({"shortcode": sc, "username": "bench_user", "caption": item["caption"]["text"],
+                        "date": item["taken_at"], "media": media})
+
+    def run(lat: Latencies) -> dict:
+        data = download_all_as_zip(bundles, max_workers=args.workers, max_per_host=args.per_host)
+        return {"posts": len(bundles), "media": sum(len(b["media"]) for b in bundles),
+                "bytes": len(data)}
+    return run
+
+
+def scenario_batch(n: int, workdir: str, fake: FakeInstagram, args: argparse.Namespace) -> Callable[[Latencies], dict]:
+    from igdl.auth import cache_scope
+    from igdl.cache import BundleCache, MediaCache
+    from igdl.checkpoint import BatchCheckpoint
+    from igdl.download import ZipBatchWriter
+    from igdl.pipeline import run_batch_pipeline
+    from igdl.resolve import fetch_post_bundle
+    from igdl.urls import extract_shortcode, post_kind
+
+    def run(lat: Latencies) -> dict:
+        bundle_cache = BundleCache(os.path.join(workdir, "batch.sqlite"))
+        media_cache = MediaCache(os.path.join(workdir, "media"))
+        urls = _urls(n, fake)
+        kinds = {extract_shortcode(u): post_kind(u) for u in urls}
+        resolved_at: Dict[str, float] = {}
+        t_start = time.perf_counter()
+
+        def _resolve(u: str) -> dict:
+            t0 = time.perf_counter()
+            try:
+                sc = extract_shortcode(u)
+                return fetch_post_bundle(sc, False, cache_scope(), 5, cache=bundle_cache, kind=kinds[sc], race=args.race or None)
+            finally:
+                lat.add("post", time.perf_counter() - t0)
+                resolved_at[u] = time.perf_counter() - t_start
+
+        def _refresh(shortcode: str) -> dict:
+            return fetch_post_bundle(shortcode, False, cache_scope(), 5, cache=bundle_cache, fresh=True,
+                                     kind=kinds[shortcode], race=args.race or None)
+
+        with BatchCheckpoint.open({"bench": urls}, root=os.path.join(workdir, "jobs")) as job:
+            with ZipBatchWriter(job.archive_path, max_workers=args.workers, max_per_host=args.per_host,
+                                cache=media_cache, checkpoint=job, refresh=_refresh) as writer:
+                bundles, errors = run_batch_pipeline(urls, job.wrap_resolve(_resolve), writer)
+            size = os.path.getsize(job.archive_path)
+        return {"posts": len(bundles), "media": writer.total, "media_failed": writer.failed,
+                "errors": len(errors), "bytes": writer.bytes_written, "archive_bytes": size}
+    return run
+
+
+# =========================
+# CLI
+# =========================
+def _lift_limits() -> None:
+    """Lève les plafonds des limiteurs adaptatifs (avant leur création)."""
+    from igdl import ratelimit
+
+    for cfg in ratelimit.RL_CONFIG.values():
+        cfg.update(rate=1e6, max_rate=1e6, burst=1e6)
+
+
+def _compare(current: dict, baseline: dict) -> str:
+    lines = [f"Comparaison avec {baseline.get('revision') or '?'}:"]
+    for name, res in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        parts = []
+        for key in ("posts_per_s", "mb_per_s", "peak_rss_mb"):
+            if base.get(key):
+                parts.append(f"{key} {res[key] / base[key] - 1:+.1%}")
+        lines.append(f"  {name}: " + ", ".join(parts))
+    return "\n".join(lines)
+
+
+def _format(report: dict) -> str:
+    lines = [f"igdl bench @ {report['revision'] or '?'} — {report['posts']} posts"]
+    for name, r in report["results"].items():
+        lat = ", ".join(f"{k} p50 {v['p50_ms']} ms / p95 {v['p95_ms']} ms" for k, v in r["latency"].items())
+        lines.append(f"  {name:8s} {r['elapsed_s']:8.2f} s  {r['posts_per_s']:8.2f} posts/s  "
+                     f"{r['mb_per_s']:8.2f} Mo/s  RSS max {r['peak_rss_mb']:7.1f} Mo  pauses {r['sleep_s']:.2f} s")
+        if lat:
+            lines.append(f"           {lat}")
+        srv = r["server"]
+        if srv["throttled"] or srv["dropped"] or r.get("errors"):
+            lines.append(f"           429: {srv['throttled']}, coupures: {srv['dropped']}, erreurs: {r.get('errors', 0)}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks hors ligne d'igdl (faux Instagram local).")
+    p.add_argument("--posts", type=int, default=30)
+    p.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"parmi {', '.join(SCENARIOS)}")
+    p.add_argument("--photo-kb", type=int, default=300)
+    p.add_argument("--video-mb", type=float, default=8.0)
+    p.add_argument("--video-ratio", type=float, default=0.3)
+    p.add_argument("--carousel-ratio", type=float, default=0.3)
+    p.add_argument("--carousel-size", type=int, default=4)
+    p.add_argument("--meta-latency-ms", type=float, default=50.0)
+    p.add_argument("--cdn-latency-ms", type=float, default=20.0)
+    p.add_argument("--cdn-mbps", type=float, default=0.0, help="débit par connexion CDN (Mo/s, 0 = illimité)")
+    p.add_argument("--meta-429", type=float, default=0.0, help="probabilité de 429 sur les métadonnées")
+    p.add_argument("--video-graphql-ms", type=float, default=0.0,
+                   help="délai GraphQL supplémentaire des posts vidéo (Reels), en ms")
+    p.add_argument("--cdn-429", type=float, default=0.0, help="probabilité de 429 sur le CDN")
+    p.add_argument("--drop-rate", type=float, default=0.0, help="probabilité de couper une réponse CDN")
+    p.add_argument("--missing-ratio", type=float, default=0.0, help="part de posts introuvables")
+    p.add_argument("--url-ttl", type=float, default=3 * 24 * 3600.0,
+                   help="validité des URLs CDN signées (s); un lot plus long que ça les renouvelle")
+    p.add_argument("--race", action="store_true", help="course des stratégies de résolution légères")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--per-host", type=int, default=4)
+    p.add_argument("--limits", choices=("off", "prod"), default="off", help="limiteurs de débit d'igdl")
+    p.add_argument("--json", metavar="FICHIER", help="écrire le rapport JSON")
+    p.add_argument("--compare", metavar="FICHIER", help="rapport JSON de référence (autre commit)")
+    args = p.parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        p.error(f"scénario inconnu: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="igdl_bench_")
+    # caches et lots isolés, avant tout import d'igdl (les chemins sont lus à l'import)
+    os.environ["IGDL_BUNDLE_CACHE"] = os.path.join(workdir, "bundles.sqlite")
+    os.environ["IGDL_MEDIA_CACHE_DIR"] = os.path.join(workdir, "media_default")
+    os.environ["IGDL_JOBS_DIR"] = os.path.join(workdir, "jobs_default")
+    os.environ["IGDL_STRATEGY_STATS"] = os.path.join(workdir, "strategies.sqlite")  # ordre appris à froid
+    os.environ.pop("IG_SESSIONID", None)
+    if args.limits == "off":
+        _lift_limits()
+
+    config = FakeConfig(
+        photo_bytes=args.photo_kb * 1024, video_bytes=int(args.video_mb * 1024 * 1024),
+        video_ratio=args.video_ratio, carousel_ratio=args.carousel_ratio, carousel_size=args.carousel_size,
+        meta_latency_s=args.meta_latency_ms / 1000, cdn_latency_s=args.cdn_latency_ms / 1000,
+        cdn_bandwidth_bps=args.cdn_mbps * 1e6, meta_429_rate=args.meta_429, cdn_429_rate=args.cdn_429,
+        video_graphql_latency_s=args.video_graphql_ms / 1000,
+        drop_rate=args.drop_rate, missing_ratio=args.missing_ratio, url_ttl_s=args.url_ttl,
+    )
+    report = {"revision": _git_revision(), "posts": args.posts, "config": vars(args), "results": {}}
+    try:
+        with FakeInstagram(config) as fake:
+            for name in scenarios:
+                if name == "resolve":
+                    fn = scenario_resolve(args.posts, workdir, fake, args)
+                elif name == "zip":
+                    fn = scenario_zip(args.posts, fake, args)
+                else:
+                    fn = scenario_batch(args.posts, workdir, fake, args)
+                print(f"… {name}", file=sys.stderr, flush=True)
+                report["results"][name] = _run_scenario(name, fn, fake)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(_format(report))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(_compare(report, json.load(f)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,372 @@
+# bench/fake_instagram.py
+# Faux Instagram + CDN en local, pour mesurer le débit sans toucher au vrai site.
+#
+# - POST /graphql/query (doc_id): réponse "xdt_api__v1__media__shortcode__web_info" lue par Post.from_shortcode;
+# - GET  /                       : pose le cookie csrftoken attendu par Instaloader;
+# - GET  /reel/<shortcode>/      : page avec og:video / og:image (stratégie scrape_og_from_reel);
+# - GET  /p/<sc>/embed/captioned/: page embed (EmbeddedMediaImage, video_url, légende; stratégie scrape_embed);
+# - GET  *.cdninstagram.com/...  : charges utiles synthétiques (JPEG / MP4), en-tête Range pris en charge.
+# Latence, 429 (avec Retry-After) et coupures de connexion sont injectables, séparément pour
+# les métadonnées et le CDN. redirect_to(fake) détourne www.instagram.com / *.cdninstagram.com
+# vers ce serveur au niveau de requests, sans toucher au code mesuré.
+
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse, urlunparse
+
+from requests.adapters import HTTPAdapter
+
+_BLOCK = random.Random(0).randbytes(1024 * 1024)  # octets servis en boucle (pas de génération par requête)
+_JPEG_HEAD = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+_MP4_HEAD = b"\x00\x00\x00\x18ftypmp42"
+
+
+@dataclass
+class FakeConfig:
+    photo_bytes: int = 300 * 1024
+    video_bytes: int = 8 * 1024 * 1024
+    video_ratio: float = 0.3        # part des posts "vidéo"
+    carousel_ratio: float = 0.3     # part des posts "carrousel" (parmi les non-vidéos)
+    carousel_size: int = 4
+    meta_latency_s: float = 0.05    # délai avant réponse (GraphQL, page reel)
+    cdn_latency_s: float = 0.02     # délai avant le premier octet (CDN)
+    cdn_bandwidth_bps: float = 0.0  # 0 = illimité, sinon débit par connexion (octets/s)
+    meta_429_rate: float = 0.0      # probabilité d'un 429 sur les métadonnées
+    video_graphql_latency_s: float = 0.0  # en plus: délai GraphQL des posts vidéo (Reels plus lents)
+    cdn_429_rate: float = 0.0       # probabilité d'un 429 sur le CDN
+    retry_after_s: float = 1.0
+    drop_rate: float = 0.0          # probabilité de couper une réponse CDN à mi-chemin
+    missing_ratio: float = 0.0      # part des posts "introuvables" (aucun item)
+    url_ttl_s: float = 3 * 24 * 3600  # validité des URLs signées (paramètre 'oe'); au-delà: 403
+    seed: int = 0
+
+
+@dataclass
+class FakeStats:
+    requests: Dict[str, int] = field(default_factory=dict)
+    throttled: int = 0
+    dropped: int = 0
+    bytes_sent: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            if name in ("throttled", "dropped", "bytes_sent"):
+                setattr(self, name, getattr(self, name) + n)
+            else:
+                self.requests[name] = self.requests.get(name, 0) + n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": dict(self.requests), "throttled": self.throttled,
+                    "dropped": self.dropped, "bytes_sent": self.bytes_sent}
+
+
+def _rand(shortcode: str, salt: str) -> float:
+    """Tirage déterministe dans [0, 1) par shortcode: le même post a toujours la même forme."""
+    return int(hashlib.sha256(f"{salt}:{shortcode}".encode()).hexdigest()[:8], 16) / 0x100000000
+
+
+def _cdn_host(shortcode: str) -> str:
+    return f"scontent-bench{int(_rand(shortcode, 'host') * 4)}.cdninstagram.com"
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # coupures volontaires / clients qui abandonnent: pas de traceback sur stderr
+
+
+class FakeInstagram:
+    """Serveur HTTP local (thread) qui imite les endpoints utilisés par igdl."""
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig()
+        self.stats = FakeStats()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._server = _QuietServer(("127.0.0.1", 0), _make_handler(self))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeInstagram":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-instagram", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeInstagram":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def chance(self, p: float) -> bool:
+        if p <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < p
+
+    # ---- contenu synthétique ----
+    def post_kind(self, shortcode: str) -> str:
+        cfg = self.config
+        if _rand(shortcode, "missing") < cfg.missing_ratio:
+            return "missing"
+        r = _rand(shortcode, "kind")
+        if r < cfg.video_ratio:
+            return "video"
+        if r < cfg.video_ratio + (1 - cfg.video_ratio) * cfg.carousel_ratio:
+            return "carousel"
+        return "photo"
+
+    def media_url(self, shortcode: str, idx: int, kind: str) -> str:
+        ext = "mp4" if kind == "video" else "jpg"
+        oe = format(int(time.time() + self.config.url_ttl_s), "X")
+        return (f"https://{_cdn_host(shortcode)}/v/t51.2885-15/{shortcode}_{idx}.{ext}"
+                f"?_nc_ht=bench&_nc_cat=1&oh=00_bench&oe={oe}")
+
+    def media_item(self, shortcode: str) -> Optional[dict]:
+        """Item au format de l'API web (xdt_api__v1__media__shortcode__web_info.items[0])."""
+        kind = self.post_kind(shortcode)
+        if kind == "missing":
+            return None
+
+        def _versions(idx: int, is_video: bool) -> dict:
+            d = {"image_versions2": {"candidates": [
+                {"url": self.media_url(shortcode, idx, "photo"), "width": 1080, "height": 1350},
+                {"url": self.media_url(shortcode, idx, "photo") + "&stp=dst-jpg_s640x640", "width": 640, "height": 800},
+            ]}}
+            if is_video:
+                d["video_versions"] = [
+                    {"url": self.media_url(shortcode, idx, "video"), "width": 1080, "height": 1920},
+                    {"url": self.media_url(shortcode, idx, "video") + "&efg=vencode_720", "width": 720, "height": 1280},
+                ]
+            return d
+
+        item = {
+            "code": shortcode, "pk": str(int(_rand(shortcode, "pk") * 1e15)),
+            "taken_at": 1_700_000_000 + int(_rand(shortcode, "date") * 3e7),
+            "user": {"pk": "42", "username": "bench_user", "full_name": "Bench"},
+            "caption": {"text": f"Post de test {shortcode} #bench"},
+            "like_count": 1, "comment_count": 0, "view_count": 10,
+            "media_type": {"photo": 1, "video": 2, "carousel": 8}[kind],
+        }
+        item.update(_versions(1, kind == "video"))
+        if kind == "carousel":
+            children = []
+            for i in range(1, self.config.carousel_size + 1):
+                is_video = i == self.config.carousel_size and self.config.video_ratio > 0
+                child = {"code": f"{shortcode}{i}", "media_type": 2 if is_video else 1}
+                child.update(_versions(i, is_video))
+                children.append(child)
+            item["carousel_media"] = children
+        return item
+
+    def payload_size(self, path: str) -> int:
+        return self.config.video_bytes if path.endswith(".mp4") else self.config.photo_bytes
+
+
+def _make_handler(fake: FakeInstagram):
+    cfg = fake.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, ctype: str, headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _throttle(self) -> None:
+            fake.stats.count("throttled")
+            self._send(429, b'{"message":"Please wait a few minutes before you try again.","status":"fail"}',
+                       "application/json", {"Retry-After": str(cfg.retry_after_s)})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            form = parse_qs(self.rfile.read(length).decode())
+            path = urlparse(self.path).path
+            fake.stats.count("graphql")
+            time.sleep(cfg.meta_latency_s)
+            if path != "/graphql/query" or "doc_id" not in form:
+                return self._send(404, b"{}", "application/json")
+            if fake.chance(cfg.meta_429_rate):
+                return self._throttle()
+            variables = json.loads(form.get("variables", ["{}"])[0])
+            shortcode = variables.get("shortcode", "")
+            if cfg.video_graphql_latency_s and fake.post_kind(shortcode) == "video":
+                time.sleep(cfg.video_graphql_latency_s)
+            item = fake.media_item(shortcode)
+            body = {"data": {"xdt_api__v1__media__shortcode__web_info": {"items": [item] if item else []}},
+                    "extensions": {"is_final": True}, "status": "ok"}
+            self._send(200, json.dumps(body).encode(), "application/json; charset=utf-8")
+
+        def do_GET(self):
+            u = urlparse(self.path)
+            host = (self.headers.get("X-Bench-Host") or "").lower()
+            if host.endswith("cdninstagram.com"):
+                return self._cdn(u.path, u.query)
+            time.sleep(cfg.meta_latency_s)
+            if u.path == "/":
+                fake.stats.count("home")
+                return self._send(200, b"<html></html>", "text/html",
+                                  {"Set-Cookie": "csrftoken=benchcsrf; Domain=.instagram.com; Path=/"})
+            m = re.fullmatch(r"/p/([A-Za-z0-9_\-]+)/embed/captioned/", u.path)
+            if m:
+                fake.stats.count("embed_page")
+                if fake.chance(cfg.meta_429_rate):
+                    return self._throttle()
+                item = fake.media_item(m.group(1))
+                if item is None:
+                    return self._send(404, b"<html></html>", "text/html")
+                return self._send(200, _embed_html(item).encode(), "text/html; charset=utf-8")
+            m = re.fullmatch(r"/(?:reel|p)/([A-Za-z0-9_\-]+)/", u.path)
+            if m:
+                fake.stats.count("reel_page")
+                if fake.chance(cfg.meta_429_rate):
+                    return self._throttle()
+                item = fake.media_item(m.group(1))
+                if item is None:
+                    return self._send(404, b"<html></html>", "text/html")
+                video = item.get("video_versions")
+                tag = (f'<meta property="og:video" content="{video[0]["url"]}" />' if video else
+                       f'<meta property="og:image" content="{item["image_versions2"]["candidates"][0]["url"]}" />')
+                return self._send(200, f"<html><head>{tag}</head></html>".replace("&", "&amp;").encode(),
+                                  "text/html; charset=utf-8")
+            self._send(404, b"", "text/plain")
+
+        def _cdn(self, path: str, query: str = "") -> None:
+            fake.stats.count("cdn")
+            time.sleep(cfg.cdn_latency_s)
+            oe = parse_qs(query).get("oe")
+            if oe and int(oe[0], 16) < time.time():
+                fake.stats.count("expired")
+                return self._send(403, b"URL signature expired", "text/plain")
+            if fake.chance(cfg.cdn_429_rate):
+                return self._throttle()
+            size = fake.payload_size(path)
+            head = _MP4_HEAD if path.endswith(".mp4") else _JPEG_HEAD
+            start = 0
+            m = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range") or "")
+            if m and int(m.group(1)) < size:
+                start = int(m.group(1))
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "video/mp4" if path.endswith(".mp4") else "image/jpeg")
+            self.send_header("Content-Length", str(size - start))
+            self.end_headers()
+            cut = size - (size - start) // 2 if fake.chance(cfg.drop_rate) else None
+            pos = start
+            chunk = 64 * 1024
+            t0 = time.monotonic()
+            while pos < size:
+                if cut is not None and pos >= cut:
+                    fake.stats.count("dropped")
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                n = min(chunk, size - pos)
+                data = _payload_slice(head, pos, n)
+                self.wfile.write(data)
+                fake.stats.count("bytes_sent", n)
+                pos += n
+                if cfg.cdn_bandwidth_bps:
+                    ahead = (pos - start) / cfg.cdn_bandwidth_bps - (time.monotonic() - t0)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+    return Handler
+
+
+def _embed_html(item: dict) -> str:
+    """Page embed façon Instagram: image principale (srcset), vidéo dans le JSON du script, légende."""
+    esc = lambda u: u.replace("&", "&amp;")  # noqa: E731
+    cands = item["image_versions2"]["candidates"]
+    srcset = ",".join(f"{esc(c['url'])} {c['width']}w" for c in reversed(cands))
+    parts = [f'<a class="UsernameText" href="#">{item["user"]["username"]}</a>',
+             f'<img class="EmbeddedMediaImage" src="{esc(cands[-1]["url"])}" srcset="{srcset}" />',
+             f'<div class="Caption"><a class="CaptionUsername" href="#">{item["user"]["username"]}</a>'
+             f'{item["caption"]["text"]}<div class="CaptionComments"></div></div>']
+    data = {"shortcode_media": {"__typename": {1: "GraphImage", 2: "GraphVideo", 8: "GraphSidecar"}[item["media_type"]]}}
+    if item.get("video_versions"):
+        data["shortcode_media"]["video_url"] = item["video_versions"][0]["url"]
+    # JSON dans une chaîne JS (échappé deux fois, comme sur la vraie page)
+    parts.append(f'<script>window.__additionalDataLoaded("extra",{json.dumps(json.dumps(data))});</script>')
+    return "<html><body>" + "".join(parts) + "</body></html>"
+
+
+def _payload_slice(head: bytes, pos: int, n: int) -> bytes:
+    """Octets [pos, pos+n) d'un média synthétique: signature magique puis _BLOCK en boucle."""
+    out: List[bytes] = []
+    while n > 0:
+        if pos < len(head):
+            piece = head[pos:pos + n]
+        else:
+            off = (pos - len(head)) % len(_BLOCK)
+            piece = _BLOCK[off:off + n]
+        out.append(piece)
+        pos += len(piece)
+        n -= len(piece)
+    return b"".join(out)
+
+
+@contextmanager
+def redirect_to(fake: FakeInstagram,
+                on_response: Optional[Callable[[str, float], None]] = None) -> Iterator[None]:
+    """
+    Détourne (pour tout le processus) les requêtes vers instagram.com / cdninstagram.com
+    sur le faux serveur. L'URL d'origine est restaurée sur la réponse: les hooks (limiteurs)
+    voient les mêmes URLs qu'en production.
+    `on_response("meta"|"cdn", secondes)` reçoit la latence de chaque requête (jusqu'aux en-têtes
+    pour les téléchargements en streaming).
+    """
+    original_send = HTTPAdapter.send
+    local = urlparse(fake.base_url)
+
+    def send(self, request, *args, **kwargs):
+        orig_url = request.url
+        u = urlparse(orig_url)
+        host = (u.hostname or "").lower()
+        if host == "instagram.com" or host.endswith(".instagram.com") or host.endswith(".cdninstagram.com"):
+            request.url = urlunparse(u._replace(scheme=local.scheme, netloc=local.netloc))
+            request.headers["X-Bench-Host"] = host
+            t0 = time.perf_counter()
+            try:
+                r = original_send(self, request, *args, **kwargs)
+            finally:
+                request.url = orig_url
+            if on_response is not None:
+                on_response("cdn" if host.endswith(".cdninstagram.com") else "meta", time.perf_counter() - t0)
+            r.url = orig_url
+            return r
+        return original_send(self, request, *args, **kwargs)
+
+    HTTPAdapter.send = send
+    try:
+        yield
+    finally:
+        HTTPAdapter.send = original_send
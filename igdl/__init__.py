@@ -0,0 +1,96 @@
+# igdl/__init__.py
+# --- Cœur réutilisable de l'Instagram Media Downloader (sans Streamlit) ---
+# - Utilisé par l'UI Streamlit (app.py) et par la CLI (python -m igdl).
+# - Les sous-modules sont importés à la demande: `import igdl` ne charge ni requests ni Instaloader.
+#
+# Exemple:
+#   from igdl import extract_shortcode, fetch_post_bundle, download_all_as_zip
+
+import importlib
+
+# nom public -> sous-module qui le définit
+_EXPORTS = {
+    # auth
+    "extract_sessionid_from_cookie_string": "igdl.auth",
+    "get_current_sessionid": "igdl.auth",
+    "set_sessionid_provider": "igdl.auth",
+    "cache_scope": "igdl.auth",
+    "set_sessionids_provider": "igdl.auth",
+    "get_sessionids": "igdl.auth",
+    # pool de comptes
+    "AccountPool": "igdl.accounts",
+    "get_account_pool": "igdl.accounts",
+    # erreurs
+    "CircuitOpenError": "igdl.errors",
+    "PostUnavailable": "igdl.errors",
+    "JobCancelled": "igdl.errors",
+    # URLs / noms de fichiers
+    "extract_shortcode": "igdl.urls",
+    "extract_username": "igdl.urls",
+    "sanitize_filename": "igdl.urls",
+    "parse_urls": "igdl.urls",
+    "post_url": "igdl.urls",
+    "post_kind": "igdl.urls",
+    # ingestion en masse (TXT / CSV / JSONL)
+    "UrlIngest": "igdl.ingest",
+    # résolution
+    "fetch_post_bundle": "igdl.resolve",
+    "get_resolver_chain": "igdl.resolve",
+    "ResolverChain": "igdl.strategies",
+    "Strategy": "igdl.strategies",
+    "StrategyStats": "igdl.strategies",
+    # caches
+    "BundleCache": "igdl.cache",
+    "MediaCache": "igdl.cache",
+    "get_bundle_cache": "igdl.cache",
+    "get_media_cache": "igdl.cache",
+    # téléchargement / archives
+    "BatchWriter": "igdl.download",
+    "ZipBatchWriter": "igdl.download",
+    "DirectoryBatchWriter": "igdl.download",
+    "PostZipBatchWriter": "igdl.download",
+    "VolumeZipBatchWriter": "igdl.download",
+    "write_all_to_zip": "igdl.download",
+    "download_all_as_zip": "igdl.download",
+    "download_all_to_file": "igdl.download",
+    # pipeline / reprise
+    "BatchCheckpoint": "igdl.checkpoint",
+    "run_batch_pipeline": "igdl.pipeline",
+    # file de lots (processus workers)
+    "JobQueue": "igdl.jobs",
+    "JobRunner": "igdl.jobs",
+    "get_job_runner": "igdl.jobs",
+    # choix des renditions (taille des médias)
+    "RenditionPolicy": "igdl.renditions",
+    "RenditionSelector": "igdl.renditions",
+    # réencodage des photos (pool de processus)
+    "TranscodePolicy": "igdl.transcode",
+    "Transcoder": "igdl.transcode",
+    # aperçus légers
+    "preview_source": "igdl.preview",
+    "make_thumbnail": "igdl.preview",
+    # synchro incrémentale de profils
+    "ArchiveIndex": "igdl.profile",
+    "ProfileSync": "igdl.profile",
+    "list_new_posts": "igdl.profile",
+    # coalescence des requêtes identiques simultanées
+    "SingleFlight": "igdl.singleflight",
+    # mesures
+    "BatchMetrics": "igdl.metrics",
+    "start_metrics_server": "igdl.metrics",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'igdl' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value  # les accès suivants ne repassent plus par __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,9 @@
+# igdl/__main__.py
+# python -m igdl ...
+
+import sys
+
+from igdl.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
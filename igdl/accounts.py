@@ -0,0 +1,214 @@
+# igdl/accounts.py
+# Pool de comptes Instagram: plusieurs sessionid (IG_SESSIONIDS, secrets, --sessionid répété),
+# chacun avec ses clients, ses limiteurs (scope = hash du sessionid) et son état de santé.
+#
+# - Chaque résolution de post est confiée au compte sain le plus vite disponible
+#   (limiteur "meta" prêt le plus tôt, puis le moins de requêtes en cours).
+# - Un compte qui rencontre un checkpoint / challenge, une déconnexion ou un 401 est mis en
+#   quarantaine (ACCOUNT_QUARANTINE_S) et le post est retenté avec un autre compte.
+# - Débit total ≈ somme des débits des comptes, si les résolutions sont parallèles
+#   (run_batch_pipeline(resolve_workers=...), par défaut un worker par compte).
+# Un seul compte (ou mode invité): aucun changement, les requêtes gardent le scope courant.
+#
+# Cache des bundles: commun au pool (auth.cache_scope() hors requête), isolé des autres
+# utilisateurs / pools. Les comptes d'un pool sont supposés équivalents (mêmes posts visibles).
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from igdl import metrics
+from igdl.auth import bound_sessionid, get_sessionids, scope_for_sessionid
+from igdl.errors import CircuitOpenError
+from igdl.ratelimit import BLOCKING_MARKERS, get_rate_limiters
+
+ACCOUNT_QUARANTINE_S = 1800.0   # mise à l'écart d'un compte bloqué / déconnecté
+ACCOUNT_AUTH_MARKERS = ("401 Unauthorized", "HTTP error code 401", "login_required", "Redirected to login page")
+_THROTTLE_MARKERS = ("Please wait a few minutes", "Too many requests", "429")
+
+T = TypeVar("T")
+
+
+def is_account_error(e: Exception) -> bool:
+    """
+    Compte inutilisable (checkpoint, challenge, déconnexion, 401 hors limitation): quarantaine.
+    Instagram répond aussi 401 + "Please wait a few minutes" pour limiter: ce n'est pas un compte mort.
+    """
+    msg = str(e)
+    if any(m in msg for m in BLOCKING_MARKERS):
+        return True
+    return any(m in msg for m in ACCOUNT_AUTH_MARKERS) and not any(m in msg for m in _THROTTLE_MARKERS)
+
+
+class Account:
+    """État d'un compte (partagé par tous les lots du processus)."""
+    def __init__(self, sid: str, label: str):
+        self.sid = sid
+        self.scope = scope_for_sessionid(sid)
+        self.label = label
+        self.in_flight = 0
+        self.ok = 0
+        self.failures = 0
+        self.quarantined_until = 0.0
+        self.reason = ""
+        self.last_used = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.quarantined_until
+
+    def state(self) -> dict:
+        now = time.time()
+        meta = get_rate_limiters().get(self.scope, "meta").state()
+        return {"account": self.label, "scope": self.scope, "healthy": self.healthy(now) and not meta["open"],
+                "quarantined_for_s": round(max(0.0, self.quarantined_until - now)), "reason": self.reason,
+                "rate": meta["rate"], "in_flight": self.in_flight, "ok": self.ok, "failures": self.failures}
+
+    def export(self) -> dict:
+        """Santé du compte transmissible à un autre processus (quarantaine en heure murale)."""
+        return {"quarantined_until": self.quarantined_until, "reason": self.reason, "ok": self.ok,
+                "failures": self.failures}
+
+    def restore(self, state: dict) -> None:
+        self.quarantined_until = max(self.quarantined_until, float(state["quarantined_until"]))
+        self.reason = self.reason or str(state["reason"])
+        self.ok, self.failures = int(state["ok"]), int(state["failures"])
+
+
+class AccountPool:
+    """Répartit les requêtes entre comptes sains; met en quarantaine les comptes bloqués."""
+    def __init__(self, accounts: List[Account], quarantine_s: float = ACCOUNT_QUARANTINE_S):
+        self.accounts = accounts
+        self.quarantine_s = float(quarantine_s)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def _pick(self, exclude: Collection[str] = ()) -> Account:
+        now = time.time()
+        limiters = get_rate_limiters()
+        with self._lock:
+            candidates: List[Tuple[float, int, float, Account]] = []
+            for a in self.accounts:
+                if not a.healthy(now) or a.scope in exclude:
+                    continue
+                ready = limiters.get(a.scope, "meta").ready_in()
+                if ready != float("inf"):
+                    candidates.append((ready, a.in_flight, a.last_used, a))
+            if not candidates:
+                raise CircuitOpenError(self._all_down_message())
+            account = min(candidates, key=lambda c: c[:3])[3]
+            account.in_flight += 1
+            account.last_used = now
+            return account
+
+    def _all_down_message(self) -> str:
+        reasons = "; ".join(f"{a.label}: {a.reason or 'limite atteinte'}" for a in self.accounts)
+        return f"Tous les comptes sont bloqués ou en quarantaine ({reasons})."
+
+    def quarantine(self, account: Account, reason: str) -> None:
+        with self._lock:
+            account.quarantined_until = time.time() + self.quarantine_s
+            account.reason = reason[:200]
+        metrics.incr("accounts.quarantined")
+
+    @contextmanager
+    def use(self, exclude: Collection[str] = ()) -> Iterator[Account]:
+        """Emprunte un compte (hors scopes `exclude`): lié au contexte (auth.bound_sessionid) pendant le bloc."""
+        account = self._pick(exclude)
+        try:
+            with bound_sessionid(account.sid):
+                yield account
+        finally:
+            self._release(account)
+
+    def _release(self, account: Account) -> None:
+        with self._lock:
+            account.in_flight -= 1
+
+    def call(self, fn: Callable[[], T], failover: Optional[Callable[[Exception], bool]] = None) -> T:
+        """
+        Appelle `fn()` avec un compte sain lié au contexte, au plus une fois par compte:
+        - erreur propre au compte (is_account_error): quarantaine, puis un autre compte;
+        - disjoncteur du compte ouvert, ou `failover(e)` vrai (limitation persistante...):
+          un autre compte, sans quarantaine (son limiteur l'écarte déjà);
+        - autres erreurs: remontées telles quelles.
+        Quand plus aucun compte n'est essayable, la dernière erreur remonte.
+        """
+        tried = set()
+        last_exc: Optional[Exception] = None
+        while True:
+            try:
+                account = self._pick(exclude=tried)
+            except CircuitOpenError:
+                if last_exc is not None:
+                    raise last_exc
+                raise
+            tried.add(account.scope)
+            try:
+                with bound_sessionid(account.sid):
+                    result = fn()
+            except Exception as e:
+                account.failures += 1
+                if is_account_error(e):
+                    self.quarantine(account, str(e))
+                elif not (isinstance(e, CircuitOpenError) or (failover is not None and failover(e))):
+                    raise
+                last_exc = e
+                metrics.incr("accounts.failover")
+                continue
+            finally:
+                self._release(account)
+            account.ok += 1
+            metrics.incr("accounts.requests")
+            return result
+
+    def reset(self, scopes: Optional[Collection[str]] = None) -> None:
+        """Sort les comptes (tous, ou ceux des `scopes`) de quarantaine et réarme leurs limiteurs."""
+        with self._lock:
+            for a in self.accounts:
+                if scopes is not None and a.scope not in scopes:
+                    continue
+                a.quarantined_until = 0.0
+                a.reason = ""
+                get_rate_limiters().reset(a.scope)
+
+    def state(self) -> List[dict]:
+        return [a.state() for a in self.accounts]
+
+
+# =========================
+# Pool du processus
+# =========================
+_accounts: Dict[str, Account] = {}   # état par compte, conservé quand la liste des comptes change
+_pool: Optional[AccountPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_account_pool() -> Optional[AccountPool]:
+    """Pool des comptes configurés (auth.get_sessionids()); None s'il y en a moins de deux."""
+    global _pool
+    sids = get_sessionids()
+    if len(sids) < 2:
+        return None
+    with _pool_lock:
+        if _pool is None or [a.sid for a in _pool.accounts] != sids:
+            accounts = []
+            for i, sid in enumerate(sids, start=1):
+                a = _accounts.get(sid)
+                if a is None:
+                    a = _accounts[sid] = Account(sid, f"compte {i}")
+                a.label = f"compte {i}"
+                accounts.append(a)
+            _pool = AccountPool(accounts)
+        return _pool
+
+
+def with_account(fn: Callable[[], T], use_auth: bool = True,
+                 failover: Optional[Callable[[Exception], bool]] = None) -> T:
+    """`fn()` via le pool de comptes s'il y en a un (et use_auth), sinon tel quel (scope courant)."""
+    pool = get_account_pool() if use_auth else None
+    if pool is None:
+        return fn()
+    return pool.call(fn, failover)
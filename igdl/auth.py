@@ -0,0 +1,113 @@
+# igdl/auth.py
+# Source du cookie sessionid et scope d'auth (isolation des caches / clients par utilisateur).
+#
+# Le cœur ne connaît pas Streamlit: l'UI enregistre son propre fournisseur
+# (saisie utilisateur > st.secrets > env), la CLI passe --sessionid ou IG_SESSIONID.
+#
+# Plusieurs comptes (IG_SESSIONIDS, secrets, --sessionid répété): voir igdl.accounts. Pendant une
+# requête, le compte choisi est lié au contexte (bound_sessionid): get_current_sessionid() et
+# cache_scope() renvoient alors ce compte (clients et limiteurs propres à chaque compte).
+# Hors requête, cache_scope() d'un pool de plusieurs comptes est commun au pool (cache des bundles).
+
+import contextvars
+import hashlib
+import os
+import re
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+_sessionid_provider: Optional[Callable[[], Optional[str]]] = None
+_sessionids_provider: Optional[Callable[[], List[str]]] = None
+_bound_sessionid: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("igdl_sessionid", default=None)
+
+
+def extract_sessionid_from_cookie_string(cookie_str: str) -> Optional[str]:
+    """Permet de coller un 'cookie string' complet (copié du navigateur) et d'en extraire la valeur de sessionid."""
+    if not cookie_str:
+        return None
+    m = re.search(r"(?:^|;\s*)sessionid=([^;]+)", cookie_str)
+    return m.group(1).strip() if m else None
+
+
+def set_sessionid_provider(provider: Optional[Callable[[], Optional[str]]]) -> None:
+    """Remplace la source du sessionid (None = variable d'environnement IG_SESSIONID)."""
+    global _sessionid_provider
+    _sessionid_provider = provider
+
+
+def set_sessionids_provider(provider: Optional[Callable[[], List[str]]]) -> None:
+    """Remplace la source des comptes du pool (None = variable IG_SESSIONIDS, sinon le sessionid unique)."""
+    global _sessionids_provider
+    _sessionids_provider = provider
+
+
+def _provider_sessionid() -> Optional[str]:
+    if _sessionid_provider is not None:
+        return _sessionid_provider()
+    return os.getenv("IG_SESSIONID", None)
+
+
+def split_sessionids(text: str) -> List[str]:
+    """'sid1, sid2\nsid3' -> [sid1, sid2, sid3] (cookies complets acceptés)."""
+    sids = []
+    for part in re.split(r"[\s,]+", text or ""):
+        if "=" in part:  # fragment de cookie complet: seul sessionid=... compte
+            sid = extract_sessionid_from_cookie_string(part) if "sessionid=" in part else None
+        else:
+            sid = part
+        if sid:
+            sids.append(sid)
+    return sids
+
+
+def get_sessionids() -> List[str]:
+    """Comptes disponibles (sans doublons): fournisseur du pool, IG_SESSIONIDS, sinon le sessionid unique."""
+    if _sessionids_provider is not None:
+        sids = list(_sessionids_provider() or [])
+    else:
+        sids = split_sessionids(os.getenv("IG_SESSIONIDS", ""))
+    if not sids:
+        sid = _provider_sessionid()
+        sids = [sid] if sid else []
+    return list(dict.fromkeys(sids))
+
+
+def get_current_sessionid() -> Optional[str]:
+    """sessionid du compte lié à la requête en cours, sinon du fournisseur enregistré, sinon IG_SESSIONID."""
+    bound = _bound_sessionid.get()
+    if bound:
+        return bound
+    return _provider_sessionid()
+
+
+@contextmanager
+def bound_sessionid(sid: str) -> Iterator[None]:
+    """Lie un compte au contexte courant (thread / contextvars) le temps du bloc."""
+    token = _bound_sessionid.set(sid)
+    try:
+        yield
+    finally:
+        _bound_sessionid.reset(token)
+
+
+def scope_for_sessionid(sid: Optional[str]) -> str:
+    return hashlib.sha256(sid.encode()).hexdigest()[:10] if sid else "anon"
+
+
+def scope_for_pool(sids: List[str]) -> str:
+    """Scope commun à un pool de comptes (indépendant de leur ordre)."""
+    return "pool-" + hashlib.sha256("|".join(sorted(sids)).encode()).hexdigest()[:10]
+
+
+def cache_scope() -> str:
+    """
+    Scope d'auth courant: hash court du sessionid du compte lié (ou du compte unique), scope
+    commun du pool s'il y a plusieurs comptes, ou 'anon'.
+    """
+    bound = _bound_sessionid.get()
+    if bound:
+        return scope_for_sessionid(bound)
+    sids = get_sessionids()
+    if len(sids) > 1:
+        return scope_for_pool(sids)
+    return scope_for_sessionid(sids[0] if sids else None)
@@ -0,0 +1,249 @@
+# igdl/cache.py
+# Caches persistants:
+# - MediaCache: octets des médias CDN, adressés par SHA-256, éviction LRU bornée en taille;
+# - BundleCache: bundles résolus (SQLite WAL), TTL calé sur l'expiration des URLs signées + cache négatif.
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from igdl.errors import PostUnavailable
+
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "igdl")
+
+MEDIA_CACHE_DIR = os.getenv("IGDL_MEDIA_CACHE_DIR", os.path.join(CACHE_ROOT, "media"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("IGDL_MEDIA_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+BUNDLE_CACHE_PATH = os.getenv("IGDL_BUNDLE_CACHE", os.path.join(CACHE_ROOT, "bundles.sqlite"))
+BUNDLE_TTL_MAX_S = 6 * 3600       # plafond, même si les URLs signées expirent plus tard
+BUNDLE_TTL_MARGIN_S = 15 * 60     # marge avant l'expiration ('oe') des URLs CDN
+BUNDLE_NEG_TTL_S = 30 * 60        # posts privés / introuvables / sans média
+BUNDLE_LITE_TTL_S = 10 * 60       # bundles des stratégies légères ("lite": sans renditions, durée ni date)
+BUNDLE_CACHE_MAX_ROWS = 50_000    # au-delà, les entrées les plus anciennes sont purgées
+
+
+@contextmanager
+def _sqlite(path: str) -> Iterator[sqlite3.Connection]:
+    """Une connexion par opération (objets partagés entre threads): commit puis fermeture."""
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+# =========================
+# Cache disque des médias (adressé par contenu, éviction LRU)
+# =========================
+def asset_key(url: str) -> str:
+    """
+    Identité stable d'un média CDN: chemin + paramètres non signés.
+    On retire l'hôte (scontent-xxx varie) et les paramètres de signature / routage
+    (oe = expiration, oh = signature, _nc_* = routage), qui changent à chaque résolution.
+    """
+    u = urlparse(url)
+    kept = sorted((k, v) for k, v in parse_qsl(u.query, keep_blank_values=True)
+                  if k not in ("oe", "oh") and not k.startswith("_nc_"))
+    return u.path + ("?" + urlencode(kept) if kept else "")
+
+
+class MediaCache:
+    """
+    Cache disque persistant: les octets sont stockés sous leur SHA-256 (blobs/ab/abcdef...),
+    un index SQLite relie la clé d'asset au blob. La taille totale est bornée (LRU sur l'accès).
+    """
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self._tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._db_path = os.path.join(root, "index.sqlite")
+        with _sqlite(self._db_path) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL,
+                ctype TEXT NOT NULL, atime REAL NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_sha ON entries(sha256)")
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self.root, "blobs", sha[:2], sha)
+
+    def get(self, url: str) -> Optional[Tuple[str, str, int]]:
+        """Retourne (chemin du blob, content-type, taille) si le média est en cache."""
+        key = asset_key(url)
+        with _sqlite(self._db_path) as db:
+            row = db.execute("SELECT sha256, ctype, size FROM entries WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            path = self._blob_path(row[0])
+            if not os.path.exists(path):
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE entries SET atime = ? WHERE key = ?", (time.time(), key))
+        return path, row[1], row[2]
+
+    def new_temp(self):
+        """Fichier temporaire sur le même disque que les blobs (pour un os.replace atomique)."""
+        return tempfile.NamedTemporaryFile(dir=self._tmp_dir, delete=False)
+
+    def put(self, url: str, tmp_path: str, sha: str, size: int, ctype: str) -> str:
+        """Range un fichier déjà haché (temporaire ou partiel d'un lot) dans le cache et retourne le chemin du blob."""
+        path = self._blob_path(sha)
+        if os.path.exists(path):
+            os.unlink(tmp_path)  # même contenu déjà présent (autre clé)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.move(tmp_path, path)  # rename atomique, copie si le fichier vient d'un autre disque
+        with _sqlite(self._db_path) as db:
+            db.execute("INSERT OR REPLACE INTO entries (key, sha256, size, ctype, atime) VALUES (?, ?, ?, ?, ?)",
+                       (asset_key(url), sha, size, ctype, time.time()))
+        return path
+
+    def evict(self) -> int:
+        """Supprime les blobs les moins récemment utilisés au-delà de max_bytes. Retourne les octets libérés."""
+        freed = 0
+        with _sqlite(self._db_path) as db:
+            rows = db.execute("SELECT sha256, MAX(size), MAX(atime) FROM entries "
+                              "GROUP BY sha256 ORDER BY MAX(atime) ASC").fetchall()
+            total = sum(r[1] for r in rows)
+            for sha, size, _ in rows:
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM entries WHERE sha256 = ?", (sha,))
+                try:
+                    os.unlink(self._blob_path(sha))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                freed += size
+        return freed
+
+
+# =========================
+# Cache persistant des bundles (SQLite, TTL + cache négatif)
+# =========================
+def url_expiry(url: str) -> Optional[float]:
+    """Expiration (epoch) d'une URL CDN signée: paramètre 'oe' en hexadécimal."""
+    for k, v in parse_qsl(urlparse(url).query):
+        if k == "oe":
+            try:
+                return float(int(v, 16))
+            except ValueError:
+                return None
+    return None
+
+
+def _bundle_ttl(bundle: dict) -> float:
+    """
+    TTL d'un bundle: jusqu'à la première URL qui expire (moins une marge), plafonné. Un bundle "lite"
+    (page embed, balises OG) n'est gardé que peu de temps: une résolution complète le remplace vite.
+    """
+    now = time.time()
+    cap = BUNDLE_LITE_TTL_S if bundle.get("lite") else BUNDLE_TTL_MAX_S
+    expiries = [e for e in (url_expiry(m["url"]) for m in bundle["media"]) if e]
+    if not expiries:
+        return cap
+    return max(0.0, min(cap, min(expiries) - BUNDLE_TTL_MARGIN_S - now))
+
+
+class BundleCache:
+    """
+    Cache SQLite (WAL) des bundles résolus, clé (scope, shortcode).
+    Survit aux redémarrages, ne consomme pas de RAM, et garde aussi les échecs
+    définitifs (cache négatif) avec un TTL plus court.
+    """
+    def __init__(self, path: str = BUNDLE_CACHE_PATH, max_rows: int = BUNDLE_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_rows = int(max_rows)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _sqlite(self.path) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS bundles (
+                scope TEXT NOT NULL, shortcode TEXT NOT NULL, negative INTEGER NOT NULL,
+                payload TEXT NOT NULL, created REAL NOT NULL, expires REAL NOT NULL,
+                PRIMARY KEY (scope, shortcode))""")
+            db.execute("CREATE INDEX IF NOT EXISTS bundles_expires ON bundles(expires)")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def get(self, scope: str, shortcode: str) -> Optional[dict]:
+        """Retourne le bundle en cache, lève PostUnavailable sur un résultat négatif, None si absent/expiré."""
+        with _sqlite(self.path) as db:
+            row = db.execute("SELECT negative, payload FROM bundles WHERE scope = ? AND shortcode = ? AND expires > ?",
+                             (scope, shortcode, time.time())).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        if row[0]:
+            self._count("negative_hits")
+            raise PostUnavailable(row[1])
+        self._count("hits")
+        return json.loads(row[1])
+
+    def _put(self, scope: str, shortcode: str, negative: bool, payload: str, ttl: float) -> None:
+        now = time.time()
+        with _sqlite(self.path) as db:
+            db.execute("INSERT OR REPLACE INTO bundles (scope, shortcode, negative, payload, created, expires) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", (scope, shortcode, int(negative), payload, now, now + ttl))
+
+    def put(self, scope: str, shortcode: str, bundle: dict) -> None:
+        ttl = _bundle_ttl(bundle)
+        if ttl > 0:
+            self._put(scope, shortcode, False, json.dumps(bundle, ensure_ascii=False), ttl)
+
+    def put_negative(self, scope: str, shortcode: str, message: str) -> None:
+        self._put(scope, shortcode, True, message, BUNDLE_NEG_TTL_S)
+
+    def invalidate(self, scope: str, shortcode: str) -> None:
+        with _sqlite(self.path) as db:
+            db.execute("DELETE FROM bundles WHERE scope = ? AND shortcode = ?", (scope, shortcode))
+
+    def clear(self) -> None:
+        with _sqlite(self.path) as db:
+            db.execute("DELETE FROM bundles")
+
+    def prune(self) -> None:
+        """Supprime les entrées expirées puis les plus anciennes au-delà de max_rows."""
+        with _sqlite(self.path) as db:
+            db.execute("DELETE FROM bundles WHERE expires <= ?", (time.time(),))
+            db.execute("DELETE FROM bundles WHERE rowid IN (SELECT rowid FROM bundles "
+                       "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_rows,))
+
+
+# Une seule instance de chaque par processus (partagées entre sessions, reruns et lots)
+_media_cache: Optional[MediaCache] = None
+_bundle_cache: Optional[BundleCache] = None
+_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaCache:
+    global _media_cache
+    with _lock:
+        if _media_cache is None:
+            _media_cache = MediaCache()
+        return _media_cache
+
+
+def get_bundle_cache() -> BundleCache:
+    """Les compteurs hit/miss sont partagés par tous les lots du processus."""
+    global _bundle_cache
+    with _lock:
+        if _bundle_cache is None:
+            _bundle_cache = BundleCache()
+        return _bundle_cache
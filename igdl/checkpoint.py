@@ -0,0 +1,250 @@
+# igdl/checkpoint.py
+# Lots reprenables: un dossier par lot (JOBS_DIR/<id>) avec un manifeste de reprise.
+#
+# manifest.jsonl (journal en ajout seul, une ligne JSON par événement):
+#   {"event": "job", "spec": {...}}                                  création du lot
+#   {"event": "resolved", "url": ..., "bundle": {...}}               post résolu
+#   {"event": "media", "key": ..., "size": ..., "sha256": ..., ...}  média complet
+#   {"event": "partial", "key": ..., "bytes": ...}                   téléchargement interrompu
+#   {"event": "finished", "complete": true|false}                    archive finalisée
+# Les médias complets sont gardés dans media/<clé> (ou dans le cache disque), les
+# téléchargements interrompus dans media/<clé>.part et repris avec un en-tête Range.
+# Une reprise réécrit l'archive depuis ces fichiers: même contenu qu'un passage complet.
+# L'UI lit le manifeste sans verrou ni écriture (read_manifest), même pendant qu'un worker le reprend.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from igdl import metrics
+from igdl.cache import CACHE_ROOT, MediaCache, url_expiry
+from igdl.errors import JobBusy
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou inter-processus
+    fcntl = None
+
+JOBS_DIR = os.getenv("IGDL_JOBS_DIR", os.path.join(CACHE_ROOT, "jobs"))
+JOB_TTL_S = 24 * 3600        # lots non touchés depuis plus longtemps: supprimés
+JOB_URL_MARGIN_S = 5 * 60    # un bundle dont une URL signée expire avant: re-résolu
+
+
+def job_id_for(spec: dict) -> str:
+    """Identité d'un lot: URLs + options qui changent le résultat (format, compression, scope...)."""
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _parse_manifest(path: str) -> Tuple[Optional[dict], Dict[str, dict], Dict[str, dict], bool, int]:
+    """(spec, bundles par URL, médias complets par clé, complet, octets valides) d'un manifeste."""
+    spec, bundles, media, complete, good = None, {}, {}, False, 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # dernière ligne tronquée (processus tué pendant l'écriture)
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                break
+            good += len(line)
+            kind = ev.get("event")
+            if kind == "job":
+                spec = ev["spec"]
+            elif kind == "resolved":
+                bundles[ev["url"]] = ev["bundle"]
+            elif kind == "media":
+                media[ev["key"]] = ev
+            elif kind == "finished":
+                complete = bool(ev.get("complete"))
+    return spec, bundles, media, complete, good
+
+
+def _completed(media_dir: str, rec: Optional[dict], url: str, cache: Optional[MediaCache]) -> Optional[dict]:
+    """Fichier d'un média complet (`rec`): dans le lot, sinon blob du cache de même SHA-256."""
+    if rec is None:
+        return None
+    path = os.path.join(media_dir, rec["key"])
+    if not (os.path.exists(path) and os.path.getsize(path) == rec["size"]):
+        hit = cache.get(url) if cache is not None else None
+        if not hit or os.path.basename(hit[0]) != rec["sha256"]:
+            return None
+        path = hit[0]
+    return {"path": path, "ctype": rec["ctype"], "size": rec["size"], "sha256": rec["sha256"]}
+
+
+class BatchCheckpoint:
+    """
+    État de reprise d'un lot. Thread-safe: les threads de téléchargement enregistrent
+    leurs médias pendant que le pipeline enregistre les posts résolus.
+    """
+    def __init__(self, job_dir: str, spec: Optional[dict] = None):
+        self.dir = job_dir
+        self.id = os.path.basename(job_dir)
+        self.media_dir = os.path.join(job_dir, "media")
+        self.manifest_path = os.path.join(job_dir, "manifest.jsonl")
+        self.archive_path = os.path.join(job_dir, "archive.zip")
+        os.makedirs(self.media_dir, exist_ok=True)
+        self._lock_file = open(os.path.join(job_dir, "lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise JobBusy("Ce lot est déjà en cours de traitement (autre onglet ou processus).")
+        self._lock = threading.Lock()
+        self.complete = False
+        self._bundles: Dict[str, dict] = {}
+        self._media: Dict[str, dict] = {}
+        stored = self._replay()
+        self._log = open(self.manifest_path, "a", encoding="utf-8")
+        self.spec = stored if stored is not None else (spec or {})
+        if stored is None:
+            self._append({"event": "job", "spec": self.spec, "created": time.time()})
+
+    @classmethod
+    def open(cls, spec: dict, root: str = JOBS_DIR) -> "BatchCheckpoint":
+        """Ouvre (ou crée) le lot correspondant à `spec`; purge au passage les lots expirés."""
+        prune_jobs(root)
+        return cls(os.path.join(root, job_id_for(spec)), spec)
+
+    # ---- manifeste ----
+    def _replay(self) -> Optional[dict]:
+        """Relit le manifeste (s'il existe) et retourne la spec enregistrée."""
+        if not os.path.exists(self.manifest_path):
+            return None
+        spec, self._bundles, self._media, self.complete, good = _parse_manifest(self.manifest_path)
+        if good < os.path.getsize(self.manifest_path):
+            with open(self.manifest_path, "r+b") as f:
+                f.truncate(good)
+        return spec
+
+    def _append(self, event: dict) -> None:
+        with self._lock:
+            self._log.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._log.flush()
+
+    # ---- posts résolus ----
+    def bundle(self, url: str) -> Optional[dict]:
+        """Bundle déjà résolu pour `url`, sauf si une de ses URLs signées est (presque) expirée."""
+        b = self._bundles.get(url)
+        if b is None:
+            return None
+        deadline = time.time() + JOB_URL_MARGIN_S
+        if any((url_expiry(m["url"]) or deadline) < deadline for m in b["media"]):
+            return None
+        return b
+
+    def bundles(self, urls: List[str]) -> List[dict]:
+        """Bundles enregistrés, dans l'ordre de `urls` (même si certains ont expiré)."""
+        return [self._bundles[u] for u in urls if u in self._bundles]
+
+    def record_bundle(self, url: str, bundle: dict) -> None:
+        if bundle["media"]:
+            self._bundles[url] = bundle
+            self._append({"event": "resolved", "url": url, "bundle": bundle})
+
+    def wrap_resolve(self, resolve: Callable[[str], dict]) -> Callable[[str], dict]:
+        """Enveloppe `resolve(url)`: les posts déjà résolus ne refont aucune requête."""
+        def _resolve(url: str) -> dict:
+            b = self.bundle(url)
+            if b is None:
+                b = resolve(url)
+                self.record_bundle(url, b)
+            else:
+                metrics.incr("checkpoint.bundle_hit")
+            return b
+        return _resolve
+
+    # ---- médias ----
+    def media_path(self, key: str) -> str:
+        """Chemin du média `key` ("{shortcode}_{index:02d}") dans le lot; le partiel est `<chemin>.part`."""
+        return os.path.join(self.media_dir, key)
+
+    def completed(self, key: str, url: str, cache: Optional[MediaCache] = None) -> Optional[dict]:
+        """
+        Média déjà téléchargé lors d'un passage précédent: {"path", "ctype", "size", "sha256"}.
+        Cherché dans le lot, puis dans le cache disque (blob adressé par le même SHA-256).
+        """
+        return _completed(self.media_dir, self._media.get(key), url, cache)
+
+    def record_media(self, key: str, size: int, sha256: str, ctype: str) -> None:
+        rec = {"event": "media", "key": key, "size": size, "sha256": sha256, "ctype": ctype}
+        self._media[key] = rec
+        self._append(rec)
+
+    def record_partial(self, key: str) -> None:
+        part = self.media_path(key) + ".part"
+        if os.path.exists(part) and os.path.getsize(part):
+            self._append({"event": "partial", "key": key, "bytes": os.path.getsize(part)})
+
+    # ---- cycle de vie ----
+    def finish(self, complete: bool) -> None:
+        """Lot terminé. S'il est complet, les médias du lot ne servent plus: on les supprime."""
+        self.complete = complete
+        self._append({"event": "finished", "complete": complete, "at": time.time()})
+        if complete:
+            shutil.rmtree(self.media_dir, ignore_errors=True)
+
+    def state(self) -> Dict[str, int]:
+        parts = [n for n in os.listdir(self.media_dir) if n.endswith(".part")] if os.path.isdir(self.media_dir) else []
+        return {"resolved": len(self._bundles), "media_done": len(self._media), "partial": len(parts)}
+
+    def close(self) -> None:
+        self._log.close()
+        self._lock_file.close()  # libère le verrou
+
+    def delete(self) -> None:
+        self.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self) -> "BatchCheckpoint":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class JobManifest:
+    """
+    Lecture seule du manifeste d'un lot, pour l'UI: ni verrou, ni dossier créé, ni ligne écrite.
+    Sûr pendant qu'un worker traite (ou reprend) le même lot; reflète l'état au moment de la lecture.
+    """
+    def __init__(self, job_dir: str):
+        self.dir = job_dir
+        self.media_dir = os.path.join(job_dir, "media")
+        self.spec, self._bundles, self._media, self.complete, _ = _parse_manifest(
+            os.path.join(job_dir, "manifest.jsonl"))
+
+    def bundles(self) -> List[dict]:
+        """Bundles résolus, dans l'ordre des URLs du lot."""
+        return [self._bundles[u] for u in (self.spec or {}).get("urls", []) if u in self._bundles]
+
+    def completed(self, key: str, url: str, cache: Optional[MediaCache] = None) -> Optional[dict]:
+        """Comme BatchCheckpoint.completed: {"path", "ctype", "size", "sha256"} du média `key` s'il est complet."""
+        return _completed(self.media_dir, self._media.get(key), url, cache)
+
+
+def read_manifest(job_dir: str) -> Optional[JobManifest]:
+    """Manifeste du lot `job_dir` en lecture seule; None s'il n'existe pas (lot purgé)."""
+    try:
+        return JobManifest(job_dir)
+    except FileNotFoundError:
+        return None
+
+
+def prune_jobs(root: str = JOBS_DIR, ttl: float = JOB_TTL_S) -> None:
+    """Supprime les lots dont le manifeste n'a pas bougé depuis `ttl` secondes."""
+    if not os.path.isdir(root):
+        return
+    limit = time.time() - ttl
+    for name in os.listdir(root):
+        d = os.path.join(root, name)
+        try:
+            if os.path.getmtime(os.path.join(d, "manifest.jsonl")) < limit:
+                shutil.rmtree(d, ignore_errors=True)
+        except OSError:
+            pass
@@ -0,0 +1,315 @@
+# igdl/cli.py
+# CLI sans interface: python -m igdl [URLS...] [-i fichier|-] [-p profil] -o sortie.zip|dossier [--format ...] [--json]
+#
+# Les URLs viennent des arguments, de fichiers (-i, répétable, '-' = stdin) ou de stdin s'il est redirigé
+# (sauf avec -p: stdin n'est alors lu qu'avec -i -). Fichiers TXT, CSV ou JSONL lus en flux (igdl.ingest):
+# liens dédupliqués par shortcode, lignes invalides signalées sur stderr sans arrêter le lot.
+# -p/--profile synchronise un profil: seuls ses posts absents de l'index local (igdl.profile) sont
+# traités, puis l'index est mis à jour — une tâche quotidienne ne télécharge que les nouveautés.
+# La progression va sur stderr; --json écrit un résumé machine sur stdout.
+# Sorties (--format): un ZIP, un dossier (médias liés depuis le cache quand c'est possible), un ZIP
+# par post (livré dès que le post est complet) ou des volumes ZIP de --volume-size au plus.
+# --transcode réencode les photos (WebP / AVIF / JPEG) dans un pool de processus avant l'écriture.
+# --metrics écrit le rapport de performance du lot (JSON, ou texte Prometheus pour un textfile collector).
+# Un lot interrompu (Ctrl+C, coupure réseau, processus tué) reprend là où il s'était arrêté
+# si la même commande est relancée (voir igdl.checkpoint), sauf avec --no-resume.
+# Codes de sortie: 0 = tout est téléchargé, 1 = au moins une erreur (ou ligne invalide), 2 = usage / aucune URL.
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List, Optional
+
+from igdl.ingest import UrlIngest
+from igdl.renditions import RenditionPolicy, parse_size
+from igdl.transcode import TRANSCODE_FORMATS, TRANSCODE_QUALITY, TranscodePolicy, check_policy
+from igdl.urls import extract_username
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="igdl",
+        description="Télécharge les médias (photos / vidéos) de posts Instagram dans un ZIP ou un dossier.",
+    )
+    p.add_argument("urls", nargs="*", help="URLs de posts / reels (https://www.instagram.com/p/XXXX/)")
+    p.add_argument("-i", "--input", action="append", default=[], metavar="FICHIER",
+                   help="fichier de liens TXT, CSV ou JSONL (format d'après l'extension); '-' = stdin")
+    p.add_argument("-p", "--profile", action="append", default=[], metavar="UTILISATEUR",
+                   help="profil à synchroniser (répétable): seuls les posts pas encore archivés sont traités")
+    p.add_argument("--full", action="store_true",
+                   help="avec -p: parcourir tout le profil au lieu de s'arrêter au premier post déjà archivé")
+    p.add_argument("--limit", type=int, default=None, metavar="N", help="avec -p: au plus N nouveaux posts par profil")
+    p.add_argument("-o", "--output", help="archive .zip (base des volumes) ou dossier de sortie (défaut: igdl_<date>[.zip])")
+    p.add_argument("--format", choices=("zip", "dir", "posts", "volumes"),
+                   help="format de sortie: zip, dir (dossier), posts (un ZIP par post dans le dossier de sortie), "
+                        "volumes (ZIP découpés: sortie.001.zip, ...). Défaut: zip si la sortie finit par .zip, "
+                        "volumes avec --volume-size, sinon dossier")
+    p.add_argument("--volume-size", default=None, metavar="TAILLE",
+                   help="avec --format volumes: taille max d'un volume, ex. 500M ou 2G (défaut: 1G)")
+    p.add_argument("--link", action="store_true",
+                   help="avec --format dir: lier les médias (lien physique) depuis le cache au lieu de les copier; "
+                        "ne pas modifier ensuite les fichiers sur place (le cache serait modifié aussi)")
+    p.add_argument("--sessionid", action="append", default=[],
+                   help="cookie sessionid Instagram; répétable pour répartir les requêtes sur plusieurs comptes "
+                        "(défaut: IG_SESSIONIDS, sinon IG_SESSIONID)")
+    p.add_argument("--resolve-workers", type=int, default=None, metavar="N",
+                   help="posts résolus en parallèle (défaut: un par compte)")
+    p.add_argument("--workers", type=int, default=None, help="téléchargements simultanés (total)")
+    p.add_argument("--per-host", type=int, default=None, help="téléchargements simultanés par hôte CDN")
+    p.add_argument("--max-attempts", type=int, default=5, help="tentatives par post sur limitation Instagram")
+    p.add_argument("--compresslevel", type=int, default=None, choices=range(0, 10), metavar="0-9",
+                   help="niveau deflate des entrées compressées du ZIP")
+    p.add_argument("--deflate-png", action="store_true", help="compresser aussi les PNG dans le ZIP")
+    p.add_argument("--max-side", type=int, default=None, metavar="PX",
+                   help="rendition la plus grande dont le grand côté ne dépasse pas PX pixels (défaut: originaux)")
+    p.add_argument("--max-bitrate", type=int, default=None, metavar="KBPS",
+                   help="vidéos: rendition la plus grande sous KBPS kbit/s")
+    p.add_argument("--byte-budget", default=None, metavar="TAILLE",
+                   help="budget d'octets (estimé) pour tout le lot, ex. 500M ou 2G: renditions réduites au besoin")
+    p.add_argument("--transcode", choices=tuple(TRANSCODE_FORMATS), default=None,
+                   help="réencoder les photos dans ce format (Pillow requis; vidéos inchangées)")
+    p.add_argument("--quality", type=int, default=TRANSCODE_QUALITY, metavar="1-100",
+                   help=f"avec --transcode: qualité d'encodage (défaut: {TRANSCODE_QUALITY})")
+    p.add_argument("--transcode-max-side", type=int, default=None, metavar="PX",
+                   help="avec --transcode: réduire les photos à PX pixels de grand côté au plus")
+    p.add_argument("--race", action="store_true",
+                   help="résolution: lancer ensemble les stratégies légères (page embed, OG), la première gagne")
+    p.add_argument("--no-media-cache", action="store_true", help="ne pas utiliser le cache disque des médias")
+    p.add_argument("--no-resume", action="store_true",
+                   help="ne pas reprendre un lot interrompu (ni enregistrer de point de reprise)")
+    p.add_argument("--json", action="store_true", help="écrire un résumé JSON sur stdout")
+    p.add_argument("--metrics", metavar="FICHIER",
+                   help="rapport de performance du lot: JSON si FICHIER finit par .json, sinon texte Prometheus")
+    p.add_argument("-q", "--quiet", action="store_true", help="pas de progression sur stderr")
+    return p
+
+
+def _read_urls(args: argparse.Namespace) -> UrlIngest:
+    ingest = UrlIngest()
+    ingest.feed_text("\n".join(args.urls), source="arguments")
+    sources = list(args.input)
+    if not args.urls and not sources and not args.profile and not sys.stdin.isatty():
+        sources = ["-"]
+    for src in sources:
+        if src == "-":
+            ingest.feed(sys.stdin, source="stdin")
+        else:
+            with open(src, "rb") as f:
+                ingest.feed(f, source=src)  # lu en flux; format d'après l'extension ou la 1re ligne
+    return ingest
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    try:
+        ingest = _read_urls(args)
+        profiles = list(dict.fromkeys(extract_username(u) for u in args.profile))
+        policy = RenditionPolicy(args.max_side, args.max_bitrate and args.max_bitrate * 1000,
+                                 parse_size(args.byte_budget) if args.byte_budget else None)
+        transcode = check_policy(TranscodePolicy(args.transcode, args.quality, args.transcode_max_side))
+        volume_bytes = parse_size(args.volume_size) if args.volume_size else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    urls = ingest.urls  # même liste: les posts des profils s'y ajoutent, dédupliqués par shortcode
+    if not args.quiet:
+        for bad in ingest.invalid:
+            print(f"✗ {bad.source}:{bad.line}: {bad.error} ({bad.text})", file=sys.stderr)
+        if ingest.invalid_count > len(ingest.invalid):
+            print(f"… et {ingest.invalid_count - len(ingest.invalid)} autre(s) ligne(s) invalide(s).", file=sys.stderr)
+        if ingest.duplicates or ingest.invalid_count:
+            print(f"{len(urls)} post(s) distinct(s) sur {ingest.links} lien(s): {ingest.duplicates} doublon(s) ignoré(s), "
+                  f"{ingest.invalid_count} invalide(s).", file=sys.stderr)
+    if not urls and not profiles:
+        parser.error("aucune URL valide ni profil fourni (arguments, -i fichier, stdin ou -p).")
+
+    fmt = args.format or ("volumes" if volume_bytes else None)
+    output = args.output or time.strftime("igdl_%Y%m%d-%H%M%S" + ("" if fmt in ("dir", "posts") else ".zip"))
+    fmt = fmt or ("zip" if output.lower().endswith(".zip") else "dir")
+    if volume_bytes and fmt != "volumes":
+        parser.error("--volume-size ne s'utilise qu'avec --format volumes.")
+
+    # Imports lourds (requests, Instaloader...) seulement une fois les arguments validés
+    from igdl import auth, metrics
+    from igdl.accounts import get_account_pool
+    from igdl.cache import get_bundle_cache, get_media_cache
+    from igdl.checkpoint import BatchCheckpoint
+    from igdl.download import (DL_MAX_PER_HOST, DL_MAX_WORKERS, ZIP_COMPRESSLEVEL, ZIP_VOLUME_BYTES,
+                               DirectoryBatchWriter, PostZipBatchWriter, VolumeZipBatchWriter, ZipBatchWriter)
+    from igdl.pipeline import friendly_error, run_batch_pipeline
+    from igdl.profile import ArchiveIndex, ProfileSync
+    from igdl.renditions import RenditionSelector
+    from igdl.resolve import fetch_post_bundle, get_resolver_chain
+    from igdl.errors import JobBusy
+    from igdl.urls import extract_shortcode
+
+    if args.sessionid:
+        auth.set_sessionid_provider(lambda: args.sessionid[0])
+        auth.set_sessionids_provider(lambda: args.sessionid)
+    use_auth = bool(auth.get_current_sessionid())
+    account_pool = get_account_pool() if use_auth else None
+    resolve_workers = args.resolve_workers or (len(account_pool) if account_pool else 1)
+    scope = auth.cache_scope()
+    bundle_cache = get_bundle_cache()
+    bundle_cache.prune()
+    media_cache = None if args.no_media_cache else get_media_cache()
+    workers = args.workers or DL_MAX_WORKERS
+    per_host = args.per_host or DL_MAX_PER_HOST
+    compresslevel = ZIP_COMPRESSLEVEL if args.compresslevel is None else args.compresslevel
+
+    def _log(msg: str) -> None:
+        if not args.quiet:
+            print(msg, file=sys.stderr, flush=True)
+
+    race = True if args.race else None
+
+    def _resolve(u: str) -> dict:
+        sc = extract_shortcode(u)
+        return fetch_post_bundle(sc, use_auth, scope, args.max_attempts, cache=bundle_cache,
+                                 kind=ingest.kinds.get(sc, "p"), race=race)
+
+    def _refresh(shortcode: str) -> dict:
+        # URLs signées expirées en cours de lot: nouvelle résolution, cache ignoré
+        return fetch_post_bundle(shortcode, use_auth, scope, args.max_attempts, cache=bundle_cache, fresh=True,
+                                 kind=ingest.kinds.get(shortcode, "p"), race=race)
+
+    def _on_resolved(u: str, bundle: Optional[dict], err: Optional[str]) -> None:
+        if err:
+            _log(f"✗ {u}: {err}")
+        else:
+            _log(f"✓ {u} ({len(bundle['media'])} média(s))")
+
+    t0 = time.monotonic()
+    batch_metrics = metrics.BatchMetrics()
+    syncs: List[ProfileSync] = []
+    profile_errors = []
+    if profiles:
+        index = ArchiveIndex()
+        with metrics.collect(batch_metrics):
+            for username in profiles:
+                try:
+                    sync = ProfileSync(index, username, use_auth, full=args.full, limit=args.limit)
+                except Exception as e:
+                    profile_errors.append((f"@{username}", friendly_error(e)))
+                    _log(f"✗ @{username}: {profile_errors[-1][1]}")
+                    continue
+                syncs.append(sync)
+                _log(f"@{username}: {sync.new} nouveau(x) post(s), {len(sync.urls) - sync.new} en attente.")
+                for u in sync.urls:
+                    ingest.add(u, source=f"@{username}")
+                _resolve = sync.wrap_resolve(_resolve)
+        if not urls:
+            _log("Aucun nouveau post.")
+
+    job = None
+    if not args.no_resume:
+        spec = {"urls": urls, "scope": scope, "format": fmt, "output": os.path.abspath(output),
+                "compresslevel": compresslevel, "deflate_png": args.deflate_png}
+        if policy.active:
+            spec["renditions"] = policy._asdict()
+        if transcode.active:
+            spec["transcode"] = transcode._asdict()
+        if fmt == "volumes":
+            spec["volume_bytes"] = volume_bytes or ZIP_VOLUME_BYTES
+        try:
+            job = BatchCheckpoint.open(spec)
+        except JobBusy as e:
+            _log(str(e))
+            return 1
+        state = job.state()
+        if state["resolved"] or state["media_done"]:
+            _log(f"Reprise: {state['resolved']} post(s) résolu(s), {state['media_done']} média(s) complet(s), "
+                 f"{state['partial']} partiel(s).")
+        _resolve = job.wrap_resolve(_resolve)
+    selector = None
+    if policy.active:
+        # au-dessus du point de reprise: le manifeste garde toutes les renditions
+        selector = RenditionSelector(policy, len(urls))
+        _resolve = selector.wrap_resolve(_resolve)
+        _log(f"Renditions: {policy.describe()}.")
+    if transcode.active:
+        _log(f"Réencodage des photos: {transcode.describe()}.")
+
+    # le ZIP est écrit à côté puis renommé: jamais d'archive tronquée sous le nom final
+    dest = output + ".part" if fmt == "zip" else output
+    if fmt == "zip":
+        writer = ZipBatchWriter(dest, max_workers=workers, max_per_host=per_host, compresslevel=compresslevel,
+                                deflate_png=args.deflate_png, cache=media_cache, checkpoint=job, refresh=_refresh,
+                                transcode=transcode)
+    elif fmt == "dir":
+        writer = DirectoryBatchWriter(output, max_workers=workers, max_per_host=per_host,
+                                      cache=media_cache, checkpoint=job, refresh=_refresh, transcode=transcode,
+                                      link=args.link)
+    else:
+        # ZIP livrés au fil du lot (un par post, ou par volume): consommables avant la fin
+        series = dict(max_workers=workers, max_per_host=per_host, compresslevel=compresslevel,
+                      deflate_png=args.deflate_png, cache=media_cache, checkpoint=job, refresh=_refresh,
+                      transcode=transcode, on_output=lambda path: _log(f"📦 {path}"))
+        if fmt == "posts":
+            writer = PostZipBatchWriter(output, **series)
+        else:
+            writer = VolumeZipBatchWriter(output, volume_bytes or ZIP_VOLUME_BYTES, **series)
+
+    try:
+        with metrics.collect(batch_metrics), writer:
+            bundles, errors = run_batch_pipeline(urls, _resolve, writer, on_resolved=_on_resolved,
+                                                 resolve_workers=resolve_workers)
+    except KeyboardInterrupt:
+        if fmt == "zip" and os.path.exists(dest):
+            os.unlink(dest)
+        if job is not None:
+            job.close()
+        _log("Interrompu." + (" Relancer la même commande pour reprendre." if job else ""))
+        return 130
+    elapsed = time.monotonic() - t0
+    errors = profile_errors + errors
+    synced = {}
+    for sync in syncs:
+        synced[sync.username] = {"new": sync.new, **sync.record(bundles, writer.failed_shortcodes)}
+        _log(f"@{sync.username}: {synced[sync.username]['archived']} post(s) archivé(s), "
+             f"{synced[sync.username]['pending']} en attente.")
+    if fmt == "zip":
+        if bundles:
+            os.replace(dest, output)
+        else:
+            os.unlink(dest)  # comme l'UI: pas d'archive vide
+            output = None
+    if job is not None:
+        if errors or writer.failed:
+            job.finish(complete=False)  # gardé: une nouvelle passe ne refait que ce qui a échoué
+            job.close()
+        else:
+            job.delete()
+
+    _log(f"{len(bundles)}/{len(urls)} post(s), {writer.written - writer.failed}/{writer.total} média(s), "
+         f"{writer.bytes_written / 1e6:.1f} Mo en {elapsed:.1f} s (pauses cumulées: {batch_metrics.sleep_total():.1f} s)"
+         + (f", {writer.bytes_saved / 1e6:.1f} Mo gagnés au réencodage" if transcode.active else "")
+         + (f" → {output}" if output else ""))
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(batch_metrics.to_json() if args.metrics.lower().endswith(".json") else batch_metrics.to_prometheus())
+    if args.json:
+        json.dump({
+            "output": os.path.abspath(output) if output else None,
+            "format": fmt,
+            "outputs": writer.outputs if fmt in ("posts", "volumes") else None,
+            "urls": len(urls),
+            "posts": len(bundles),
+            "media": writer.total,
+            "media_failed": writer.failed,
+            "bytes": writer.bytes_written,
+            "elapsed_s": round(elapsed, 3),
+            "errors": [{"url": u, "error": e} for u, e in errors],
+            "input": ingest.report(),
+            "bundle_cache": bundle_cache.stats(),
+            "profiles": synced,
+            "accounts": account_pool.state() if account_pool else None,
+            "renditions": {**policy._asdict(), "estimated_bytes": selector.estimated_bytes} if selector else None,
+            "transcode": {**transcode._asdict(), "bytes_saved": writer.bytes_saved} if transcode.active else None,
+            "strategies": get_resolver_chain().state(),
+            "metrics": batch_metrics.snapshot(),
+        }, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    return 1 if errors or writer.failed or ingest.invalid_count else 0
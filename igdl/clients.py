@@ -0,0 +1,249 @@
+# igdl/clients.py
+# Pool de clients (sessions HTTP + contextes Instaloader) par scope d'auth.
+# Réutilise les connexions TLS / keep-alive entre posts, lots et utilisateurs.
+
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from igdl import metrics
+from igdl.auth import cache_scope, get_current_sessionid
+from igdl.ratelimit import RateLimiterRegistry, get_rate_limiters, install_rate_hooks
+
+if TYPE_CHECKING:
+    from instaloader import Instaloader
+
+BROWSER_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+                   "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.0 Safari/605.1.15"),
+    "Accept": "*/*",
+    "Accept-Language": "fr,en;q=0.9",
+    "Referer": "https://www.instagram.com/",
+}
+
+# Pools keep-alive des sessions HTTP (une session = un pool de connexions TLS réutilisées)
+HTTP_POOL_CONNECTIONS = 16   # hôtes distincts gardés en pool (www.instagram.com, scontent-xxx...)
+HTTP_POOL_MAXSIZE = 32       # connexions keep-alive par hôte (>= connexions simultanées max)
+
+INSTALOADER_POOL_SIZE = 4    # contextes Instaloader par scope (un contexte = un appelant à la fois)
+CLIENT_POOL_MAX_SCOPES = 32  # scopes (sessionid distincts) gardés en mémoire, LRU
+
+
+def mount_pooled_adapter(s: requests.Session) -> None:
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+
+
+def new_browsery_session(sid: Optional[str]) -> requests.Session:
+    """Session HTTP avec UA navigateur + cookie sessionid si dispo."""
+    s = requests.Session()
+    s.headers.update(BROWSER_HEADERS)
+    mount_pooled_adapter(s)
+    if sid:
+        s.cookies.set("sessionid", sid, domain=".instagram.com")
+    return s
+
+
+class _SharedPoolSession(requests.Session):
+    """Session jetable qui emprunte les adapters (pools keep-alive) de sa session parente."""
+    def close(self):
+        pass  # les adapters appartiennent à la session parente: ne pas fermer ses connexions
+
+
+def _copy_session_sharing_pool(session: requests.Session, request_timeout: Optional[float] = None) -> requests.Session:
+    """
+    Remplace instaloadercontext.copy_session: Instaloader copie sa session pour chaque
+    requête GraphQL, ce qui jette la connexion TLS. La copie garde ici les adapters du parent.
+    """
+    new = _SharedPoolSession()
+    new.cookies = requests.utils.cookiejar_from_dict(requests.utils.dict_from_cookiejar(session.cookies))
+    new.headers = session.headers.copy()
+    new.adapters = session.adapters
+    new.hooks = {event: list(hooks) for event, hooks in session.hooks.items()}
+    new.request = partial(new.request, timeout=request_timeout)
+    return new
+
+
+_copy_session_lock = threading.Lock()
+_copy_session_installed = False
+
+
+def _install_copy_session() -> None:
+    """
+    Installe _copy_session_sharing_pool une seule fois par processus. InstaloaderContext appelle la
+    fonction du module (pas une méthode): une sous-classe ne peut pas la remplacer.
+    """
+    global _copy_session_installed
+    with _copy_session_lock:
+        if _copy_session_installed:
+            return
+        from instaloader import instaloadercontext
+
+        instaloadercontext.copy_session = _copy_session_sharing_pool
+        _copy_session_installed = True
+
+
+def _metered_rate_controller(context):
+    """RateController d'Instaloader dont les pauses (fenêtre de requêtes, 429) sont mesurées."""
+    from instaloader import RateController
+
+    class _MeteredRateController(RateController):
+        def sleep(self, secs: float):
+            with metrics.timed("sleep.instaloader_rate"):
+                super().sleep(secs)
+
+    return _MeteredRateController(context)
+
+
+def _meter_do_sleep(context) -> None:
+    """Mesure la pause aléatoire qu'Instaloader fait avant chaque requête (InstaloaderContext.do_sleep)."""
+    do_sleep = context.do_sleep
+
+    def _do_sleep():
+        with metrics.timed("sleep.instaloader"):
+            do_sleep()
+    context.do_sleep = _do_sleep
+
+
+def new_instaloader(use_auth: bool, sid: Optional[str] = None) -> "Instaloader":
+    """Instaloader avec les mêmes headers/cookies (si use_auth=True)."""
+    from instaloader import Instaloader  # import paresseux (~150 ms)
+
+    _install_copy_session()
+    L = Instaloader(
+        download_comments=False,
+        save_metadata=False,
+        post_metadata_txt_pattern="",
+        quiet=True,
+        max_connection_attempts=3,
+        rate_controller=_metered_rate_controller,
+    )
+    _meter_do_sleep(L.context)
+    s = L.context._session
+    mount_pooled_adapter(s)
+    if use_auth:
+        s.headers.update(BROWSER_HEADERS)
+        sid = sid or get_current_sessionid()
+        if sid:
+            s.cookies.set("sessionid", sid, domain=".instagram.com")
+    return L
+
+
+class ClientPool:
+    """
+    Réutilise les sessions `requests` et les contextes Instaloader entre posts, lots et
+    sessions Streamlit, par scope d'auth (cache_scope()). Les sessions HTTP sont partagées
+    (requêtes GET concurrentes sûres); un contexte Instaloader n'est prêté qu'à un appelant à la fois.
+    Changer de sessionid change de scope: invalidate(ancien_scope) libère les anciens clients.
+    """
+    def __init__(self, loaders_per_scope: int = INSTALOADER_POOL_SIZE, max_scopes: int = CLIENT_POOL_MAX_SCOPES,
+                 limiters: Optional[RateLimiterRegistry] = None):
+        self.limiters = limiters
+        self.loaders_per_scope = max(1, int(loaders_per_scope))
+        self.max_scopes = max(1, int(max_scopes))
+        self._lock = threading.RLock()
+        self._scopes: "OrderedDict[str, None]" = OrderedDict()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._loaders: Dict[Tuple[str, bool], "queue.LifoQueue[Instaloader]"] = {}
+        self._loader_counts: Dict[Tuple[str, bool], int] = {}
+
+    def _touch(self, scope: str) -> None:
+        self._scopes[scope] = None
+        self._scopes.move_to_end(scope)
+        while len(self._scopes) > self.max_scopes:
+            self.invalidate(next(iter(self._scopes)))
+
+    def session(self, scope: str, sid: Optional[str]) -> requests.Session:
+        with self._lock:
+            self._touch(scope)
+            s = self._sessions.get(scope)
+            if s is None:
+                s = self._sessions[scope] = new_browsery_session(sid)
+                if self.limiters is not None:
+                    install_rate_hooks(s, self.limiters, scope)
+            return s
+
+    @contextmanager
+    def instaloader(self, scope: str, use_auth: bool, sid: Optional[str]) -> Iterator["Instaloader"]:
+        key = (scope, use_auth)
+        L = None
+        with self._lock:
+            self._touch(scope)
+            q = self._loaders.get(key)
+            if q is None:
+                q = self._loaders[key] = queue.LifoQueue()
+            try:
+                L = q.get_nowait()
+            except queue.Empty:
+                create = self._loader_counts.get(key, 0) < self.loaders_per_scope
+                if create:
+                    self._loader_counts[key] = self._loader_counts.get(key, 0) + 1
+        if L is None:
+            if create:
+                try:
+                    L = new_instaloader(use_auth, sid)
+                    if self.limiters is not None:
+                        install_rate_hooks(L.context._session, self.limiters, scope)
+                except BaseException:
+                    with self._lock:
+                        self._loader_counts[key] -= 1
+                    raise
+            else:
+                L = q.get()  # tous les contextes sont prêtés: on attend le premier rendu
+        try:
+            yield L
+        finally:
+            with self._lock:
+                still_pooled = self._loaders.get(key) is q
+            if still_pooled:
+                q.put(L)
+            else:
+                L.close()  # scope invalidé pendant l'emprunt
+
+    def invalidate(self, scope: Optional[str] = None) -> None:
+        """Ferme les clients d'un scope (ou de tous) — à appeler quand le sessionid change."""
+        with self._lock:
+            scopes = [scope] if scope is not None else list(self._scopes)
+            for sc in scopes:
+                self._scopes.pop(sc, None)
+                s = self._sessions.pop(sc, None)
+                if s is not None:
+                    s.close()
+                for key in [k for k in self._loaders if k[0] == sc]:
+                    q = self._loaders.pop(key)
+                    self._loader_counts.pop(key, None)
+                    while True:
+                        try:
+                            q.get_nowait().close()
+                        except queue.Empty:
+                            break
+
+
+_pool: Optional[ClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> ClientPool:
+    """Un seul pool par processus, partagé entre sessions Streamlit, reruns et lots."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ClientPool(limiters=get_rate_limiters())
+        return _pool
+
+
+def build_browsery_session() -> requests.Session:
+    """Session HTTP partagée (keep-alive) du scope courant: UA navigateur + cookie sessionid si dispo."""
+    return get_client_pool().session(cache_scope(), get_current_sessionid())
+
+
+def instaloader_client(use_auth: bool):
+    """Emprunte un contexte Instaloader du pool pour le scope courant (context manager)."""
+    return get_client_pool().instaloader(cache_scope(), use_auth, get_current_sessionid())
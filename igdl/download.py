@@ -0,0 +1,917 @@
+# igdl/download.py
+# Téléchargement parallèle des médias et écriture en streaming (ZIP ou dossier),
+# dans l'ordre des posts / médias, sans garder de média ni d'archive entière en mémoire.
+#
+# URLs signées: un bundle en cache (ou résolu en début de long lot) peut contenir des URLs CDN
+# expirées. Avec `refresh` (shortcode -> bundle frais), un média dont l'URL expire dans moins de
+# DL_URL_REFRESH_MARGIN_S (paramètre 'oe'), ou refusée par le CDN (403 / 410), fait re-résoudre
+# son post (une fois par post et par lot, cache ignoré) puis est retéléchargé avec l'URL fraîche.
+#
+# Réencodage optionnel des photos (igdl.transcode) entre le téléchargement et l'écriture: fait
+# dans un pool de processus, enchaîné au téléchargement, sans changer l'ordre d'écriture.
+#
+# Sorties (même arborescence <shortcode>_<légende>/<média>):
+# - ZipBatchWriter       : un seul ZIP;
+# - DirectoryBatchWriter : un dossier, fichiers copiés (ou, sur demande, liés par lien physique
+#                          depuis le cache / le lot reprenable);
+# - PostZipBatchWriter   : un ZIP par post, livré dès que son dernier média est écrit;
+# - VolumeZipBatchWriter : des ZIP autonomes d'au plus ZIP_VOLUME_BYTES, livrés au fil du lot.
+# Les deux dernières permettent de consommer un gros lot par morceaux (et de les supprimer au fur
+# et à mesure): ni la mémoire ni un fichier unique ne grossissent avec le lot.
+
+import contextvars
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+
+from igdl import metrics
+from igdl.auth import cache_scope
+from igdl.cache import MediaCache, asset_key, url_expiry
+from igdl.clients import build_browsery_session
+from igdl.errors import CircuitOpenError, UrlExpired
+from igdl.ratelimit import AdaptiveRateLimiter, get_rate_limiters
+from igdl.singleflight import SingleFlight
+from igdl.transcode import TranscodePolicy, Transcoder
+from igdl.urls import post_url, sanitize_filename
+
+if TYPE_CHECKING:
+    from igdl.checkpoint import BatchCheckpoint
+
+# Concurrence du téléchargement (valeurs par défaut, réglables dans la barre latérale / la CLI)
+DL_MAX_WORKERS = 8      # connexions simultanées au total
+DL_MAX_PER_HOST = 4     # connexions simultanées par hôte CDN (scontent-xxx.cdninstagram.com, ...)
+
+# Streaming: aucun média ni archive entière n'est gardé en mémoire
+DL_CHUNK_SIZE = 256 * 1024           # taille des blocs lus / copiés
+DL_SPOOL_MAX_BYTES = 8 * 1024 * 1024  # au-delà, le média téléchargé déborde sur disque
+DL_URL_REFRESH_MARGIN_S = 60.0        # URL signée expirant avant: re-résolue sans tentative
+ARCHIVE_DIR = os.path.join(tempfile.gettempdir(), "igdl_archives")
+
+# téléchargements simultanés d'un même média (lots qui se recoupent): une seule requête CDN
+_MEDIA_FLIGHTS = SingleFlight("media")
+
+
+def ext_from_content_type(ct: str, fallback: str) -> str:
+    ct = (ct or "").lower()
+    if "png" in ct:
+        return ".png"
+    if "webp" in ct:
+        return ".webp"
+    if "avif" in ct:
+        return ".avif"
+    if "jpeg" in ct or "jpg" in ct:
+        return ".jpg"
+    if "gif" in ct:
+        return ".gif"
+    if "mp4" in ct:
+        return ".mp4"
+    if "quicktime" in ct or "mov" in ct:
+        return ".mov"
+    if "webm" in ct:
+        return ".webm"
+    return fallback
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Devine le content-type depuis les premiers octets (signatures magiques). '' si inconnu."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    return ""
+
+
+# =========================
+# Politique de compression ZIP
+# =========================
+# Les médias IG sont déjà compressés (JPEG/WebP/MP4...): les "deflater" coûte du CPU pour ~0% de gain.
+ZIP_STORED_EXTS = {".jpg", ".webp", ".avif", ".gif", ".mp4", ".mov", ".webm"}
+ZIP_COMPRESSLEVEL = 6      # niveau deflate des entrées compressées (texte, PNG optionnel)
+ZIP_DEFLATE_PNG = False    # le PNG est déjà deflaté: le gain est faible, mais parfois non nul
+ZIP_VOLUME_BYTES = 1024 ** 3  # taille max d'un volume (VolumeZipBatchWriter), hors dernier média
+
+
+def compression_for(ext: str, deflate_png: bool = ZIP_DEFLATE_PNG) -> int:
+    """ZIP_STORED pour les médias déjà compressés, ZIP_DEFLATED pour le reste (texte, manifestes...)."""
+    ext = ext.lower()
+    if ext in ZIP_STORED_EXTS or (ext == ".png" and not deflate_png):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+# =========================
+# Téléchargement d'un média
+# =========================
+class HostLimiter:
+    """Un sémaphore par hôte CDN pour plafonner les connexions simultanées par hôte."""
+    def __init__(self, per_host: int):
+        self.per_host = max(1, int(per_host))
+        self._lock = threading.Lock()
+        self._sems: Dict[str, threading.BoundedSemaphore] = {}
+
+    def for_url(self, url: str) -> threading.BoundedSemaphore:
+        host = (urlparse(url).hostname or "").lower()
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = self._sems[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+
+class FetchedMedia(NamedTuple):
+    file: Optional[BinaryIO]   # rembobiné, None en cas d'échec
+    ctype: str
+    size: int
+    error: Optional[Exception]
+    sha256: Optional[str] = None  # calculé seulement si le média est rangé (cache / lot reprenable)
+    transcoded: Optional[Tuple[int, float]] = None  # réencodé: (taille d'origine, durée du réencodage)
+
+
+def _range_start(r: requests.Response) -> Optional[int]:
+    """Début de l'intervalle d'une réponse 206 ('Content-Range: bytes 1000-1999/5000')."""
+    cr = r.headers.get("Content-Range", "")
+    if r.status_code != 206 or not cr.startswith("bytes "):
+        return None
+    try:
+        return int(cr[6:].split("-", 1)[0])
+    except ValueError:
+        return None
+
+
+def fetch_media(session: requests.Session, url: str, limiter: HostLimiter,
+                cache: Optional[MediaCache] = None,
+                rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                dest_path: Optional[str] = None) -> FetchedMedia:
+    """
+    Télécharge un média (3 tentatives) par blocs. Un 403 / 410 (URL signée expirée ou refusée)
+    échoue tout de suite avec UrlExpired: une nouvelle tentative sur la même URL est inutile.
+    - avec cache: lu depuis le cache disque si présent, sinon téléchargé, haché et rangé dans le cache;
+    - avec dest_path (lot reprenable): téléchargé dans `<dest_path>.part`, repris avec un en-tête
+      Range si un partiel existe (passage précédent ou tentative coupée), puis renommé en dest_path
+      (ou rangé dans le cache);
+    - sinon: dans un fichier temporaire "spooled" (RAM jusqu'à DL_SPOOL_MAX_BYTES, disque au-delà).
+    Avec cache, les téléchargements simultanés d'un même média (même asset_key, autres lots
+    compris) sont coalescés: un seul transfert, les autres appels relisent le média dans le cache.
+    """
+    if cache is None:
+        return _download_media(session, url, limiter, None, rate_limiter, dest_path)
+    hit = _cached_media(cache, url)
+    if hit is not None:
+        return hit
+    res, shared = _MEDIA_FLIGHTS.do(
+        asset_key(url), lambda: _download_media(session, url, limiter, cache, rate_limiter, dest_path),
+        recheck=lambda: _cached_media(cache, url))
+    if not shared:
+        return res
+    if res.file is None:
+        return FetchedMedia(None, "", 0, res.error)
+    # le fichier ouvert appartient à l'autre appel: on relit le blob (retéléchargé s'il a été évincé)
+    return _cached_media(cache, url) or _download_media(session, url, limiter, cache, rate_limiter, dest_path)
+
+
+def _cached_media(cache: MediaCache, url: str) -> Optional[FetchedMedia]:
+    hit = cache.get(url)
+    if not hit:
+        return None
+    path, ctype, size = hit
+    try:
+        f = open(path, "rb")
+    except OSError:  # blob évincé entre get() et open() (autre lot, autre processus): retéléchargé
+        metrics.incr("cache.media.miss")
+        return None
+    metrics.incr("cache.media.hit")
+    return FetchedMedia(f, ctype, size, None, os.path.basename(path))
+
+
+def _download_media(session: requests.Session, url: str, limiter: HostLimiter,
+                    cache: Optional[MediaCache], rate_limiter: Optional[AdaptiveRateLimiter],
+                    dest_path: Optional[str]) -> FetchedMedia:
+    """Transfert CDN de fetch_media (tentatives, reprise Range, rangement dans le cache)."""
+    part = dest_path + ".part" if dest_path else None
+    keep = cache is not None or part is not None  # le fichier est rangé: on le hache
+    err = None
+    for attempt in range(3):
+        if attempt:
+            metrics.incr("download.retries")
+        if rate_limiter is not None:
+            try:
+                metrics.observe("sleep.rate_limit.cdn", rate_limiter.acquire())
+            except CircuitOpenError as e:
+                return FetchedMedia(None, "", 0, e)
+        offset = os.path.getsize(part) if part and os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        spool = None
+        t0 = time.perf_counter()
+        try:
+            with limiter.for_url(url):
+                with session.get(url, timeout=30, stream=True, headers=headers) as r:
+                    if offset and r.status_code == 416:
+                        os.unlink(part)  # partiel incohérent avec la ressource: on repart de zéro
+                    if r.status_code in (403, 410):
+                        raise UrlExpired(f"URL signée refusée par le CDN (HTTP {r.status_code})")
+                    r.raise_for_status()
+                    if offset and _range_start(r) != offset:
+                        offset = 0  # Range ignoré par le serveur (200): réponse complète
+                    elif offset:
+                        metrics.incr("download.resumed")
+                    ctype = r.headers.get("Content-Type", "")
+                    digest = hashlib.sha256() if keep else None
+                    if part is not None:
+                        if offset:
+                            with open(part, "rb") as prev:
+                                for block in iter(lambda: prev.read(DL_CHUNK_SIZE), b""):
+                                    digest.update(block)
+                        spool = open(part, "ab" if offset else "wb")
+                    elif cache is not None:
+                        spool = cache.new_temp()
+                    else:
+                        spool = tempfile.SpooledTemporaryFile(max_size=DL_SPOOL_MAX_BYTES)
+                    size = offset
+                    for chunk in r.iter_content(chunk_size=DL_CHUNK_SIZE):
+                        if chunk:
+                            spool.write(chunk)
+                            if digest is not None:
+                                digest.update(chunk)
+                            size += len(chunk)
+            metrics.observe("download.media", time.perf_counter() - t0)
+            metrics.incr("download.bytes", size - offset)
+            if not keep:
+                spool.seek(0)
+                return FetchedMedia(spool, ctype, size, None)
+            spool.close()
+            sha = digest.hexdigest()
+            if cache is not None:
+                path = cache.put(url, spool.name, sha, size, ctype)
+            else:
+                os.replace(part, dest_path)
+                path = dest_path
+            return FetchedMedia(open(path, "rb"), ctype, size, None, sha)
+        except Exception as e:
+            if spool is not None:
+                spool.close()
+                # le partiel d'un lot reprenable est gardé: la tentative suivante le complète
+                if cache is not None and part is None and os.path.exists(spool.name):
+                    os.unlink(spool.name)
+            err = e
+            if isinstance(e, UrlExpired):
+                metrics.incr("download.url_expired")
+                break
+            # la pause se fait hors du sémaphore pour ne pas bloquer l'hôte
+            with metrics.timed("sleep.backoff.cdn"):
+                time.sleep(0.7 * (attempt + 1))
+    return FetchedMedia(None, "", 0, err)
+
+
+ZIP_DEFAULT_DATE = (1980, 1, 1, 0, 0, 0)  # post sans date connue (fallback OG, anciens bundles en cache)
+
+
+def zip_date_time(epoch: Optional[float]) -> tuple:
+    """Date d'une entrée: celle du post (UTC), pour qu'une même archive soit reproductible octet pour octet."""
+    if not epoch:
+        return ZIP_DEFAULT_DATE
+    return max(ZIP_DEFAULT_DATE, time.gmtime(epoch)[:6])
+
+
+def _set_compress_level(zinfo: zipfile.ZipInfo, compresslevel: Optional[int]) -> None:
+    """
+    zf.open(ZipInfo, "w") n'applique ni le compresslevel de l'archive ni d'argument: il lit celui de
+    l'entrée, attribut public depuis Python 3.13 (compress_level), privé avant.
+    """
+    if hasattr(zipfile.ZipInfo, "compress_level"):
+        zinfo.compress_level = compresslevel
+    else:
+        zinfo._compresslevel = compresslevel
+
+
+def zip_write_stream(zf: zipfile.ZipFile, arcname: str, src: BinaryIO, size: int,
+                     compress_type: int, compresslevel: Optional[int] = None,
+                     date_time: tuple = ZIP_DEFAULT_DATE) -> None:
+    """Copie un flux dans une entrée du ZIP sans le charger en entier."""
+    zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+    zinfo.compress_type = compress_type
+    _set_compress_level(zinfo, compresslevel)
+    zinfo.file_size = size  # permet à zipfile de décider seul du ZIP64
+    with zf.open(zinfo, "w") as dst:
+        shutil.copyfileobj(src, dst, DL_CHUNK_SIZE)
+
+
+# =========================
+# Écriture d'un lot (ZIP ou dossier)
+# =========================
+def zip_write_text(zf: zipfile.ZipFile, arcname: str, text: str, compresslevel: int, date_time: tuple) -> None:
+    zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+    zf.writestr(zinfo, text, compress_type=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+
+
+class _MediaJob(NamedTuple):
+    shortcode: str
+    folder: str
+    base: str
+    midx: int
+    kind: str
+    url: str
+    key: str                # identité stable du média dans le lot (reprise)
+    date: Optional[float]   # date du post (epoch UTC)
+
+
+class BatchWriter:
+    """
+    Écriture incrémentale d'un lot: add_bundle() lance les téléchargements du post
+    (pool de threads, plafond global + par hôte), pump() écrit en streaming les médias
+    terminés, toujours dans l'ordre des posts / médias (comme en séquentiel).
+    Si `cache` est fourni, les médias déjà en cache disque ne sont pas retéléchargés.
+    Si `checkpoint` est fourni, les médias complets / partiels d'un passage précédent sont repris.
+    Si `refresh` (shortcode -> bundle frais) est fourni, les URLs signées expirées sont renouvelées.
+    Si `transcode` est actif, les photos sont réencodées (pool de processus) avant d'être écrites.
+    Les sous-classes fournissent la destination: _write_media / _write_error / _end_post / _finalize / _discard.
+    """
+    def __init__(self, max_workers: int = DL_MAX_WORKERS,
+                 max_per_host: int = DL_MAX_PER_HOST,
+                 cache: Optional[MediaCache] = None,
+                 checkpoint: Optional["BatchCheckpoint"] = None,
+                 refresh: Optional[Callable[[str], dict]] = None,
+                 transcode: Optional[TranscodePolicy] = None,
+                 transcode_workers: Optional[int] = None):
+        self.max_workers = max(1, int(max_workers))
+        self.cache = cache
+        self.checkpoint = checkpoint
+        self.refresh = refresh
+        self._refreshed: Dict[str, Optional[dict]] = {}  # shortcode -> bundle frais (None: échec)
+        self._refresh_lock = threading.Lock()  # protège _refreshed seulement
+        self._refresh_flights = SingleFlight("refresh", lock_dir=None)  # une re-résolution par post à la fois
+        self.session = build_browsery_session()  # partagée: son pool (HTTP_POOL_MAXSIZE) couvre max_workers
+        self._host_limiter = HostLimiter(max_per_host)
+        self._rate_limiter = get_rate_limiters().get(cache_scope(), "cdn")
+        # fenêtre glissante: on ne garde pas plus de 2x max_workers médias en attente d'écriture
+        self._window = self.max_workers * 2
+        self._todo = deque()     # _MediaJob pas encore soumis
+        self._pending = deque()  # (job, future) soumis, dans l'ordre final
+        self.total = 0
+        self.written = 0
+        self.bytes_written = 0
+        self.failed = 0
+        self.failed_shortcodes: Set[str] = set()  # posts dont au moins un média a échoué
+        self.bytes_saved = 0  # gagnés par le réencodage des photos
+        self._post_left: Dict[str, int] = {}  # shortcode -> médias pas encore écrits
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="igdl-dl")
+        self._transcoder = Transcoder(transcode, transcode_workers) if transcode and transcode.active else None
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.written
+
+    def add_bundle(self, b: Dict[str, object]) -> None:
+        caption = b["caption"] or ""
+        shortcode = b["shortcode"]
+        folder_caption = sanitize_filename(caption, 40)
+        folder = f"{shortcode}_{folder_caption or 'post'}"
+        base = sanitize_filename(caption)
+        for midx, item in enumerate(b["media"], start=1):
+            self._todo.append(_MediaJob(shortcode, folder, base, midx, item["kind"], item["url"],
+                                        f"{shortcode}_{midx:02d}", b.get("date")))
+            self.total += 1
+        if b["media"]:
+            self._post_left[shortcode] = self._post_left.get(shortcode, 0) + len(b["media"])
+        self._refill()
+
+    def _refill(self) -> None:
+        while self._todo and len(self._pending) < self._window:
+            job = self._todo.popleft()
+            # le thread de téléchargement enregistre ses mesures dans le collecteur de l'appelant
+            fut = self._pool.submit(contextvars.copy_context().run, self._fetch, job)
+            if self._transcoder is not None and job.kind == "photo":
+                fut = self._then_transcode(fut)
+            self._pending.append((job, fut))
+
+    def _then_transcode(self, fetched: Future) -> Future:
+        """
+        Future du média réencodé: le téléchargement terminé, ses octets partent dans le pool de
+        processus; le thread de téléchargement est aussitôt libre. Échec du réencodage, image
+        animée ou résultat plus gros sans redimensionnement: le média d'origine est gardé.
+        """
+        out: Future = Future()
+
+        def _encoded(res: FetchedMedia, data: bytes, t0: float, f: Future) -> None:
+            try:
+                encoded = f.result()
+            except Exception:
+                encoded = None  # image illisible, pool arrêté...
+            if encoded is None or (len(encoded[0]) >= len(data) and not encoded[1]):
+                out.set_result(res._replace(file=io.BytesIO(data)))
+                return
+            out.set_result(FetchedMedia(io.BytesIO(encoded[0]), self._transcoder.policy.content_type,
+                                        len(encoded[0]), None, None, (len(data), time.monotonic() - t0)))
+
+        def _fetched(f: Future) -> None:
+            if f.cancelled():
+                out.cancel()
+                return
+            try:
+                res = f.result()
+            except Exception as e:
+                out.set_exception(e)  # comme sans réencodage: pump() relance l'erreur du téléchargement
+                return
+            if res.file is None:
+                out.set_result(res)
+                return
+            try:
+                with res.file:
+                    data = res.file.read()
+            except OSError as e:
+                out.set_result(FetchedMedia(None, res.ctype, 0, e))
+                return
+            t0 = time.monotonic()
+            try:
+                tf = self._transcoder.submit(data)
+            except Exception:
+                out.set_result(res._replace(file=io.BytesIO(data)))
+                return
+            tf.add_done_callback(lambda tf: _encoded(res, data, t0, tf))
+
+        fetched.add_done_callback(_fetched)
+        return out
+
+    def _fetch(self, job: "_MediaJob") -> FetchedMedia:
+        """Thread de téléchargement: reprise depuis le checkpoint si possible, sinon fetch_media."""
+        cp = self.checkpoint
+        if cp is not None:
+            done = cp.completed(job.key, job.url, self.cache)
+            if done is not None:
+                metrics.incr("checkpoint.media_hit")
+                return FetchedMedia(open(done["path"], "rb"), done["ctype"], done["size"], None, done["sha256"])
+        url = job.url
+        if self.refresh is not None and self._expiring(url) and not (self.cache and self.cache.get(url)):
+            metrics.incr("download.url_expired")
+            url = self._fresh_url(job) or url
+        res = self._fetch_url(job, url)
+        if isinstance(res.error, UrlExpired) and self.refresh is not None:
+            fresh = self._fresh_url(job)
+            if fresh and fresh != url:
+                res = self._fetch_url(job, fresh)
+        return res
+
+    def _fetch_url(self, job: "_MediaJob", url: str) -> FetchedMedia:
+        cp = self.checkpoint
+        if cp is None:
+            return fetch_media(self.session, url, self._host_limiter, self.cache, self._rate_limiter)
+        res = fetch_media(self.session, url, self._host_limiter, self.cache, self._rate_limiter,
+                          dest_path=cp.media_path(job.key))
+        if res.file is not None:
+            cp.record_media(job.key, res.size, res.sha256, res.ctype)
+        else:
+            cp.record_partial(job.key)
+        return res
+
+    @staticmethod
+    def _expiring(url: str) -> bool:
+        expiry = url_expiry(url)
+        return expiry is not None and expiry < time.time() + DL_URL_REFRESH_MARGIN_S
+
+    def _fresh_url(self, job: "_MediaJob") -> Optional[str]:
+        """
+        URL fraîche du média `job`: son post est re-résolu une seule fois pour tout le lot (cache ignoré).
+        Même rendition que l'URL d'origine (asset_key), sinon la meilleure qualité; None si le post a changé.
+        Les médias d'un même post attendent sa re-résolution; ceux des autres posts ne sont pas bloqués.
+        """
+        with self._refresh_lock:
+            refreshed = job.shortcode in self._refreshed
+            bundle = self._refreshed.get(job.shortcode)
+        if not refreshed:
+            bundle, _ = self._refresh_flights.do(job.shortcode, lambda: self._refresh_bundle(job.shortcode))
+        if not bundle or len(bundle["media"]) < job.midx:
+            return None
+        item = bundle["media"][job.midx - 1]
+        key = asset_key(job.url)
+        for r in [item] + list(item.get("renditions") or []):
+            if asset_key(r["url"]) == key:
+                return r["url"]
+        return item["url"]
+
+    def _refresh_bundle(self, shortcode: str) -> Optional[dict]:
+        with self._refresh_lock:
+            if shortcode in self._refreshed:  # re-résolu entre la lecture de la map et la prise du vol
+                return self._refreshed[shortcode]
+        try:
+            bundle = self.refresh(shortcode)
+            metrics.incr("download.url_refreshed")
+        except Exception:
+            bundle = None
+        if bundle is not None and self.checkpoint is not None:
+            self.checkpoint.record_bundle(post_url(shortcode), bundle)  # reprise: URLs fraîches
+        with self._refresh_lock:
+            self._refreshed[shortcode] = bundle
+        return bundle
+
+    def pump(self, block: bool = False) -> int:
+        """Écrit les médias prêts en tête de file. block=True attend au moins le premier. Retourne le nombre écrit."""
+        n = 0
+        while self._pending and (self._pending[0][1].done() or (block and n == 0)):
+            job, fut = self._pending.popleft()
+            folder, base, midx = job.folder, job.base, job.midx
+            spool, ctype, size, err, _, transcoded = fut.result()
+            self._refill()
+            if transcoded is not None:
+                source_size, secs = transcoded
+                metrics.observe("transcode.image", secs)
+                metrics.incr("transcode.images")
+                metrics.incr("transcode.bytes_saved", source_size - size)
+                self.bytes_saved += source_size - size
+            elif self._transcoder is not None and job.kind == "photo" and spool is not None:
+                metrics.incr("transcode.kept")
+            if spool is not None:
+                with spool:
+                    # Content-Type absent ou générique: on regarde les octets magiques
+                    if not ext_from_content_type(ctype, ""):
+                        ctype = sniff_content_type(spool.read(16))
+                        spool.seek(0)
+                    ext = ext_from_content_type(ctype, ".mp4" if job.kind == "video" else ".jpg")
+                    with metrics.timed("write.media"):
+                        self._write_media(folder, f"{base}_{midx:02d}{ext}", spool, size, ext, job.date)
+                self.bytes_written += size
+                metrics.incr("write.bytes", size)
+            else:
+                self._write_error(folder, f"ERREUR_{midx:02d}.txt", f"Impossible de telecharger {job.url}\n{err}", job.date)
+                self.failed += 1
+                self.failed_shortcodes.add(job.shortcode)
+                metrics.incr("download.failed")
+            self.written += 1
+            n += 1
+            left = self._post_left[job.shortcode] - 1
+            if left:
+                self._post_left[job.shortcode] = left
+            else:
+                del self._post_left[job.shortcode]
+                self._end_post(folder)
+        return n
+
+    def close(self) -> None:
+        """Attend et écrit tout ce qui reste, puis finalise la destination."""
+        try:
+            while self.remaining:
+                self.pump(block=True)
+        except BaseException:
+            self.abort()
+            raise
+        self._pool.shutdown()
+        if self._transcoder is not None:
+            self._transcoder.shutdown()
+        self._finalize()
+        if self.cache is not None:
+            self.cache.evict()
+
+    def abort(self) -> None:
+        """Abandon: annule ce qui n'a pas démarré et libère les fichiers temporaires déjà téléchargés."""
+        self._todo.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if self._transcoder is not None:
+            self._transcoder.shutdown(cancel=True)
+        for _, fut in self._pending:
+            if not fut.cancelled():
+                spool = fut.result().file
+                if spool is not None:
+                    spool.close()
+        self._pending.clear()
+        self._discard()
+
+    def _write_media(self, folder: str, name: str, src: BinaryIO, size: int, ext: str,
+                     date: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def _write_error(self, folder: str, name: str, text: str, date: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def _end_post(self, folder: str) -> None:
+        """Dernier média d'un post écrit (succès ou erreur)."""
+        pass
+
+    def _finalize(self) -> None:
+        pass
+
+    def _discard(self) -> None:
+        pass
+
+    def __enter__(self) -> "BatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ZipBatchWriter(BatchWriter):
+    """Lot écrit dans un ZIP (chemin ou fichier binaire). Compression par entrée: voir compression_for()."""
+    def __init__(self, dest: Union[str, BinaryIO],
+                 max_workers: int = DL_MAX_WORKERS,
+                 max_per_host: int = DL_MAX_PER_HOST,
+                 compresslevel: int = ZIP_COMPRESSLEVEL,
+                 deflate_png: bool = ZIP_DEFLATE_PNG,
+                 cache: Optional[MediaCache] = None,
+                 checkpoint: Optional["BatchCheckpoint"] = None,
+                 refresh: Optional[Callable[[str], dict]] = None,
+                 transcode: Optional[TranscodePolicy] = None,
+                 transcode_workers: Optional[int] = None):
+        super().__init__(max_workers=max_workers, max_per_host=max_per_host, cache=cache, checkpoint=checkpoint,
+                         refresh=refresh, transcode=transcode, transcode_workers=transcode_workers)
+        self.compresslevel = compresslevel
+        self.deflate_png = deflate_png
+        self._zf = zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+
+    def _write_media(self, folder: str, name: str, src: BinaryIO, size: int, ext: str,
+                     date: Optional[float]) -> None:
+        zip_write_stream(self._zf, f"{folder}/{name}", src, size,
+                         compression_for(ext, self.deflate_png), self.compresslevel, zip_date_time(date))
+
+    def _write_error(self, folder: str, name: str, text: str, date: Optional[float]) -> None:
+        zip_write_text(self._zf, f"{folder}/{name}", text, self.compresslevel, zip_date_time(date))
+
+    def _finalize(self) -> None:
+        self._zf.close()
+
+    def _discard(self) -> None:
+        self._zf.close()
+
+
+class DirectoryBatchWriter(BatchWriter):
+    """
+    Lot écrit directement dans un dossier (même arborescence que le ZIP), sans archive intermédiaire.
+    Médias copiés par défaut. `link=True` (à demander explicitement): un média déjà sur disque (cache,
+    lot reprenable) est lié (lien physique) au lieu d'être copié; copie si la source est sur un autre
+    disque ou réencodée. Un fichier lié partage ses octets avec le cache: le modifier sur place
+    corromprait le blob du cache; à réserver aux sorties en lecture seule.
+    """
+    def __init__(self, root: str,
+                 max_workers: int = DL_MAX_WORKERS,
+                 max_per_host: int = DL_MAX_PER_HOST,
+                 cache: Optional[MediaCache] = None,
+                 checkpoint: Optional["BatchCheckpoint"] = None,
+                 refresh: Optional[Callable[[str], dict]] = None,
+                 transcode: Optional[TranscodePolicy] = None,
+                 transcode_workers: Optional[int] = None,
+                 link: bool = False):
+        super().__init__(max_workers=max_workers, max_per_host=max_per_host, cache=cache, checkpoint=checkpoint,
+                         refresh=refresh, transcode=transcode, transcode_workers=transcode_workers)
+        self.root = root
+        self.link = link
+        self.linked = 0  # médias liés au lieu d'être copiés
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, folder: str, name: str) -> str:
+        d = os.path.join(self.root, folder)
+        os.makedirs(d, exist_ok=True)
+        return os.path.join(d, name)
+
+    def _write_media(self, folder: str, name: str, src: BinaryIO, size: int, ext: str,
+                     date: Optional[float]) -> None:
+        path = self._path(folder, name)
+        if self.link and self._link(src, size, path + ".part"):
+            self.linked += 1
+            metrics.incr("write.linked")
+        else:
+            with open(path + ".part", "wb") as dst:
+                shutil.copyfileobj(src, dst, DL_CHUNK_SIZE)
+        if date:
+            os.utime(path + ".part", (date, date))
+        os.replace(path + ".part", path)  # pas de fichier tronqué visible en cas d'interruption
+
+    @staticmethod
+    def _link(src: BinaryIO, size: int, dest: str) -> bool:
+        """Lien physique `dest` -> fichier de `src` (blob du cache, média du lot reprenable); False sinon."""
+        name = getattr(src, "name", None)  # BytesIO (réencodé), fichier temporaire anonyme: pas de nom
+        if not isinstance(name, str):
+            return False
+        try:
+            if os.fstat(src.fileno()).st_size != size:
+                return False
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            os.link(name, dest)
+            return True
+        except (OSError, ValueError):  # autre disque (EXDEV), système sans liens physiques...
+            return False
+
+    def _write_error(self, folder: str, name: str, text: str, date: Optional[float]) -> None:
+        with open(self._path(folder, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+class _ZipSeriesWriter(BatchWriter):
+    """
+    Lot écrit en plusieurs ZIP autonomes, de même arborescence que le ZIP unique (les extraire au
+    même endroit redonne le lot). Chaque ZIP est écrit en .part puis renommé dès qu'il est complet:
+    `outputs` (et `on_output(chemin)`, appelé depuis pump) les livrent au fil du lot.
+    Les sous-classes choisissent le nom du ZIP suivant (_next_path) et quand le fermer.
+    """
+    def __init__(self, max_workers: int = DL_MAX_WORKERS,
+                 max_per_host: int = DL_MAX_PER_HOST,
+                 compresslevel: int = ZIP_COMPRESSLEVEL,
+                 deflate_png: bool = ZIP_DEFLATE_PNG,
+                 cache: Optional[MediaCache] = None,
+                 checkpoint: Optional["BatchCheckpoint"] = None,
+                 refresh: Optional[Callable[[str], dict]] = None,
+                 transcode: Optional[TranscodePolicy] = None,
+                 transcode_workers: Optional[int] = None,
+                 on_output: Optional[Callable[[str], None]] = None):
+        super().__init__(max_workers=max_workers, max_per_host=max_per_host, cache=cache, checkpoint=checkpoint,
+                         refresh=refresh, transcode=transcode, transcode_workers=transcode_workers)
+        self.compresslevel = compresslevel
+        self.deflate_png = deflate_png
+        self.on_output = on_output
+        self.outputs: List[str] = []
+        self._zf: Optional[zipfile.ZipFile] = None
+        self._zf_path = ""
+
+    def _next_path(self, folder: str) -> str:
+        raise NotImplementedError
+
+    def _current(self, folder: str) -> zipfile.ZipFile:
+        if self._zf is None:
+            self._zf_path = self._next_path(folder)
+            self._zf = zipfile.ZipFile(self._zf_path + ".part", "w", compression=zipfile.ZIP_DEFLATED,
+                                       compresslevel=self.compresslevel)
+        return self._zf
+
+    def _close_current(self) -> None:
+        zf, self._zf = self._zf, None
+        if zf is None:
+            return
+        zf.close()
+        os.replace(self._zf_path + ".part", self._zf_path)
+        self.outputs.append(self._zf_path)
+        metrics.incr("write.archives")
+        if self.on_output is not None:
+            self.on_output(self._zf_path)
+
+    def _write_media(self, folder: str, name: str, src: BinaryIO, size: int, ext: str,
+                     date: Optional[float]) -> None:
+        zip_write_stream(self._current(folder), f"{folder}/{name}", src, size,
+                         compression_for(ext, self.deflate_png), self.compresslevel, zip_date_time(date))
+
+    def _write_error(self, folder: str, name: str, text: str, date: Optional[float]) -> None:
+        zip_write_text(self._current(folder), f"{folder}/{name}", text, self.compresslevel, zip_date_time(date))
+
+    def _finalize(self) -> None:
+        self._close_current()
+
+    def _discard(self) -> None:
+        # les ZIP déjà livrés restent: ils sont complets
+        zf, self._zf = self._zf, None
+        if zf is not None:
+            zf.close()
+            os.unlink(self._zf_path + ".part")
+
+
+class PostZipBatchWriter(_ZipSeriesWriter):
+    """Un ZIP par post (<root>/<shortcode>_<légende>.zip), fermé dès que le dernier média du post est écrit."""
+    def __init__(self, root: str, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _next_path(self, folder: str) -> str:
+        return os.path.join(self.root, folder + ".zip")
+
+    def _end_post(self, folder: str) -> None:
+        self._close_current()
+
+
+class VolumeZipBatchWriter(_ZipSeriesWriter):
+    """
+    Lot découpé en volumes: <dest sans .zip>.001.zip, .002.zip... chacun un ZIP autonome d'au plus
+    `volume_bytes` (un média n'est jamais coupé: un volume ne dépasse que s'il ne contient qu'un
+    média plus gros que la limite). Un post peut être à cheval sur deux volumes.
+    `resume=True` (lot repris): les volumes complets d'une passe précédente restent en place (déjà
+    livrés, peut-être en cours de téléchargement), la numérotation continue après eux et les entrées
+    qu'ils contiennent ne sont pas réécrites; un volume inachevé (.part) est supprimé.
+    """
+    def __init__(self, dest: str, volume_bytes: int = ZIP_VOLUME_BYTES, resume: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.dest = dest
+        self.volume_bytes = max(1, int(volume_bytes))
+        self._delivered: Set[str] = set()  # entrées des volumes d'une passe précédente
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        if resume:
+            self._resume()
+
+    def _resume(self) -> None:
+        while True:
+            path = self.volume_path(self.dest, len(self.outputs) + 1)
+            try:
+                with zipfile.ZipFile(path) as zf:
+                    self._delivered.update(zf.namelist())
+            except (OSError, zipfile.BadZipFile):
+                break
+            self.outputs.append(path)
+        part = self.volume_path(self.dest, len(self.outputs) + 1) + ".part"
+        if os.path.exists(part):
+            os.unlink(part)
+
+    @staticmethod
+    def volume_path(dest: str, n: int) -> str:
+        stem = dest[:-4] if dest.lower().endswith(".zip") else dest
+        return f"{stem}.{n:03d}.zip"
+
+    def _next_path(self, folder: str) -> str:
+        return self.volume_path(self.dest, len(self.outputs) + 1)
+
+    def _write_media(self, folder: str, name: str, src: BinaryIO, size: int, ext: str,
+                     date: Optional[float]) -> None:
+        if f"{folder}/{name}" in self._delivered:
+            metrics.incr("write.already_delivered")
+            return
+        self._make_room(f"{folder}/{name}", size)
+        super()._write_media(folder, name, src, size, ext, date)
+
+    def _write_error(self, folder: str, name: str, text: str, date: Optional[float]) -> None:
+        if f"{folder}/{name}" in self._delivered:
+            return
+        self._make_room(f"{folder}/{name}", len(text.encode("utf-8")))
+        super()._write_error(folder, name, text, date)
+
+    def _make_room(self, arcname: str, size: int) -> None:
+        """Ferme le volume courant si l'entrée (taille non compressée) le ferait dépasser volume_bytes."""
+        zf = self._zf
+        # marge pour l'en-tête local et l'entrée du répertoire central
+        if zf is not None and zf.filelist and zf.fp.tell() + size + 2 * len(arcname.encode()) + 200 > self.volume_bytes:
+            self._close_current()
+
+
+def write_all_to_zip(bundles: List[Dict[str, object]],
+                     dest: Union[str, BinaryIO],
+                     max_workers: int = DL_MAX_WORKERS,
+                     max_per_host: int = DL_MAX_PER_HOST,
+                     compresslevel: int = ZIP_COMPRESSLEVEL,
+                     deflate_png: bool = ZIP_DEFLATE_PNG,
+                     cache: Optional[MediaCache] = None,
+                     refresh: Optional[Callable[[str], dict]] = None) -> None:
+    """
+    Télécharge les médias de `bundles` et les écrit en streaming dans le ZIP `dest` (chemin ou fichier binaire).
+    `refresh(shortcode)`: re-résolution d'un post dont les URLs ont expiré (ex. fetch_post_bundle(..., fresh=True)).
+    """
+    with ZipBatchWriter(dest, max_workers=max_workers, max_per_host=max_per_host,
+                        compresslevel=compresslevel, deflate_png=deflate_png, cache=cache,
+                        refresh=refresh) as writer:
+        for b in bundles:
+            writer.add_bundle(b)
+            writer.pump()
+
+
+def new_archive_path() -> str:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="batch_", suffix=".zip", dir=ARCHIVE_DIR)
+    os.close(fd)
+    return path
+
+
+def download_all_to_file(bundles: List[Dict[str, object]],
+                         max_workers: int = DL_MAX_WORKERS,
+                         max_per_host: int = DL_MAX_PER_HOST,
+                         compresslevel: int = ZIP_COMPRESSLEVEL,
+                         deflate_png: bool = ZIP_DEFLATE_PNG,
+                         cache: Optional[MediaCache] = None,
+                         refresh: Optional[Callable[[str], dict]] = None) -> str:
+    """Construit l'archive sur disque (ARCHIVE_DIR) et retourne son chemin."""
+    path = new_archive_path()
+    try:
+        write_all_to_zip(bundles, path, max_workers=max_workers, max_per_host=max_per_host,
+                         compresslevel=compresslevel, deflate_png=deflate_png, cache=cache, refresh=refresh)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def download_all_as_zip(bundles: List[Dict[str, object]],
+                        max_workers: int = DL_MAX_WORKERS,
+                        max_per_host: int = DL_MAX_PER_HOST,
+                        compresslevel: int = ZIP_COMPRESSLEVEL,
+                        deflate_png: bool = ZIP_DEFLATE_PNG,
+                        cache: Optional[MediaCache] = None,
+                        refresh: Optional[Callable[[str], dict]] = None) -> bytes:
+    """Variante en mémoire (petits lots): retourne les octets du ZIP."""
+    buf = io.BytesIO()
+    write_all_to_zip(bundles, buf, max_workers=max_workers, max_per_host=max_per_host,
+                     compresslevel=compresslevel, deflate_png=deflate_png, cache=cache, refresh=refresh)
+    return buf.getvalue()
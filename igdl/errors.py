@@ -0,0 +1,22 @@
+# igdl/errors.py
+# Exceptions partagées par les modules du cœur.
+
+
+class PostUnavailable(Exception):
+    """Post privé, restreint ou introuvable (résultat négatif, éventuellement servi depuis le cache)."""
+
+
+class CircuitOpenError(Exception):
+    """Le compte / l'IP semble bloqué: on échoue vite au lieu de marteler Instagram."""
+
+
+class UrlExpired(Exception):
+    """URL CDN signée expirée ou refusée (403 / 410): le post est à re-résoudre."""
+
+
+class JobBusy(Exception):
+    """Le même lot est déjà en cours dans un autre processus / onglet."""
+
+
+class JobCancelled(Exception):
+    """Lot annulé depuis l'UI (file de lots, igdl.jobs)."""
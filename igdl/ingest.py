@@ -0,0 +1,199 @@
+# igdl/ingest.py
+# Ingestion en masse de liens: TXT, CSV ou JSONL (fichiers envoyés, fichiers -i, stdin), lus en flux.
+# Chaque lien est normalisé via extract_shortcode puis dédupliqué par shortcode
+# (/p/X/, /reel/X/?igsh=..., /user/p/X/ = un seul post); les lignes invalides sont
+# signalées sans interrompre la lecture. Le type du lien d'origine (/reel/, /tv/) est retenu à
+# part (UrlIngest.kinds): il oriente la résolution (igdl.strategies) sans changer l'URL canonique.
+#
+# Formats:
+# - TXT  : un ou plusieurs liens par ligne (séparés par espaces, virgules ou points-virgules);
+# - CSV  : colonne url / link / lien / permalink / shortcode / code si l'en-tête en a une,
+#          sinon toute cellule contenant un lien Instagram;
+# - JSONL: une chaîne par ligne, ou un objet avec un champ url / link / ... / shortcode.
+
+import csv
+import io
+import itertools
+import json
+import os
+import re
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple, Union
+
+from igdl.urls import extract_shortcode, post_kind, post_url
+
+INGEST_MAX_INVALID = 1000  # lignes invalides détaillées dans le rapport (les suivantes sont seulement comptées)
+
+_SPLIT_RE = re.compile(r"[,\s;]+")
+_BARE_SHORTCODE_RE = re.compile(r"[A-Za-z0-9_\-]{5,64}")
+# forme courante (instagram.com/[user/]p|reel|tv/<code>): évite urlparse sur les gros fichiers
+_FAST_LINK_RE = re.compile(r"^(?:https?://)?(?:www\.)?instagram\.com/(?:[A-Za-z0-9._]+/)?(?:p|reel|tv)/([A-Za-z0-9_\-]+)(?:[/?#]|$)")
+_URL_FIELDS = ("url", "link", "lien", "href", "permalink")
+_SHORTCODE_FIELDS = ("shortcode", "code")
+_FORMATS = {".txt": "txt", ".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl"}
+
+
+class InvalidLine(NamedTuple):
+    line: int
+    source: str
+    text: str
+    error: str
+
+
+def normalize_link(candidate: str, bare_ok: bool = False) -> str:
+    """Shortcode d'un lien (ou d'un shortcode nu si `bare_ok`, ex. colonne "shortcode"). Lève ValueError."""
+    c = candidate.strip().strip("\"'<>()[]")
+    if bare_ok and _BARE_SHORTCODE_RE.fullmatch(c):
+        return c
+    m = _FAST_LINK_RE.match(c)
+    if m:
+        return m.group(1)
+    if "instagram.com" not in c.lower() and "instagr.am" not in c.lower():
+        raise ValueError("pas un lien Instagram")
+    return extract_shortcode(c)
+
+
+def detect_format(name: str, first_line: str) -> str:
+    """'txt', 'csv' ou 'jsonl', d'après l'extension puis la première ligne."""
+    fmt = _FORMATS.get(os.path.splitext(name or "")[1].lower())
+    if fmt:
+        return fmt
+    head = first_line.lstrip("﻿").strip()
+    if head.startswith(("{", '"')):
+        return "jsonl"
+    if "," in head and any(f in head.lower() for f in _URL_FIELDS + _SHORTCODE_FIELDS):
+        return "csv"
+    return "txt"
+
+
+# =========================
+# Lecteurs: (n° de ligne, candidat, shortcode nu accepté)
+# =========================
+def _iter_txt(lines: Iterable[str]) -> Iterator[Tuple[int, str, bool]]:
+    for n, line in enumerate(lines, start=1):
+        for token in _SPLIT_RE.split(line.strip()):
+            if token:
+                yield n, token, False
+
+
+def _iter_csv(lines: Iterable[str]) -> Iterator[Tuple[int, str, bool]]:
+    reader = csv.reader(lines)
+    column, bare_ok = None, False
+    for row in reader:
+        n = reader.line_num
+        if n == 1:
+            header = [c.strip().lstrip("﻿").lower() for c in row]
+            for name in _URL_FIELDS + _SHORTCODE_FIELDS:
+                if name in header:
+                    column, bare_ok = header.index(name), name in _SHORTCODE_FIELDS
+                    break
+            if column is not None:
+                continue  # ligne d'en-tête
+        if column is not None:
+            cell = row[column].strip() if column < len(row) else ""
+            if cell:
+                yield n, cell, bare_ok
+            elif any(c.strip() for c in row):
+                yield n, ",".join(row), False  # colonne vide: signalée comme invalide
+            continue
+        found = [c for c in row if "instagram.com" in c.lower() or "instagr.am" in c.lower()]
+        if found:
+            for c in found:
+                yield n, c, False
+        elif any(c.strip() for c in row):
+            yield n, ",".join(row), False
+
+
+def _iter_jsonl(lines: Iterable[str]) -> Iterator[Tuple[int, str, bool]]:
+    for n, line in enumerate(lines, start=1):
+        line = line.strip().lstrip("﻿")
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            yield n, line, False  # JSON illisible: signalé comme invalide
+            continue
+        if isinstance(obj, str):
+            yield n, obj, False
+        elif isinstance(obj, dict):
+            for name in _URL_FIELDS + _SHORTCODE_FIELDS:
+                if isinstance(obj.get(name), str):
+                    yield n, obj[name], name in _SHORTCODE_FIELDS
+                    break
+            else:
+                yield n, line, False
+        else:
+            yield n, line, False
+
+
+_READERS = {"txt": _iter_txt, "csv": _iter_csv, "jsonl": _iter_jsonl}
+
+
+# =========================
+# Accumulateur
+# =========================
+class UrlIngest:
+    """
+    Liens normalisés (https://www.instagram.com/p/<shortcode>/), dédupliqués par shortcode,
+    dans l'ordre de première apparition, toutes sources confondues; plus le rapport des
+    doublons et lignes invalides. La mémoire ne dépend que du nombre de posts distincts.
+    `kinds`: shortcode -> "reel" / "tv" pour les posts vus d'abord sous cette forme (absent = "p").
+    """
+    def __init__(self, max_invalid: int = INGEST_MAX_INVALID):
+        self.urls: List[str] = []
+        self._seen: Set[str] = set()
+        self.kinds: Dict[str, str] = {}
+        self.links = 0
+        self.duplicates = 0
+        self.invalid: List[InvalidLine] = []
+        self.invalid_count = 0
+        self.max_invalid = int(max_invalid)
+
+    def add(self, candidate: str, line: int = 0, source: str = "", bare_ok: bool = False) -> Optional[str]:
+        """Ajoute un lien; retourne son URL normalisée, ou None (doublon / invalide)."""
+        self.links += 1
+        try:
+            shortcode = normalize_link(candidate, bare_ok)
+        except ValueError as e:
+            self.invalid_count += 1
+            if len(self.invalid) < self.max_invalid:
+                self.invalid.append(InvalidLine(line, source, candidate[:200], str(e)))
+            return None
+        if shortcode in self._seen:
+            self.duplicates += 1
+            return None
+        self._seen.add(shortcode)
+        if "/reel/" in candidate or "/tv/" in candidate:
+            kind = post_kind(candidate.strip().strip("\"'<>()[]"))
+            if kind != "p":
+                self.kinds[shortcode] = kind
+        url = post_url(shortcode)
+        self.urls.append(url)
+        return url
+
+    def feed_text(self, text: str, source: str = "texte") -> "UrlIngest":
+        """Texte libre (zone de saisie, arguments): format TXT."""
+        return self.feed(io.StringIO(text), fmt="txt", source=source)
+
+    def feed(self, stream: Union[TextIO, BinaryIO, Iterable[str]], fmt: str = "auto", source: str = "") -> "UrlIngest":
+        """Lit un flux ligne par ligne (fichier texte ou binaire UTF-8). fmt: 'auto', 'txt', 'csv' ou 'jsonl'."""
+        wrapper = None
+        if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+            stream = wrapper = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+        try:
+            lines = iter(stream)
+            if fmt == "auto":
+                first = next(lines, "")
+                fmt = detect_format(source, first)
+                lines = itertools.chain([first], lines)
+            for n, candidate, bare_ok in _READERS[fmt](lines):
+                self.add(candidate, n, source, bare_ok)
+        finally:
+            if wrapper is not None:
+                wrapper.detach()  # le flux binaire reste à l'appelant (pas fermé avec l'enveloppe)
+        return self
+
+    def report(self) -> dict:
+        return {"links": self.links, "posts": len(self.urls), "duplicates": self.duplicates,
+                "invalid": self.invalid_count,
+                "invalid_lines": [l._asdict() for l in self.invalid]}
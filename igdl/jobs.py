@@ -0,0 +1,624 @@
+# igdl/jobs.py
+# File de lots locale: les lots (résolution + téléchargement + ZIP) tournent dans des processus
+# workers, plus dans le script Streamlit. L'UI soumet un lot, affiche son avancement et sert
+# l'archive depuis le disque: une interaction ou un rechargement de page n'interrompt plus rien,
+# et les lots de plusieurs utilisateurs occupent plusieurs cœurs.
+#
+# - File: SQLite WAL (JOB_QUEUE_PATH), partagée entre processus. Un lot = une ligne (spec, options,
+#   statut queued / running / done / failed / cancelled, avancement, résultat).
+# - JobRunner: un thread répartiteur réserve les lots (claim, transaction IMMEDIATE) et les confie
+#   à JOB_WORKERS processus `python -m igdl.jobs` (une tâche JSON par ligne sur stdin; pas de
+#   multiprocessing: Streamlit remplace __main__ par le script de l'app, qu'un spawn réexécuterait).
+#   Les cookies sessionid ne sont jamais écrits dans la file: ils passent au worker par son stdin.
+#   Après un redémarrage du serveur, un lot authentifié repris de la file utilise les comptes de
+#   l'environnement (IG_SESSIONIDS / IG_SESSIONID).
+# - Un lot par scope d'auth à la fois (JOB_MAX_PER_SCOPE): les limiteurs de débit sont propres à
+#   chaque processus; leur état (débit appris, disjoncteur, quarantaine des comptes) est repris d'un
+#   lot à l'autre via la file, qui sert aussi à l'UI pour l'afficher et le réarmer (JobQueue.limiter_states,
+#   JobQueue.reset_limiters). Un worker ferme les clients HTTP des comptes absents de son nouveau lot.
+# - Un worker tué (heartbeat plus vieux que JOB_STALE_S) rend son lot à la file; le lot reprend
+#   là où il s'était arrêté (igdl.checkpoint).
+# - Sortie: un ZIP, ou des volumes (spec["format"] == "volumes", spec["volume_bytes"]) listés dans
+#   l'avancement dès qu'ils sont complets: l'UI les sert pendant que le lot continue. Un lot repris
+#   garde les volumes déjà livrés et écrit le reste dans les volumes suivants.
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from igdl.cache import CACHE_ROOT, _sqlite
+from igdl.checkpoint import JOB_TTL_S, job_id_for
+
+if TYPE_CHECKING:
+    from igdl.accounts import AccountPool
+
+JOB_QUEUE_PATH = os.getenv("IGDL_JOB_QUEUE", os.path.join(CACHE_ROOT, "queue.sqlite"))
+JOB_WORKERS = int(os.getenv("IGDL_JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+JOB_MAX_PER_SCOPE = int(os.getenv("IGDL_JOB_MAX_PER_SCOPE", "1"))  # lots simultanés par compte / IP
+JOB_HEARTBEAT_S = 10.0
+JOB_STALE_S = 60.0            # lot "running" sans heartbeat depuis plus longtemps: rendu à la file
+JOB_PROGRESS_EVERY_S = 0.5    # écritures d'avancement au plus toutes les N secondes
+JOB_POLL_S = 1.0              # répartiteur: lots soumis par un autre processus
+JOB_LIMITER_SYNC_S = 5.0      # worker: état des limiteurs enregistré (et réarmements lus) toutes les N secondes
+
+JOB_ACTIVE = ("queued", "running")
+
+
+class JobQueue:
+    """Lots soumis et leur état (SQLite WAL, partagé entre processus)."""
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _sqlite(self.path) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, key TEXT NOT NULL, scope TEXT NOT NULL, spec TEXT NOT NULL,
+                options TEXT NOT NULL, status TEXT NOT NULL, submitted REAL NOT NULL, started REAL,
+                finished REAL, heartbeat REAL, owner TEXT, cancel INTEGER NOT NULL DEFAULT 0,
+                progress TEXT, result TEXT, error TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, submitted)")
+            db.execute("""CREATE TABLE IF NOT EXISTS limiters (
+                key TEXT PRIMARY KEY, state TEXT NOT NULL, saved REAL NOT NULL)""")
+
+    _COLUMNS = "id, scope, spec, options, status, submitted, started, finished, cancel, progress, result, error"
+
+    @staticmethod
+    def _row(row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(zip(JobQueue._COLUMNS.split(", "), row))
+        for k in ("spec", "options", "progress", "result"):
+            job[k] = json.loads(job[k]) if job[k] else None
+        return job
+
+    def submit(self, spec: dict, options: dict) -> str:
+        """
+        Ajoute un lot (spec = identité du point de reprise, options = réglages d'exécution).
+        Un lot identique déjà en file ou en cours est réutilisé: son id est retourné.
+        """
+        key = job_id_for({"spec": spec, "profile": options.get("profile")})
+        with _sqlite(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running')",
+                             (key,)).fetchone()
+            if row:
+                return row[0]
+            job_id = uuid.uuid4().hex[:16]
+            db.execute("INSERT INTO jobs (id, key, scope, spec, options, status, submitted) "
+                       "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                       (job_id, key, spec["scope"], json.dumps(spec), json.dumps(options), time.time()))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with _sqlite(self.path) as db:
+            return self._row(db.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def position(self, job_id: str) -> int:
+        """Lots en file avant `job_id` (0 = le prochain)."""
+        with _sqlite(self.path) as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND submitted < "
+                              "(SELECT submitted FROM jobs WHERE id = ?)", (job_id,)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        with _sqlite(self.path) as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') "
+                              "GROUP BY status").fetchall()
+        return {"queued": 0, "running": 0, **dict(rows)}
+
+    def claim(self, owner: str, max_per_scope: int = JOB_MAX_PER_SCOPE) -> Optional[dict]:
+        """Réserve le plus ancien lot en file dont le scope n'a pas déjà `max_per_scope` lots en cours."""
+        now = time.time()
+        with _sqlite(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            # workers disparus (processus tué, serveur arrêté): leurs lots reviennent en file
+            db.execute("UPDATE jobs SET status = 'queued', owner = NULL WHERE status = 'running' AND heartbeat < ?",
+                       (now - JOB_STALE_S,))
+            busy = dict(db.execute("SELECT scope, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY scope"))
+            for job_id, scope in db.execute("SELECT id, scope FROM jobs WHERE status = 'queued' ORDER BY submitted"):
+                if busy.get(scope, 0) < max_per_scope:
+                    db.execute("UPDATE jobs SET status = 'running', owner = ?, started = ?, heartbeat = ? "
+                               "WHERE id = ?", (owner, now, now, job_id))
+                    return self._row(db.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?",
+                                                (job_id,)).fetchone())
+        return None
+
+    def heartbeat(self, job_id: str) -> None:
+        with _sqlite(self.path) as db:
+            db.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+
+    def progress(self, job_id: str, progress: dict) -> bool:
+        """Enregistre l'avancement; retourne True si l'annulation du lot a été demandée."""
+        with _sqlite(self.path) as db:
+            db.execute("UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ?",
+                       (json.dumps(progress), time.time(), job_id))
+            row = db.execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+        """Lot terminé (done / failed / cancelled); sans effet s'il a déjà été rendu à la file entre-temps."""
+        with _sqlite(self.path) as db:
+            db.execute("UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? "
+                       "WHERE id = ? AND status = 'running'",
+                       (status, time.time(), json.dumps(result) if result is not None else None, error, job_id))
+
+    def cancel(self, job_id: str) -> None:
+        """Lot en file: annulé tout de suite. Lot en cours: le worker s'arrête à sa prochaine écriture d'avancement."""
+        with _sqlite(self.path) as db:
+            db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                       (time.time(), job_id))
+            db.execute("UPDATE jobs SET cancel = 1 WHERE id = ? AND status = 'running'", (job_id,))
+
+    def prune(self, ttl: float = JOB_TTL_S) -> None:
+        """Oublie les lots terminés depuis plus de `ttl` secondes (leurs dossiers sont purgés par checkpoint)."""
+        with _sqlite(self.path) as db:
+            db.execute("DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished < ?",
+                       (time.time() - ttl,))
+
+    # ---- état des limiteurs de débit et des comptes, d'un processus worker à l'autre ----
+    # Lignes "scope|meta" / "scope|cdn" (AdaptiveRateLimiter.export), "scope|account" (Account.export)
+    # et "scope|reset" (réarmement demandé par l'UI, appliqué par les workers à leur prochaine synchro).
+    def _limiter_rows(self, scopes: List[str]) -> List[tuple]:
+        with _sqlite(self.path) as db:
+            rows = db.execute("SELECT key, state, saved FROM limiters").fetchall()
+        return [(key.split("|", 1)[0], key.split("|", 1)[1], key, json.loads(state), saved)
+                for key, state, saved in rows if key.split("|", 1)[0] in scopes]
+
+    def load_limiters(self, scopes: List[str], accounts: Optional["AccountPool"] = None) -> float:
+        """Reprend l'état enregistré des `scopes`; retourne l'heure de lecture (pour sync_limiters)."""
+        from igdl.ratelimit import get_rate_limiters
+
+        now = time.time()
+        by_scope = {a.scope: a for a in accounts.accounts} if accounts else {}
+        for scope, kind, key, state, saved in self._limiter_rows(scopes):
+            if kind == "account":
+                if scope in by_scope:
+                    by_scope[scope].restore(state)
+            elif kind != "reset":
+                get_rate_limiters().restore({key: state}, age_s=max(0.0, now - saved))
+        return now
+
+    def save_limiters(self, scopes: List[str], accounts: Optional["AccountPool"] = None) -> None:
+        from igdl.ratelimit import get_rate_limiters
+
+        now = time.time()
+        rows = [(key, json.dumps(state), now) for key, state in get_rate_limiters().export(scopes).items()]
+        if accounts:
+            rows += [(f"{a.scope}|account", json.dumps(a.export()), now) for a in accounts.accounts if a.scope in scopes]
+        with _sqlite(self.path) as db:
+            db.executemany("INSERT OR REPLACE INTO limiters (key, state, saved) VALUES (?, ?, ?)", rows)
+
+    def sync_limiters(self, scopes: List[str], since: float, accounts: Optional["AccountPool"] = None) -> float:
+        """
+        Worker en cours de lot: applique les réarmements demandés depuis `since`, puis enregistre
+        l'état courant (affiché par l'UI). Retourne la nouvelle heure de référence.
+        """
+        from igdl.ratelimit import get_rate_limiters
+
+        now = time.time()
+        reset = [scope for scope, kind, _, _, saved in self._limiter_rows(scopes) if kind == "reset" and saved > since]
+        for scope in reset:
+            get_rate_limiters().reset(scope)
+        if reset and accounts:
+            accounts.reset(reset)
+        self.save_limiters(scopes, accounts)
+        return now
+
+    def limiter_states(self, scopes: List[str]) -> Dict[str, dict]:
+        """
+        État enregistré par les workers (celui que reprend le prochain lot), par scope: limiteur "meta"
+        (débit, disjoncteur, pause imposée) et santé du compte. Scope absent = jamais utilisé par un lot.
+        """
+        from igdl.ratelimit import RateLimiterRegistry
+
+        now = time.time()
+        registry = RateLimiterRegistry()
+        states: Dict[str, dict] = {}
+        for scope, kind, key, state, saved in self._limiter_rows(scopes):
+            if kind == "meta":
+                registry.restore({key: state}, age_s=max(0.0, now - saved))
+                states.setdefault(scope, {}).update(registry.get(scope, "meta").state())
+            elif kind == "account":
+                states.setdefault(scope, {}).update(
+                    {"quarantined_for_s": round(max(0.0, float(state["quarantined_until"]) - now)),
+                     "reason": state["reason"], "ok": state["ok"], "failures": state["failures"]})
+        return states
+
+    def reset_limiters(self, scopes: List[str]) -> None:
+        """Réarme les limiteurs et comptes des `scopes`: état enregistré effacé, workers en cours prévenus."""
+        now = time.time()
+        with _sqlite(self.path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany("DELETE FROM limiters WHERE key >= ? AND key < ?",
+                           [(f"{sc}|", f"{sc}}}") for sc in scopes])
+            db.executemany("INSERT INTO limiters (key, state, saved) VALUES (?, '{}', ?)",
+                           [(f"{sc}|reset", now) for sc in scopes])
+
+
+# =========================
+# Exécution d'un lot (processus worker)
+# =========================
+def execute_job(job_id: str, queue_path: str, sessionids: Optional[List[str]]) -> Optional[dict]:
+    """
+    Point d'entrée du worker: exécute le lot `job_id` et enregistre son issue dans la file.
+    Retourne l'état brut des mesures du lot (BatchMetrics.dump) pour les totaux du serveur.
+    """
+    from igdl import auth, metrics
+    from igdl.errors import JobBusy, JobCancelled
+    from igdl.pipeline import friendly_error
+
+    queue = JobQueue(queue_path)
+    job = queue.get(job_id)
+    if job is None:
+        return None
+    # comptes du lot (en mémoire, depuis le serveur); à défaut ceux de l'environnement du worker
+    auth.set_sessionid_provider((lambda: sessionids[0]) if sessionids else None)
+    auth.set_sessionids_provider((lambda: sessionids) if sessionids else None)
+    if job["options"].get("use_auth") and auth.cache_scope() != job["scope"]:
+        queue.finish(job_id, "failed", error="Cookie sessionid indisponible (serveur redémarré): relance le lot.")
+        return None
+
+    stop = threading.Event()
+
+    def _beat():
+        while not stop.wait(JOB_HEARTBEAT_S):
+            queue.heartbeat(job_id)
+
+    threading.Thread(target=_beat, name="igdl-job-heartbeat", daemon=True).start()
+    batch_metrics = metrics.BatchMetrics()
+    try:
+        with metrics.collect(batch_metrics):
+            result = _run(queue, job, batch_metrics)
+        queue.finish(job_id, "done", result)
+    except JobCancelled:
+        queue.finish(job_id, "cancelled")
+    except JobBusy as e:
+        queue.finish(job_id, "failed", error=str(e))
+    except Exception as e:
+        queue.finish(job_id, "failed", error=friendly_error(e))
+    finally:
+        stop.set()
+    return batch_metrics.dump()
+
+
+def _list_volumes(volume_dir: str) -> List[str]:
+    """Volumes ZIP complets d'un lot, dans l'ordre (le volume en cours d'écriture, en .part, exclu)."""
+    try:
+        names = os.listdir(volume_dir)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(volume_dir, n) for n in sorted(names) if n.endswith(".zip")]
+
+
+_client_scopes: set = set()  # scopes dont le worker garde des clients (sessions HTTP, contextes Instaloader)
+
+
+def _drop_stale_clients(scopes: List[str]) -> None:
+    """Worker: ferme les clients des scopes absents du nouveau lot (sessionid changé ou retiré entre-temps)."""
+    from igdl.clients import get_client_pool
+
+    for scope in _client_scopes - set(scopes):
+        get_client_pool().invalidate(scope)
+    _client_scopes.clear()
+    _client_scopes.update(scopes)
+
+
+def _run(queue: JobQueue, job: dict, batch_metrics) -> dict:
+    """Le lot lui-même: synchro de profil éventuelle, pipeline résolution → ZIP, point de reprise."""
+    from igdl.accounts import get_account_pool
+    from igdl.cache import get_bundle_cache, get_media_cache
+    from igdl.checkpoint import BatchCheckpoint
+    from igdl.download import ZIP_VOLUME_BYTES, VolumeZipBatchWriter, ZipBatchWriter
+    from igdl.errors import JobCancelled
+    from igdl.ingest import UrlIngest
+    from igdl.pipeline import run_batch_pipeline
+    from igdl.profile import ArchiveIndex, ProfileSync
+    from igdl.ratelimit import get_rate_limiters
+    from igdl.renditions import RenditionPolicy, RenditionSelector
+    from igdl.resolve import fetch_post_bundle
+    from igdl.transcode import TRANSCODE_WORKERS, TranscodePolicy
+    from igdl.urls import extract_shortcode
+
+    job_id, spec, options = job["id"], job["spec"], job["options"]
+    scope, use_auth = spec["scope"], bool(options.get("use_auth"))
+    pool = get_account_pool() if use_auth else None
+    scopes = [scope] + ([a.scope for a in pool.accounts] if pool else [])
+    _drop_stale_clients(scopes)
+    limiter_sync = [queue.load_limiters(scopes, pool)]
+    if options.get("meta_rate"):
+        for sc in scopes:
+            get_rate_limiters().get(sc, "meta", rate=options["meta_rate"])  # débit initial (appliqué s'il a changé)
+    bundle_cache = get_bundle_cache()
+    stats_before = bundle_cache.stats()
+    result: dict = {}
+    last = [0.0]
+
+    def _progress(stage: str, force: bool = False, **fields) -> None:
+        now = time.monotonic()
+        if force or now - last[0] >= JOB_PROGRESS_EVERY_S:
+            last[0] = now
+            if queue.progress(job_id, {"stage": stage, **fields}):
+                raise JobCancelled()
+            if time.time() - limiter_sync[0] >= JOB_LIMITER_SYNC_S:
+                limiter_sync[0] = queue.sync_limiters(scopes, limiter_sync[0], pool)
+
+    kinds = options.get("kinds") or {}  # shortcode -> "reel" / "tv" (type du lien d'origine)
+    race = options.get("race")
+
+    def _resolve(u: str) -> dict:
+        sc = extract_shortcode(u)
+        return fetch_post_bundle(sc, use_auth=use_auth, scope=scope,
+                                 max_attempts=int(options.get("max_attempts", 5)), cache=bundle_cache,
+                                 kind=kinds.get(sc, "p"), race=race)
+
+    def _refresh(shortcode: str) -> dict:
+        # URLs signées expirées (lot en file depuis longtemps, bundle en cache): cache ignoré
+        return fetch_post_bundle(shortcode, use_auth=use_auth, scope=scope,
+                                 max_attempts=int(options.get("max_attempts", 5)), cache=bundle_cache, fresh=True,
+                                 kind=kinds.get(shortcode, "p"), race=race)
+
+    try:
+        ingest = UrlIngest()
+        for u in spec["urls"]:
+            ingest.add(u, source="lot")
+        sync = None
+        if options.get("profile"):
+            _progress("profile", force=True)
+            sync = ProfileSync(ArchiveIndex(), options["profile"], use_auth)
+            for u in sync.urls:
+                ingest.add(u, source=f"@{sync.username}")
+            result["profile"] = {"username": sync.username, "new": sync.new, "pending": len(sync.urls) - sync.new,
+                                 "archived": sync.index.count(sync.username)}
+            _resolve = sync.wrap_resolve(_resolve)
+        urls = ingest.urls
+        result["urls"] = len(urls)
+        if not urls:
+            return result
+
+        ck = BatchCheckpoint.open({**spec, "urls": urls})
+        result["checkpoint"] = ck.dir
+        zip_path = ck.archive_path
+        # volumes (spec["format"] == "volumes"): ZIP autonomes livrés au fil du lot, servis avant la fin
+        volumes = spec.get("format") == "volumes"
+        volume_dir = os.path.join(ck.dir, "volumes")
+        failed_shortcodes = set()
+        try:
+            if ck.complete and (_list_volumes(volume_dir) if volumes else os.path.exists(zip_path)):
+                result["reused"] = True
+                bundles, errors = ck.bundles(urls), []
+                total = written = sum(len(b["media"]) for b in bundles)
+                media_failed, bytes_saved = 0, 0
+                bytes_written = sum(os.path.getsize(p) for p in _list_volumes(volume_dir)) if volumes else \
+                    os.path.getsize(zip_path)
+            else:
+                state = ck.state()
+                if state["resolved"] or state["media_done"]:
+                    result["resumed"] = state
+                part_path = zip_path + ".part"
+                common = dict(max_workers=int(options.get("workers", 8)), max_per_host=int(options.get("per_host", 4)),
+                              compresslevel=int(spec["compresslevel"]), deflate_png=bool(spec["deflate_png"]),
+                              cache=get_media_cache() if options.get("use_media_cache", True) else None,
+                              checkpoint=ck, refresh=_refresh,
+                              transcode=TranscodePolicy(**spec["transcode"]) if spec.get("transcode") else None,
+                              # les JOB_WORKERS processus se partagent les cœurs
+                              transcode_workers=max(1, TRANSCODE_WORKERS // JOB_WORKERS))
+                if volumes:
+                    # volumes d'une passe précédente: gardés (déjà proposés au téléchargement), la suite les complète
+                    writer = VolumeZipBatchWriter(os.path.join(volume_dir, "archive.zip"),
+                                                  int(spec.get("volume_bytes") or ZIP_VOLUME_BYTES), resume=True,
+                                                  **common)
+                else:
+                    writer = ZipBatchWriter(part_path, **common)
+                try:
+                    with writer:
+                        resolve = ck.wrap_resolve(_resolve)
+                        if spec.get("renditions"):
+                            # au-dessus du point de reprise: le manifeste garde toutes les renditions
+                            policy = RenditionPolicy(**spec["renditions"])
+                            resolve = RenditionSelector(policy, len(urls)).wrap_resolve(resolve)
+                        bundles, errors = run_batch_pipeline(
+                            urls, resolve, writer,
+                            on_progress=lambda r, n, w, m: _progress(
+                                "batch", resolved=r, total=n, written=w, total_media=m,
+                                volumes=list(writer.outputs) if volumes else None),
+                            resolve_workers=int(options.get("resolve_workers", 1)),
+                        )
+                except BaseException:
+                    if not volumes:
+                        os.unlink(part_path)
+                    raise
+                failed_shortcodes = writer.failed_shortcodes
+                total, written, media_failed, bytes_written, bytes_saved = (
+                    writer.total, writer.written, writer.failed, writer.bytes_written, writer.bytes_saved)
+                if volumes:
+                    bytes_written = sum(os.path.getsize(p) for p in writer.outputs)  # volumes repris compris
+                    if bundles:
+                        ck.finish(complete=not errors and not writer.failed)
+                elif bundles:
+                    os.replace(part_path, zip_path)
+                    ck.finish(complete=not errors and not writer.failed)
+                else:
+                    os.unlink(part_path)
+        finally:
+            ck.close()
+
+        if sync is not None:
+            result["profile"]["record"] = sync.record(bundles, failed_shortcodes)
+        bundle_cache.prune()
+        stats_after = bundle_cache.stats()
+        result.update({
+            "archive": zip_path if bundles and not volumes else None,
+            "volumes": _list_volumes(volume_dir) if bundles and volumes else None,
+            "posts": len(bundles),
+            "media": total,
+            "media_written": written,
+            "media_failed": media_failed,
+            "bytes": bytes_written,
+            "bytes_saved": bytes_saved,
+            "errors": errors,
+            "bundle_cache": {k: stats_after[k] - stats_before[k] for k in ("hits", "negative_hits", "misses")},
+            "accounts": pool.state() if pool else None,
+            "metrics": batch_metrics.snapshot(),
+            "sleep_s": round(batch_metrics.sleep_total(), 3),
+            "metrics_prometheus": batch_metrics.to_prometheus(),
+        })
+        return result
+    finally:
+        queue.sync_limiters(scopes, limiter_sync[0], pool)
+
+
+# =========================
+# Processus worker: python -m igdl.jobs
+# =========================
+def worker_main() -> int:
+    """
+    Boucle d'un processus worker: une tâche JSON par ligne sur stdin ({"job", "queue", "sessionids"}),
+    une réponse JSON par ligne sur le stdout d'origine ({"job", "metrics"}). Fin sur EOF.
+    Le reste de la sortie (prints de bibliothèques) part sur stderr.
+    """
+    out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    for line in sys.stdin:
+        task = json.loads(line)
+        state = execute_job(task["job"], task["queue"], task.get("sessionids"))
+        out.write(json.dumps({"job": task["job"], "metrics": state}) + "\n")
+        out.flush()
+    return 0
+
+
+# =========================
+# Répartiteur (processus serveur)
+# =========================
+class _Worker:
+    """Un processus `python -m igdl.jobs` et le lot qu'il traite."""
+    def __init__(self):
+        import igdl
+
+        env = dict(os.environ)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(igdl.__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+        self.proc = subprocess.Popen([sys.executable, "-m", "igdl.jobs"], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, env=env, text=True, encoding="utf-8")
+        self.job: Optional[str] = None
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+
+class JobRunner:
+    """
+    Confie les lots de la file à JOB_WORKERS processus workers (démarrés à la demande, relancés
+    s'ils meurent). Plusieurs serveurs peuvent partager la même file: la réservation est atomique.
+    """
+    def __init__(self, queue: JobQueue, workers: int = JOB_WORKERS):
+        self.queue = queue
+        self.workers = max(1, int(workers))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._secrets: Dict[str, List[str]] = {}  # job -> sessionids, en mémoire seulement
+        self._pool: List[_Worker] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, spec: dict, options: dict, sessionids: Optional[List[str]] = None) -> str:
+        job_id = self.queue.submit(spec, options)
+        if sessionids and self.queue.get(job_id)["status"] == "queued":
+            with self._lock:
+                self._secrets[job_id] = list(sessionids)
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="igdl-jobs", daemon=True)
+                self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(JOB_POLL_S)
+            self._wake.clear()
+            try:
+                self._dispatch()
+            except Exception:
+                time.sleep(JOB_POLL_S)  # file momentanément verrouillée / illisible: on réessaie
+
+    def _idle_worker(self) -> Optional[_Worker]:
+        with self._lock:
+            self._pool = [w for w in self._pool if w.alive() or w.job is not None]
+            for w in self._pool:
+                if w.job is None:
+                    return w
+            if len(self._pool) < self.workers:
+                w = _Worker()
+                self._pool.append(w)
+                threading.Thread(target=self._read, args=(w,), name="igdl-jobs-worker", daemon=True).start()
+                return w
+        return None
+
+    def _dispatch(self) -> None:
+        while True:
+            w = self._idle_worker()
+            if w is None:
+                return
+            job = self.queue.claim(self.owner)
+            if job is None:
+                return
+            with self._lock:
+                w.job = job["id"]
+                sids = self._secrets.pop(job["id"], None)
+            try:
+                w.proc.stdin.write(json.dumps({"job": job["id"], "queue": self.queue.path, "sessionids": sids}) + "\n")
+                w.proc.stdin.flush()
+            except OSError:
+                pass  # worker mort: son lecteur marque le lot en échec
+
+    def _read(self, w: _Worker) -> None:
+        """Réponses d'un worker; à sa mort, son lot en cours échoue (une relance reprend au point de reprise)."""
+        from igdl import metrics
+
+        for line in w.proc.stdout:
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                continue
+            if reply.get("metrics"):
+                metrics.PROCESS_METRICS.merge(reply["metrics"])  # export Prometheus du serveur: lots des workers compris
+            with self._lock:
+                w.job = None
+            self._wake.set()
+        w.proc.wait()
+        with self._lock:
+            job_id, w.job = w.job, None
+        if job_id is not None:
+            self.queue.finish(job_id, "failed", error="Le processus worker s'est arrêté: relance le lot pour reprendre.")
+        self._wake.set()
+
+    def state(self) -> Dict[str, int]:
+        return {"workers": self.workers, **self.queue.counts()}
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Répartiteur du processus (démarré au premier appel), sur la file JOB_QUEUE_PATH."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            queue = JobQueue()
+            queue.prune()
+            _runner = JobRunner(queue)
+            _runner.start()
+        return _runner
+
+
+if __name__ == "__main__":
+    sys.exit(worker_main())
@@ -0,0 +1,232 @@
+# igdl/metrics.py
+# Instrumentation du chemin chaud: durées, octets, tentatives, hits de cache et pauses.
+#
+# Un lot active un collecteur (`with collect() as m:`); le code instrumenté enregistre dans le
+# collecteur actif (contextvars: propagé aux threads du pipeline et du téléchargement) et dans
+# les totaux du processus (PROCESS_METRICS), exposés au format Prometheus.
+#
+# Durées (secondes):
+#   resolve.post          fetch_post_bundle (cache compris)     resolve.instaloader   Post.from_shortcode (tentatives comprises)
+#   resolve.og_scrape     page og:video / og:image              resolve.profile       listage des nouveaux posts d'un profil
+#   resolve.embed_scrape  page embed du post                    resolve.strategy.<s>  une stratégie de résolution (graphql, embed, og)
+#   download.media        transfert CDN d'un média
+#   write.media           copie / compression dans la destination
+#   transcode.image       réencodage d'une photo (file d'attente du pool de processus comprise)
+#   sleep.rate_limit.*    attente d'un jeton (meta / cdn)       sleep.backoff.cdn     pause entre deux tentatives CDN
+#   sleep.instaloader     pause aléatoire d'Instaloader avant chaque requête
+#   sleep.instaloader_rate  pause imposée par le RateController d'Instaloader (fenêtre de requêtes, 429)
+# Compteurs:
+#   resolve.retries, resolve.throttled, cache.bundle.{hit,negative_hit,miss,refresh}, cache.media.{hit,miss},
+#   checkpoint.{bundle_hit,media_hit}, profile.{new,known}, download.{bytes,retries,resumed,failed},
+#   write.{bytes,linked,archives,already_delivered},
+#   download.{url_expired,url_refreshed}, renditions.{downgraded,over_budget,estimated_bytes}, accounts.{requests,failover,quarantined}
+#   transcode.{images,kept,bytes_saved}, singleflight.{bundle,media}.{shared,shared_process}
+#   resolve.strategy.<s>.{ok,partial,fail}, resolve.strategy.{deferred_retry,explore}, resolve.fastpath, resolve.race.won
+
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+
+METRICS_SAMPLES = 4096  # durées gardées par nom pour les quantiles (les plus récentes)
+METRICS_QUANTILES = (0.5, 0.95)
+
+
+def _quantile(values, q: float) -> float:
+    s = sorted(values)
+    if not s:
+        return 0.0
+    k = (len(s) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+class _Timer:
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=METRICS_SAMPLES)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+
+class BatchMetrics:
+    """Durées et compteurs d'un lot (ou du processus). Thread-safe."""
+    def __init__(self):
+        self.started = time.time()
+        self._t0 = time.monotonic()
+        self._lock = threading.Lock()
+        self._timers: Dict[str, _Timer] = {}
+        self._counters: Dict[str, float] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            t = self._timers.get(name)
+            if t is None:
+                t = self._timers[name] = _Timer()
+            t.add(seconds)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """{"started", "elapsed_s", "timings": {nom: {count, total_s, mean_ms, p50_ms, p95_ms, max_ms}}, "counters": {...}}"""
+        with self._lock:
+            timings = {}
+            for name, t in sorted(self._timers.items()):
+                timings[name] = {
+                    "count": t.count,
+                    "total_s": round(t.total, 3),
+                    "mean_ms": round(t.total / t.count * 1000, 2),
+                    "p50_ms": round(_quantile(t.samples, 0.5) * 1000, 2),
+                    "p95_ms": round(_quantile(t.samples, 0.95) * 1000, 2),
+                    "max_ms": round(t.max * 1000, 2),
+                }
+            counters = dict(sorted(self._counters.items()))
+        return {"started": self.started, "elapsed_s": round(time.monotonic() - self._t0, 3),
+                "timings": timings, "counters": counters}
+
+    def sleep_total(self) -> float:
+        """Temps cumulé passé en pause (durées sleep.*, tous threads confondus), en secondes."""
+        with self._lock:
+            return sum(t.total for name, t in self._timers.items() if name.startswith("sleep."))
+
+    def dump(self) -> dict:
+        """État brut (échantillons compris), sérialisable: un lot d'un processus worker se fusionne avec merge()."""
+        with self._lock:
+            return {"timers": {name: [t.count, t.total, t.max, list(t.samples)] for name, t in self._timers.items()},
+                    "counters": dict(self._counters)}
+
+    def merge(self, state: dict) -> None:
+        """Ajoute un état issu de dump() (autre collecteur, autre processus)."""
+        with self._lock:
+            for name, (count, total, mx, samples) in state["timers"].items():
+                t = self._timers.get(name)
+                if t is None:
+                    t = self._timers[name] = _Timer()
+                t.count += count
+                t.total += total
+                t.max = max(t.max, mx)
+                t.samples.extend(samples)
+            for name, value in state["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def to_json(self, **extra) -> str:
+        return json.dumps({**self.snapshot(), **extra}, indent=2, ensure_ascii=False)
+
+    def to_prometheus(self, prefix: str = "igdl") -> str:
+        """Format texte Prometheus: un summary `<prefix>_<nom>_seconds` par durée, un counter `<prefix>_<nom>_total` par compteur."""
+        lines = []
+        with self._lock:
+            for name, t in sorted(self._timers.items()):
+                metric = f"{prefix}_{_metric_name(name)}_seconds"
+                lines.append(f"# TYPE {metric} summary")
+                for q in METRICS_QUANTILES:
+                    lines.append(f'{metric}{{quantile="{q}"}} {_quantile(t.samples, q):.6f}')
+                lines.append(f"{metric}_sum {t.total:.6f}")
+                lines.append(f"{metric}_count {t.count}")
+            for name, value in sorted(self._counters.items()):
+                metric = f"{prefix}_{_metric_name(name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+# =========================
+# Collecteur actif
+# =========================
+PROCESS_METRICS = BatchMetrics()  # totaux depuis le démarrage du processus (tous lots confondus)
+
+_current: "contextvars.ContextVar[Optional[BatchMetrics]]" = contextvars.ContextVar("igdl_metrics", default=None)
+
+
+def current() -> Optional[BatchMetrics]:
+    return _current.get()
+
+
+@contextmanager
+def collect(metrics: Optional[BatchMetrics] = None) -> Iterator[BatchMetrics]:
+    """
+    Active un collecteur pour le bloc. Les threads démarrés depuis le bloc n'en héritent
+    que s'ils tournent dans une copie du contexte (contextvars.copy_context().run).
+    """
+    metrics = metrics if metrics is not None else BatchMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def observe(name: str, seconds: float) -> None:
+    PROCESS_METRICS.observe(name, seconds)
+    m = _current.get()
+    if m is not None:
+        m.observe(name, seconds)
+
+
+def incr(name: str, value: float = 1) -> None:
+    PROCESS_METRICS.incr(name, value)
+    m = _current.get()
+    if m is not None:
+        m.incr(name, value)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0)
+
+
+# =========================
+# Export Prometheus (HTTP)
+# =========================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = PROCESS_METRICS.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Sert PROCESS_METRICS sur http://host:port/metrics (une seule fois par processus)."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="igdl-metrics", daemon=True).start()
+        return _server
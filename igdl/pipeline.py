@@ -0,0 +1,150 @@
+# igdl/pipeline.py
+# Pipeline résolution → téléchargement: la résolution des posts et le téléchargement
+# des médias se chevauchent (file bornée = contre-pression sur la résolution).
+
+import contextvars
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from igdl.download import BatchWriter
+from igdl.errors import CircuitOpenError
+from igdl.resolve import NO_MEDIA_MESSAGE
+
+PIPELINE_QUEUE_SIZE = 8  # bundles résolus en attente du téléchargement (contre-pression sur la résolution)
+
+_PIPELINE_DONE = object()
+
+
+def friendly_error(e: Exception) -> str:
+    msg = str(e)
+    if ("Please wait a few minutes" in msg) or ("Unauthorized" in msg) or ("429" in msg):
+        msg = ("Limite Instagram atteinte (rate-limit). "
+               "Active le Mode Safe, augmente le délai entre posts, "
+               "et vérifie ton cookie `sessionid`.")
+    return msg
+
+
+def run_batch_pipeline(urls: List[str],
+                       resolve: Callable[[str], dict],
+                       writer: BatchWriter,
+                       on_resolved: Optional[Callable[[str, Optional[dict], Optional[str]], None]] = None,
+                       on_progress: Optional[Callable[[int, int, int, int], None]] = None,
+                       queue_size: int = PIPELINE_QUEUE_SIZE,
+                       thread_init: Optional[Callable[[threading.Thread], None]] = None,
+                       resolve_workers: int = 1) -> Tuple[List[dict], List[Tuple[str, str]]]:
+    """
+    Producteur / consommateur: un thread résout les URLs (`resolve(url) -> bundle`) et pousse
+    les bundles dans une file bornée; le thread appelant les passe aussitôt au `writer`, qui
+    télécharge pendant que la résolution continue. Durée totale ≈ max(résolution, téléchargement).
+    `resolve_workers` > 1: résolutions en parallèle (une par compte du pool, igdl.accounts),
+    résultats toujours livrés dans l'ordre des URLs.
+    Les callbacks sont appelés dans le thread appelant:
+    - on_resolved(url, bundle|None, erreur|None) à chaque URL traitée;
+    - on_progress(urls_résolues, urls_total, médias_écrits, médias_connus).
+    `thread_init(thread)` est appelé avant le démarrage de chaque thread de résolution.
+    Retourne (bundles avec médias, [(url, erreur)]); le writer reste à fermer par l'appelant.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+    stop = threading.Event()
+    workers = max(1, int(resolve_workers))
+
+    def _resolve_one(u: str):
+        try:
+            return u, resolve(u), None
+        except CircuitOpenError as e:
+            return u, None, e
+        except Exception as e:
+            return u, None, friendly_error(e)
+
+    blocked: List[str] = []  # message du disjoncteur: le reste du lot échoue sans requête
+
+    def _results() -> Iterator[tuple]:
+        """(url, bundle, erreur) dans l'ordre des URLs; jusqu'à `workers` résolutions d'avance."""
+        if workers == 1:
+            for u in urls:
+                yield (u, None, blocked[0]) if blocked else _resolve_one(u)
+            return
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="igdl-resolve",
+                                  initializer=(lambda: thread_init(threading.current_thread())) if thread_init else None)
+        pending: deque = deque()  # Future, ou URL non soumise (disjoncteur ouvert)
+        try:
+            for u in urls:
+                if blocked:
+                    pending.append(u)
+                else:
+                    # chaque résolution hérite du contexte du producteur (collecteur de mesures)
+                    pending.append(pool.submit(contextvars.copy_context().run, _resolve_one, u))
+                while len(pending) >= workers:
+                    yield _settle(pending.popleft())
+            while pending:
+                yield _settle(pending.popleft())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _settle(item) -> tuple:
+        return item.result() if isinstance(item, Future) else (item, None, blocked[0])
+
+    def _produce():
+        results = _results()
+        try:
+            for u, bundle, err in results:
+                if stop.is_set():
+                    return
+                if isinstance(err, CircuitOpenError):
+                    if not blocked:
+                        blocked.append(f"Non traité: {err}")
+                    err = str(err)
+                q.put((u, bundle, err))
+        finally:
+            results.close()  # sortie anticipée: annule les résolutions pas encore démarrées
+            q.put(_PIPELINE_DONE)
+
+    # le thread de résolution hérite du contexte de l'appelant (collecteur de mesures igdl.metrics)
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(_produce,),
+                                name="igdl-resolve", daemon=True)
+    if thread_init is not None:
+        thread_init(producer)
+    producer.start()
+
+    bundles: List[dict] = []
+    errors: List[Tuple[str, str]] = []
+    resolved = 0
+    try:
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                item = None
+            if item is _PIPELINE_DONE:
+                break
+            if item is not None:
+                resolved += 1
+                u, bundle, err = item
+                if bundle is not None and bundle["media"]:
+                    bundles.append(bundle)
+                    writer.add_bundle(bundle)
+                elif err is None:
+                    err = NO_MEDIA_MESSAGE
+                if err:
+                    errors.append((u, err))
+                if on_resolved:
+                    on_resolved(u, bundle, err)
+            writer.pump()
+            if on_progress:
+                on_progress(resolved, len(urls), writer.written, writer.total)
+        while writer.remaining:
+            writer.pump(block=True)
+            if on_progress:
+                on_progress(resolved, len(urls), writer.written, writer.total)
+    finally:
+        # sortie anticipée: on débloque le producteur (file pleine) et on attend sa fin
+        stop.set()
+        while producer.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    return bundles, errors
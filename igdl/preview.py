@@ -0,0 +1,76 @@
+# igdl/preview.py
+# Aperçus légers: une petite image par média au lieu de l'original (photos de plusieurs Mo,
+# vidéos). Par ordre de préférence:
+# 1. la plus petite rendition Instagram d'au moins PREVIEW_SIDE px (champ "preview" du bundle,
+#    couverture comprise pour les vidéos: voir resolve);
+# 2. une miniature JPEG faite côté serveur depuis le fichier déjà téléchargé (Pillow, optionnel),
+#    gardée dans PREVIEW_CACHE_DIR;
+# 3. l'URL d'origine (photos seulement: comportement d'avant).
+# L'UI pagine les aperçus (PREVIEW_PAGE_SIZE) et ne les calcule que pour la page affichée.
+
+import hashlib
+import os
+from typing import List, Optional
+
+from igdl.cache import CACHE_ROOT
+
+PREVIEW_SIDE = int(os.getenv("IGDL_PREVIEW_SIDE", "320"))  # grand côté visé (pixels)
+PREVIEW_PAGE_SIZE = 24
+PREVIEW_CACHE_DIR = os.getenv("IGDL_PREVIEW_CACHE_DIR", os.path.join(CACHE_ROOT, "previews"))
+PREVIEW_JPEG_QUALITY = 80
+
+
+def pick_preview(renditions: List[dict], side: int = PREVIEW_SIDE) -> Optional[str]:
+    """URL de la plus petite rendition dont le grand côté >= `side` (sinon la plus grande); None si aucune."""
+    sized = [r for r in renditions if r.get("width") and r.get("height")]
+    if not sized:
+        return None
+    big_enough = [r for r in sized if max(r["width"], r["height"]) >= side]
+    if big_enough:
+        return min(big_enough, key=lambda r: r["width"] * r["height"])["url"]
+    return max(sized, key=lambda r: r["width"] * r["height"])["url"]
+
+
+def make_thumbnail(path: str, side: int = PREVIEW_SIDE, cache_dir: str = PREVIEW_CACHE_DIR) -> Optional[str]:
+    """
+    Miniature JPEG (grand côté <= `side`) d'une image locale, mise en cache (clé: chemin, taille, date).
+    None si Pillow est absent ou si le fichier n'est pas une image lisible (vidéo...).
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{side}".encode()).hexdigest()
+    thumb = os.path.join(cache_dir, key[:2], key + ".jpg")
+    if os.path.exists(thumb):
+        return thumb
+    try:
+        with Image.open(path) as im:
+            im.draft("RGB", (side, side))  # JPEG: décodage directement à taille réduite
+            im = im.convert("RGB")
+            im.thumbnail((side, side))
+            os.makedirs(os.path.dirname(thumb), exist_ok=True)
+            tmp = thumb + f".{os.getpid()}.tmp"
+            im.save(tmp, "JPEG", quality=PREVIEW_JPEG_QUALITY, optimize=True)
+        os.replace(tmp, thumb)
+    except Exception:
+        return None
+    return thumb
+
+
+def preview_source(item: dict, local_path: Optional[str] = None) -> Optional[str]:
+    """Source d'aperçu d'un média (URL ou chemin local); None si rien de léger n'est disponible (vidéo)."""
+    if item.get("preview"):
+        return item["preview"]
+    url = pick_preview(item.get("renditions") or []) if item["kind"] == "photo" else None
+    if url:
+        return url
+    if local_path and item["kind"] == "photo":
+        thumb = make_thumbnail(local_path)
+        if thumb:
+            return thumb
+    return item["url"] if item["kind"] == "photo" else None
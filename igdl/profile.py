@@ -0,0 +1,146 @@
+# igdl/profile.py
+# Synchro incrémentale d'un profil: les posts sont parcourus du plus récent au plus ancien
+# et le parcours s'arrête au premier post déjà archivé (index local SQLite). Une synchro
+# quotidienne ne résout et ne télécharge donc que les nouveaux posts.
+#
+# Posts épinglés: jusqu'à PROFILE_PINNED_MAX posts peuvent précéder la grille chronologique.
+# Un post connu dans ces premières positions est ignoré sans arrêter le parcours.
+# Un post dont un média a échoué reste "en attente" dans l'index: la synchro suivante le
+# reprend par son shortcode, même s'il est plus ancien que le point d'arrêt.
+
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from igdl import metrics
+from igdl.accounts import with_account
+from igdl.auth import cache_scope
+from igdl.cache import CACHE_ROOT, _sqlite
+from igdl.clients import instaloader_client
+from igdl.ratelimit import get_rate_limiters
+from igdl.resolve import bundle_from_post, is_blocking_error, is_transient_error
+from igdl.urls import extract_shortcode, post_url
+
+ARCHIVE_INDEX_PATH = os.getenv("IGDL_ARCHIVE_INDEX", os.path.join(CACHE_ROOT, "archive.sqlite"))
+PROFILE_PINNED_MAX = 3  # posts épinglés possibles en tête de profil (hors ordre chronologique)
+
+
+class ArchiveIndex:
+    """Shortcodes déjà archivés (ou en attente de nouvel essai), par profil (SQLite WAL, partagé entre processus)."""
+    def __init__(self, path: str = ARCHIVE_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _sqlite(self.path) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS archived (
+                username TEXT NOT NULL, shortcode TEXT NOT NULL, date INTEGER, archived REAL NOT NULL,
+                complete INTEGER NOT NULL, PRIMARY KEY (username, shortcode))""")
+
+    def contains(self, username: str, shortcode: str) -> bool:
+        """Post archivé en entier (un post en attente n'est pas "connu")."""
+        with _sqlite(self.path) as db:
+            return db.execute("SELECT 1 FROM archived WHERE username = ? AND shortcode = ? AND complete = 1",
+                              (username, shortcode)).fetchone() is not None
+
+    def pending(self, username: str) -> List[str]:
+        """Shortcodes en attente (échec lors d'une synchro précédente), du plus récent au plus ancien."""
+        with _sqlite(self.path) as db:
+            rows = db.execute("SELECT shortcode FROM archived WHERE username = ? AND complete = 0 "
+                              "ORDER BY date DESC", (username,)).fetchall()
+        return [r[0] for r in rows]
+
+    def record(self, username: str, bundles: Iterable[dict], failed_shortcodes: Iterable[str] = ()) -> Dict[str, int]:
+        """Enregistre les posts traités: archivés en entier, ou en attente si un de leurs médias a échoué."""
+        failed = set(failed_shortcodes)
+        now = time.time()
+        rows = [(username, b["shortcode"], b.get("date"), now, int(bool(b["media"]) and b["shortcode"] not in failed))
+                for b in bundles]
+        with _sqlite(self.path) as db:
+            db.executemany("INSERT INTO archived (username, shortcode, date, archived, complete) VALUES (?, ?, ?, ?, ?) "
+                           "ON CONFLICT (username, shortcode) DO UPDATE SET date = COALESCE(excluded.date, date), "
+                           "archived = excluded.archived, complete = excluded.complete", rows)
+        done = sum(r[4] for r in rows)
+        return {"archived": done, "pending": len(rows) - done}
+
+    def count(self, username: str) -> int:
+        with _sqlite(self.path) as db:
+            return db.execute("SELECT COUNT(*) FROM archived WHERE username = ? AND complete = 1",
+                              (username,)).fetchone()[0]
+
+    def forget(self, username: str) -> None:
+        """Oublie un profil: la prochaine synchro le reprend en entier."""
+        with _sqlite(self.path) as db:
+            db.execute("DELETE FROM archived WHERE username = ?", (username,))
+
+
+def list_new_posts(username: str, index: ArchiveIndex, use_auth: bool,
+                   full: bool = False, limit: Optional[int] = None) -> List[dict]:
+    """
+    Bundles des posts de `username` absents de l'index, du plus récent au plus ancien.
+    S'arrête au premier post connu (hors épinglés), sauf `full=True` qui parcourt tout le profil.
+    `limit` borne le nombre de nouveaux posts. Les bundles viennent directement du flux du
+    profil: pas de requête par post. Les posts en attente (index.pending) sont à reprendre à part.
+    """
+    from instaloader import Profile
+
+    def _list() -> List[dict]:
+        limiter = get_rate_limiters().get(cache_scope(), "meta")
+        bundles: List[dict] = []
+        with instaloader_client(use_auth) as L:
+            metrics.observe("sleep.rate_limit.meta", limiter.acquire())
+            try:
+                profile = Profile.from_username(L.context, username)
+                # la pagination passe par le RateController d'Instaloader (pauses mesurées, cf. clients)
+                for pos, post in enumerate(profile.get_posts()):
+                    if index.contains(username, post.shortcode):
+                        metrics.incr("profile.known")
+                        if full or pos < PROFILE_PINNED_MAX or getattr(post, "is_pinned", False):
+                            continue
+                        break
+                    bundles.append(bundle_from_post(post))
+                    metrics.incr("profile.new")
+                    if limit and len(bundles) >= limit:
+                        break
+            except Exception as e:
+                if is_blocking_error(e):
+                    limiter.trip(f"Compte bloqué par Instagram (checkpoint): {e}")
+                raise
+        return bundles
+
+    with metrics.timed("resolve.profile"):
+        # tout le parcours avec un même compte (pagination); un compte bloqué fait recommencer avec un autre
+        return with_account(_list, use_auth, failover=is_transient_error)
+
+
+class ProfileSync:
+    """
+    Synchro d'un profil: URLs à traiter (nouveaux posts, puis posts en attente) et bundles
+    déjà obtenus en listant le profil. Après le lot, record() met l'index à jour.
+    """
+    def __init__(self, index: ArchiveIndex, username: str, use_auth: bool,
+                 full: bool = False, limit: Optional[int] = None):
+        self.index = index
+        self.username = username
+        self.bundles: Dict[str, dict] = {post_url(b["shortcode"]): b
+                                         for b in list_new_posts(username, index, use_auth, full, limit)}
+        self.new = len(self.bundles)
+        self.urls = list(self.bundles) + [u for u in map(post_url, index.pending(username)) if u not in self.bundles]
+
+    def wrap_resolve(self, resolve: Callable[[str], dict]) -> Callable[[str], dict]:
+        """Enveloppe `resolve(url)`: les posts listés avec leurs médias ne refont aucune requête."""
+        def _resolve(url: str) -> dict:
+            b = self.bundles.get(url)
+            if b is not None and b["media"]:
+                return b
+            return resolve(url)  # post en attente, ou sans média dans le flux (fallback OG)
+        return _resolve
+
+    def record(self, resolved: List[dict], failed_shortcodes: Iterable[str] = ()) -> Dict[str, int]:
+        """Met l'index à jour: posts complets archivés, posts en erreur ou incomplets en attente."""
+        by_shortcode = {b["shortcode"]: b for b in resolved}
+        rows = []
+        for u in self.urls:
+            sc = extract_shortcode(u)
+            listed = self.bundles.get(u)
+            rows.append(by_shortcode.get(sc) or {"shortcode": sc, "date": listed and listed.get("date"), "media": []})
+        return self.index.record(self.username, rows, failed_shortcodes)
@@ -0,0 +1,234 @@
+# igdl/ratelimit.py
+# Limiteur de débit adaptatif (token bucket + AIMD + disjoncteur).
+# Une instance par (scope d'auth, classe d'endpoint): "meta" = GraphQL / pages IG, "cdn" = médias.
+
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from igdl.errors import CircuitOpenError
+
+RL_CONFIG = {
+    "meta": {"rate": 1.0, "min_rate": 0.02, "max_rate": 4.0, "burst": 2.0, "breaker_threshold": 4},
+    "cdn": {"rate": 50.0, "min_rate": 1.0, "max_rate": 200.0, "burst": 20.0, "breaker_threshold": 10},
+}
+RL_INCREASE = 0.05            # hausse additive (req/s) par seconde de succès
+RL_DECREASE = 0.5             # baisse multiplicative sur limitation
+RL_DECREASE_COOLDOWN_S = 2.0  # une seule baisse par "événement" de limitation (429 en rafale)
+RL_BASE_BACKOFF_S = 2.0       # pause après limitation sans Retry-After, doublée à chaque récidive
+RL_MAX_BACKOFF_S = 120.0
+RL_BREAKER_COOLDOWN_S = 600.0 # durée d'ouverture du disjoncteur
+
+# Blocage du compte: ouvre le disjoncteur. "Redirected to login page" n'en fait pas partie: en invité, c'est un
+# post qui exige une connexion (échec de ce post seulement), pas un blocage du scope anonyme partagé.
+BLOCKING_MARKERS = ("checkpoint_required", "challenge_required", "feedback_required")
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After en secondes (la forme date HTTP est aussi acceptée)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket dont le débit s'adapte (AIMD): baisse multiplicative sur 429 / "Please wait",
+    remontée additive lente sur succès. Honore Retry-After et ouvre un disjoncteur après
+    `breaker_threshold` limitations consécutives (ou immédiatement sur checkpoint).
+    """
+    def __init__(self, rate: float, min_rate: float, max_rate: float, burst: float, breaker_threshold: int):
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.rate = min(self.max_rate, max(self.min_rate, float(rate)))
+        self.initial_rate = self.rate
+        self.burst = max(1.0, float(burst))
+        self.breaker_threshold = int(breaker_threshold)
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._throttle_streak = 0
+        self._open_until = 0.0
+        self._open_reason = ""
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def acquire(self) -> float:
+        """Attend un jeton (et la fin d'un Retry-After éventuel). Retourne le temps attendu."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._open_until:
+                    raise CircuitOpenError(self._open_reason)
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                else:
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def ready_in(self) -> float:
+        """Secondes avant le prochain jeton (0 = tout de suite, inf = disjoncteur ouvert). Ne consomme rien."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._open_until:
+                return float("inf")
+            self._refill(now)
+            wait = 0.0 if self._tokens >= 1.0 else (1.0 - self._tokens) / self.rate
+            return max(wait, self._blocked_until - now)
+
+    def set_initial_rate(self, rate: float) -> None:
+        """Nouveau débit de départ réglé par l'utilisateur: appliqué s'il change (le débit appris est gardé sinon)."""
+        with self._lock:
+            rate = min(self.max_rate, max(self.min_rate, float(rate)))
+            if rate != self.initial_rate:
+                self.initial_rate = self.rate = rate
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._throttle_streak = 0
+            # +RL_INCREASE req/s par seconde de succès environ (un succès ≈ 1/rate seconde)
+            self.rate = min(self.max_rate, self.rate + RL_INCREASE / max(self.rate, 1.0))
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease >= RL_DECREASE_COOLDOWN_S:
+                self._last_decrease = now
+                self.rate = max(self.min_rate, self.rate * RL_DECREASE)
+                self._throttle_streak += 1
+            self._tokens = 0.0
+            if retry_after is None:
+                backoff = RL_BASE_BACKOFF_S * (2 ** max(0, self._throttle_streak - 1))
+                retry_after = min(RL_MAX_BACKOFF_S, backoff) * random.uniform(1.0, 1.25)
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+            if self._throttle_streak >= self.breaker_threshold:
+                self._open(now, "Limite Instagram atteinte à répétition: lot interrompu (disjoncteur ouvert).")
+
+    def trip(self, reason: str) -> None:
+        """Ouvre le disjoncteur immédiatement (checkpoint, déconnexion...)."""
+        with self._lock:
+            self._open(time.monotonic(), reason)
+
+    def _open(self, now: float, reason: str) -> None:
+        self._open_until = now + RL_BREAKER_COOLDOWN_S
+        self._open_reason = reason
+
+    def reset(self) -> None:
+        with self._lock:
+            self._open_until = self._blocked_until = 0.0
+            self._throttle_streak = 0
+
+    def state(self) -> Dict[str, object]:
+        with self._lock:
+            now = time.monotonic()
+            return {"rate": round(self.rate, 3), "open": now < self._open_until,
+                    "blocked_for_s": round(max(0.0, self._blocked_until - now), 1)}
+
+    def export(self) -> Dict[str, object]:
+        """État transmissible à un autre processus (durées restantes: les horloges monotones diffèrent)."""
+        with self._lock:
+            now = time.monotonic()
+            return {"rate": self.rate, "initial_rate": self.initial_rate, "throttle_streak": self._throttle_streak, "open_reason": self._open_reason,
+                    "open_for_s": max(0.0, self._open_until - now), "blocked_for_s": max(0.0, self._blocked_until - now)}
+
+    def restore(self, state: Dict[str, object], age_s: float = 0.0) -> None:
+        """Reprend un état exporté il y a `age_s` secondes (débit appris, pause imposée, disjoncteur)."""
+        with self._lock:
+            now = time.monotonic()
+            self.rate = min(self.max_rate, max(self.min_rate, float(state["rate"])))
+            self.initial_rate = float(state.get("initial_rate", self.initial_rate))
+            self._throttle_streak = int(state["throttle_streak"])
+            self._blocked_until = max(self._blocked_until, now + float(state["blocked_for_s"]) - age_s)
+            if float(state["open_for_s"]) > age_s:
+                self._open(now - age_s + float(state["open_for_s"]) - RL_BREAKER_COOLDOWN_S, str(state["open_reason"]))
+
+
+class RateLimiterRegistry:
+    """Limiteurs partagés par (scope d'auth, classe d'endpoint)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limiters: Dict[Tuple[str, str], AdaptiveRateLimiter] = {}
+
+    def get(self, scope: str, endpoint: str, rate: Optional[float] = None) -> AdaptiveRateLimiter:
+        """`rate` = débit initial réglé: à la création, puis appliqué à nouveau seulement s'il change."""
+        with self._lock:
+            lim = self._limiters.get((scope, endpoint))
+            if lim is None:
+                cfg = dict(RL_CONFIG[endpoint])
+                if rate:
+                    cfg["rate"] = rate
+                lim = self._limiters[(scope, endpoint)] = AdaptiveRateLimiter(**cfg)
+                return lim
+        if rate:
+            lim.set_initial_rate(rate)  # hors du verrou du registre: le limiteur a le sien
+        return lim
+
+    def reset(self, scope: str) -> None:
+        with self._lock:
+            for (sc, _), lim in self._limiters.items():
+                if sc == scope:
+                    lim.reset()
+
+    def export(self, scopes) -> Dict[str, Dict[str, object]]:
+        """États des limiteurs des `scopes` ("scope|endpoint" -> état), pour un autre processus."""
+        with self._lock:
+            items = [(k, lim) for k, lim in self._limiters.items() if k[0] in scopes]
+        return {f"{sc}|{ep}": lim.export() for (sc, ep), lim in items}
+
+    def restore(self, states: Dict[str, Dict[str, object]], age_s: float = 0.0) -> None:
+        for key, state in states.items():
+            scope, endpoint = key.split("|", 1)
+            if endpoint in RL_CONFIG:
+                self.get(scope, endpoint).restore(state, age_s)
+
+
+def _endpoint_class(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return "meta" if host == "instagram.com" or host.endswith(".instagram.com") else "cdn"
+
+
+def install_rate_hooks(s: requests.Session, limiters: RateLimiterRegistry, scope: str) -> None:
+    """Hook de réponse: chaque 429/503 ralentit le limiteur concerné (Retry-After inclus), chaque 2xx le fait remonter."""
+    def _hook(r, *args, **kwargs):
+        lim = limiters.get(scope, _endpoint_class(r.url))
+        if r.status_code in (429, 503):
+            lim.on_throttle(_parse_retry_after(r.headers.get("Retry-After")))
+        elif 200 <= r.status_code < 300:
+            lim.on_success()
+        return r
+    s.hooks["response"].append(_hook)
+
+
+_registry: Optional[RateLimiterRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiters() -> RateLimiterRegistry:
+    """Un seul registre par processus: l'état de limitation est partagé par tous les lots d'un compte."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = RateLimiterRegistry()
+        return _registry
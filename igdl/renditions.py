@@ -0,0 +1,151 @@
+# igdl/renditions.py
+# Choix de la rendition (taille) de chaque média, parmi celles décrites par Instagram
+# (display_resources / image_versions2, video_versions: voir resolve._renditions).
+#
+# Politiques (combinables):
+# - qualité max (défaut): l'original, comme avant;
+# - résolution cible (max_side): la plus grande rendition dont le grand côté <= max_side;
+# - débit max (max_bitrate, vidéos): la plus grande rendition sous ce débit;
+# - budget d'octets par lot (byte_budget): chaque post reçoit budget restant / posts restants,
+#   les médias les plus lourds descendent d'une rendition tant que le post dépasse sa part;
+#   ce qu'un post n'utilise pas profite aux suivants.
+# Les tailles sont estimées avant téléchargement (pixels pour les photos, débit × durée pour
+# les vidéos): le budget est une cible, pas une limite stricte.
+#
+# Le bundle en cache garde toutes les renditions: le choix se fait par lot, dans un
+# wrap_resolve (même ordre de résolution = mêmes choix, donc reprise cohérente).
+
+import threading
+from typing import Callable, List, NamedTuple, Optional
+
+from igdl import metrics
+
+RENDITION_PHOTO_BYTES_PER_PIXEL = 0.25   # JPEG Instagram: ~0,15 à 0,3 octet / pixel
+RENDITION_VIDEO_BITS_PER_PIXEL = 3.0     # débit estimé (bits/s par pixel) quand video_versions n'en donne pas
+RENDITION_VIDEO_DURATION_S = 30.0        # durée supposée d'une vidéo sans video_duration
+RENDITION_UNKNOWN_PIXELS = 1080 * 1350   # dimensions inconnues: taille d'un original courant
+
+
+class RenditionPolicy(NamedTuple):
+    max_side: Optional[int] = None       # pixels (grand côté)
+    max_bitrate: Optional[int] = None    # bits/s (vidéos)
+    byte_budget: Optional[int] = None    # octets estimés pour tout le lot
+
+    @property
+    def active(self) -> bool:
+        """False = qualité max (rien à choisir)."""
+        return any(v is not None for v in self)
+
+    def describe(self) -> str:
+        parts = []
+        if self.max_side:
+            parts.append(f"≤ {self.max_side} px")
+        if self.max_bitrate:
+            parts.append(f"≤ {self.max_bitrate // 1000} kbit/s")
+        if self.byte_budget:
+            parts.append(f"budget {self.byte_budget / 1e6:.0f} Mo")
+        return ", ".join(parts) or "qualité max"
+
+
+# =========================
+# Estimations
+# =========================
+def _pixels(r: dict) -> int:
+    return (r.get("width") or 0) * (r.get("height") or 0) or RENDITION_UNKNOWN_PIXELS
+
+
+def estimate_bitrate(r: dict) -> float:
+    """Débit (bits/s) d'une rendition vidéo: champ bitrate, sinon estimé d'après ses dimensions."""
+    return float(r.get("bitrate") or _pixels(r) * RENDITION_VIDEO_BITS_PER_PIXEL)
+
+
+def estimate_bytes(item: dict, r: dict) -> int:
+    if item["kind"] == "video":
+        return int(estimate_bitrate(r) * (item.get("duration") or RENDITION_VIDEO_DURATION_S) / 8)
+    return int(_pixels(r) * RENDITION_PHOTO_BYTES_PER_PIXEL)
+
+
+def _candidates(item: dict, policy: RenditionPolicy) -> List[dict]:
+    """Renditions admises par la politique (hors budget), de la plus grande à la plus petite; jamais vide."""
+    renditions = item.get("renditions") or [{"url": item["url"]}]
+    allowed = renditions
+    if policy.max_side:
+        allowed = [r for r in allowed if r.get("width") and max(r["width"], r["height"]) <= policy.max_side]
+    if policy.max_bitrate and item["kind"] == "video":
+        allowed = [r for r in allowed if estimate_bitrate(r) <= policy.max_bitrate]
+    return allowed or renditions[-1:]  # rien ne convient: la plus petite
+
+
+def _pick(item: dict, r: dict) -> dict:
+    out = {k: v for k, v in item.items() if k != "renditions"}
+    out["url"] = r["url"]
+    if r.get("width"):
+        out["width"], out["height"] = r["width"], r["height"]
+    return out
+
+
+# =========================
+# Sélection par lot
+# =========================
+class RenditionSelector:
+    """Applique une RenditionPolicy aux bundles d'un lot de `total_posts` posts (budget partagé)."""
+    def __init__(self, policy: RenditionPolicy, total_posts: int):
+        self.policy = policy
+        self._remaining_posts = max(1, int(total_posts))
+        self._remaining_budget = policy.byte_budget
+        self.estimated_bytes = 0
+        self._lock = threading.Lock()
+
+    def select(self, bundle: dict) -> dict:
+        """Copie du bundle avec une seule URL par média (celle de la rendition retenue)."""
+        if not bundle.get("media"):
+            return bundle
+        options = [_candidates(m, self.policy) for m in bundle["media"]]
+        with self._lock:
+            choice = [0] * len(options)
+            sizes = [estimate_bytes(m, o[0]) for m, o in zip(bundle["media"], options)]
+            if self._remaining_budget is not None:
+                share = self._remaining_budget / self._remaining_posts
+                # le média le plus lourd descend d'un cran tant que le post dépasse sa part
+                while sum(sizes) > share:
+                    movable = [i for i in range(len(options)) if choice[i] + 1 < len(options[i])]
+                    if not movable:
+                        metrics.incr("renditions.over_budget")
+                        break
+                    i = max(movable, key=lambda k: sizes[k])
+                    choice[i] += 1
+                    sizes[i] = estimate_bytes(bundle["media"][i], options[i][choice[i]])
+                self._remaining_budget = max(0, self._remaining_budget - sum(sizes))
+                self._remaining_posts = max(1, self._remaining_posts - 1)
+            self.estimated_bytes += sum(sizes)
+        media = []
+        for m, o, c in zip(bundle["media"], options, choice):
+            r = o[c]
+            if r["url"] != m["url"]:
+                metrics.incr("renditions.downgraded")
+            media.append(_pick(m, r))
+        metrics.incr("renditions.estimated_bytes", sum(sizes))
+        return {**bundle, "media": media}
+
+    def wrap_resolve(self, resolve: Callable[[str], dict]) -> Callable[[str], dict]:
+        """Enveloppe `resolve(url)`: à placer au-dessus de BatchCheckpoint.wrap_resolve (bundles complets en manifeste)."""
+        def _resolve(url: str) -> dict:
+            return self.select(resolve(url))
+        return _resolve
+
+
+def parse_size(text: str) -> int:
+    """'500M', '2G', '750k', '1048576' -> octets (unités décimales, comme l'affichage en Mo). Lève ValueError."""
+    t = (text or "").strip().upper().rstrip("OB")
+    factor = 1
+    for suffix, f in (("K", 10 ** 3), ("M", 10 ** 6), ("G", 10 ** 9), ("T", 10 ** 12)):
+        if t.endswith(suffix):
+            t, factor = t[:-1], f
+            break
+    try:
+        value = float(t) * factor
+    except ValueError:
+        raise ValueError(f"Taille invalide: {text!r} (ex. 500M, 2G).")
+    if value <= 0:
+        raise ValueError(f"Taille invalide: {text!r} (ex. 500M, 2G).")
+    return int(value)
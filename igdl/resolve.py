@@ -0,0 +1,529 @@
+# igdl/resolve.py
+# Résolution d'un shortcode en "bundle" (légende, auteur, URLs des médias en meilleure qualité).
+# Chaîne de stratégies (igdl.strategies): Instaloader GraphQL (avec backoff / limiteur), page
+# embed, balises og:video / og:image, ordonnées par type de lien d'après leurs statistiques.
+
+import copy
+import html
+import json
+import re
+import threading
+import time
+from datetime import timezone
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import requests
+
+from igdl import metrics
+from igdl.accounts import with_account
+from igdl.auth import cache_scope
+from igdl.cache import BundleCache, get_bundle_cache
+from igdl.clients import build_browsery_session, instaloader_client
+from igdl.errors import CircuitOpenError, PostUnavailable
+from igdl.preview import pick_preview
+from igdl.ratelimit import BLOCKING_MARKERS, AdaptiveRateLimiter, get_rate_limiters
+from igdl.singleflight import SingleFlight
+from igdl.strategies import ResolverChain, Strategy, StrategyResult
+
+if TYPE_CHECKING:
+    from instaloader import Instaloader, Post
+
+NO_MEDIA_MESSAGE = "Aucun média trouvé (post privé ou non accessible)."
+
+# résolutions simultanées d'un même post (même scope): une seule requête Instagram
+_BUNDLE_FLIGHTS = SingleFlight("bundle")
+
+
+# =========================
+# Meilleure URL (photo / vidéo)
+# =========================
+def _best_from_display_resources(node_dict: dict) -> Optional[str]:
+    resources = None
+    if isinstance(node_dict, dict):
+        resources = node_dict.get("display_resources") or node_dict.get("thumbnail_resources")
+    if not resources or not isinstance(resources, list):
+        return None
+    try:
+        best = max(resources, key=lambda r: (r.get("config_width", 0), r.get("config_height", 0)))
+        return best.get("src")
+    except Exception:
+        return None
+
+
+def _best_from_video_versions(node_dict: dict) -> Optional[str]:
+    if not isinstance(node_dict, dict):
+        return None
+    versions = node_dict.get("video_versions") or node_dict.get("video_resources") or None
+    if not versions or not isinstance(versions, list):
+        url = node_dict.get("video_url")
+        return url
+    try:
+        def keyfun(v):
+            return (v.get("width", 0), v.get("height", 0), v.get("bitrate", 0))
+        best = max(versions, key=keyfun)
+        return best.get("url") or best.get("src")
+    except Exception:
+        return node_dict.get("video_url")
+
+
+def _renditions(node_dict: dict, kind: str) -> List[Dict]:
+    """
+    Renditions disponibles d'un média, de la plus grande à la plus petite:
+    [{"url", "width", "height"[, "bitrate"]}]. Sources: display_resources / image_versions2
+    (photos), video_versions / video_resources (vidéos). Liste vide si le nœud n'en décrit pas.
+    """
+    if not isinstance(node_dict, dict):
+        return []
+    if kind == "video":
+        raw = node_dict.get("video_versions") or node_dict.get("video_resources") or []
+    else:
+        raw = (node_dict.get("display_resources") or (node_dict.get("image_versions2") or {}).get("candidates")
+               or node_dict.get("thumbnail_resources") or [])
+    out, seen = [], set()
+    for r in raw if isinstance(raw, list) else []:
+        if not isinstance(r, dict):
+            continue
+        url = r.get("url") or r.get("src")
+        if not url or url in seen:
+            continue
+        seen.add(url)
+        item = {"url": url, "width": int(r.get("width") or r.get("config_width") or 0),
+                "height": int(r.get("height") or r.get("config_height") or 0)}
+        if r.get("bitrate"):
+            item["bitrate"] = int(r["bitrate"])
+        out.append(item)
+    out.sort(key=lambda r: (r["width"] * r["height"], r.get("bitrate", 0)), reverse=True)
+    return out
+
+
+def _preview_url(node_dict: Optional[dict]) -> Optional[str]:
+    """Petite image du média (photo, ou couverture d'une vidéo), toutes listes de tailles confondues."""
+    if not isinstance(node_dict, dict):
+        return None
+    images = [r for key in ("display_resources", "thumbnail_resources")
+              for r in _renditions({"display_resources": node_dict.get(key)}, "photo")]
+    images += _renditions({"image_versions2": node_dict.get("image_versions2")}, "photo")
+    return pick_preview(images)
+
+
+def _with_renditions(item: Dict, node_dict: Optional[dict], duration: Optional[float] = None) -> Dict:
+    """
+    Ajoute au média ses renditions (s'il y a un choix), la durée d'une vidéo (pour estimer sa taille)
+    et une petite image d'aperçu (igdl.preview).
+    """
+    preview = _preview_url(node_dict)
+    if preview and preview != item["url"]:
+        item["preview"] = preview
+    renditions = _renditions(node_dict, item["kind"])
+    if len(renditions) > 1:
+        if all(r["url"] != item["url"] for r in renditions):
+            renditions.insert(0, {"url": item["url"], "width": 0, "height": 0})  # URL retenue, dimensions inconnues
+        item["renditions"] = renditions
+    if item["kind"] == "video" and duration:
+        item["duration"] = float(duration)
+    return item
+
+
+def _sidecar_node_dicts(post: "Post") -> List[dict]:
+    """Nœuds bruts des éléments d'un carrousel (API web: carousel_media; GraphQL: edge_sidecar_to_children)."""
+    node_dict = getattr(post, "_node", None)
+    if not isinstance(node_dict, dict):
+        return []
+    children = node_dict.get("carousel_media")
+    if isinstance(children, list):
+        return children
+    edges = (node_dict.get("edge_sidecar_to_children") or {}).get("edges") or []
+    return [e.get("node") or {} for e in edges if isinstance(e, dict)]
+
+
+def _node_to_best_photo_url(node) -> Optional[str]:
+    node_dict = getattr(node, "_node", None)
+    best = None
+    if isinstance(node_dict, dict):
+        best = _best_from_display_resources(node_dict)
+        if best:
+            return best
+    return getattr(node, "display_url", None) or getattr(node, "url", None)
+
+
+def _node_to_best_video_url(node) -> Optional[str]:
+    node_dict = getattr(node, "_node", None)
+    url = getattr(node, "video_url", None)
+    if url:
+        return url
+    if isinstance(node_dict, dict):
+        best = _best_from_video_versions(node_dict)
+        if best:
+            return best
+    return None
+
+
+def _post_best_single_photo_url(post: "Post") -> Optional[str]:
+    node_dict = getattr(post, "_node", None)
+    if isinstance(node_dict, dict):
+        best = _best_from_display_resources(node_dict)
+        if best:
+            return best
+    if not post.is_video:
+        return post.url
+    return None
+
+
+def _post_best_single_video_url(post: "Post") -> Optional[str]:
+    if getattr(post, "video_url", None):
+        return post.video_url
+    node_dict = getattr(post, "_node", None)
+    if isinstance(node_dict, dict):
+        best = _best_from_video_versions(node_dict) or node_dict.get("video_url")
+        if best:
+            return best
+    return None
+
+
+# =========================
+# Backoff / retries anti-429
+# =========================
+_TRANSIENT_MARKERS = (
+    "Please wait a few minutes", "Too many requests", "429",
+    "Unauthorized", "checkpoint", "try again later",
+)
+
+
+def is_transient_error(e: Exception) -> bool:
+    """Erreur de limitation / session (à réessayer plus tard), par opposition à un post absent ou privé."""
+    msg = str(e)
+    return any(s in msg for s in _TRANSIENT_MARKERS)
+
+
+def is_negative_error(e: Exception) -> bool:
+    """
+    Post inexistant ou privé: inutile de réessayer avant un moment (cache négatif).
+    "Fetching Post metadata failed" (BadResponseException) ou une redirection vers la connexion sont
+    souvent un refus passager d'Instagram (blocage léger, invité refusé): échec du lot, pas mis en cache.
+    """
+    from instaloader.exceptions import PrivateProfileNotFollowedException, QueryReturnedNotFoundException
+
+    if is_transient_error(e):
+        return False
+    return isinstance(e, (QueryReturnedNotFoundException, PrivateProfileNotFollowedException))
+
+
+def is_blocking_error(e: Exception) -> bool:
+    """Checkpoint / challenge / déconnexion forcée: continuer ne ferait qu'aggraver le blocage."""
+    msg = str(e)
+    return any(s in msg for s in BLOCKING_MARKERS)
+
+
+def post_from_shortcode_with_backoff(L: "Instaloader", shortcode: str, max_attempts: int = 5,
+                                     limiter: Optional[AdaptiveRateLimiter] = None) -> "Post":
+    """
+    Récupère le Post en passant par le limiteur "meta" du scope courant.
+    Sur limitation IG ('Please wait a few minutes', 429...), le limiteur baisse son débit
+    et impose une pause (Retry-After ou backoff) avant la tentative suivante.
+    Les erreurs non transitoires sortent immédiatement; un checkpoint ouvre le disjoncteur.
+    """
+    from instaloader import Post
+
+    limiter = limiter or get_rate_limiters().get(cache_scope(), "meta")
+    last_exc = None
+    with metrics.timed("resolve.instaloader"):
+        for attempt in range(max_attempts):
+            if attempt:
+                metrics.incr("resolve.retries")
+            # lève CircuitOpenError si le disjoncteur est ouvert
+            metrics.observe("sleep.rate_limit.meta", limiter.acquire())
+            try:
+                return Post.from_shortcode(L.context, shortcode)
+            except Exception as e:
+                last_exc = e
+                if is_blocking_error(e):
+                    limiter.trip(f"Compte bloqué par Instagram (checkpoint): {e}")
+                    break
+                if is_transient_error(e) and attempt < max_attempts - 1:
+                    metrics.incr("resolve.throttled")
+                    limiter.on_throttle()
+                    continue
+                break
+    raise last_exc if last_exc else RuntimeError("Échec de récupération du post.")
+
+
+# =========================
+# Résolution d'un post
+# =========================
+def scrape_og_from_reel(shortcode: str) -> Optional[Dict[str, str]]:
+    """
+    Stratégie légère: og:video / og:image de la page du Reel (une requête, sans Instaloader).
+    None si rien trouvé (ou erreur réseau); CircuitOpenError (disjoncteur ouvert) remonte.
+    """
+    t0 = time.perf_counter()
+    try:
+        sess = build_browsery_session()
+        metrics.observe("sleep.rate_limit.meta", get_rate_limiters().get(cache_scope(), "meta").acquire())
+        url = f"https://www.instagram.com/reel/{shortcode}/"
+        r = sess.get(url, timeout=20)
+        r.raise_for_status()
+        html_text = r.text
+        m = re.search(r'property="og:video"\s+content="([^"]+)"', html_text)
+        if m:
+            return {"kind": "video", "url": html.unescape(m.group(1))}
+        m = re.search(r'property="og:image"\s+content="([^"]+)"', html_text)
+        if m:
+            return {"kind": "photo", "url": html.unescape(m.group(1))}
+    except requests.RequestException:
+        pass
+    finally:
+        metrics.observe("resolve.og_scrape", time.perf_counter() - t0)
+    return None
+
+
+def _unescape_json_url(raw: str) -> str:
+    """URL d'un JSON (parfois lui-même échappé dans une chaîne JS): \\/ et \\u0026."""
+    while "\\" in raw:
+        try:
+            raw = json.loads(f'"{raw}"')
+        except ValueError:
+            raw = raw.replace("\\/", "/").replace("\\u0026", "&")
+            break
+    return raw
+
+
+def scrape_embed(shortcode: str) -> Optional[dict]:
+    """
+    Stratégie légère: page embed du post (/p/<shortcode>/embed/captioned/), une requête sans
+    Instaloader. Bundle avec le premier média (vidéo si la page en décrit une), auteur et légende;
+    "typename": type annoncé par la page (GraphImage, GraphVideo, GraphSidecar: autres médias
+    absents), None si elle n'en dit rien. None si rien trouvé (ou erreur réseau / page illisible);
+    CircuitOpenError (disjoncteur ouvert) remonte.
+    """
+    t0 = time.perf_counter()
+    try:
+        sess = build_browsery_session()
+        metrics.observe("sleep.rate_limit.meta", get_rate_limiters().get(cache_scope(), "meta").acquire())
+        r = sess.get(f"https://www.instagram.com/p/{shortcode}/embed/captioned/", timeout=20)
+        r.raise_for_status()
+        text = r.text
+        media = []
+        m = re.search(r'\\*"video_url\\*"\s*:\s*\\*"((?:[^"\\]|\\.)+?)\\*"', text)
+        if m:
+            media.append({"kind": "video", "url": _unescape_json_url(m.group(1))})
+        else:
+            m = re.search(r'<img[^>]*class="EmbeddedMediaImage"[^>]*>', text)
+            if m:
+                tag = m.group(0)
+                srcset = re.search(r'srcset="([^"]+)"', tag)
+                src = re.search(r'\ssrc="([^"]+)"', tag)
+                if srcset:
+                    # "url 640w,url 1080w": la plus large
+                    cands = [c.strip().rsplit(" ", 1) for c in html.unescape(srcset.group(1)).split(",") if c.strip()]
+                    url = max(cands, key=lambda c: int(c[1].rstrip("w")) if len(c) == 2 and c[1][:-1].isdigit() else 0)[0]
+                    media.append({"kind": "photo", "url": url})
+                elif src:
+                    media.append({"kind": "photo", "url": html.unescape(src.group(1))})
+        if not media:
+            return None
+        m = re.search(r'\\*"__typename\\*"\s*:\s*\\*"(Graph(?:Image|Video|Sidecar))', text)
+        typename = m.group(1) if m else "GraphSidecar" if "edge_sidecar_to_children" in text else None
+        user = re.search(r'class="UsernameText"[^>]*>([^<]+)<', text)
+        caption = ""
+        m = re.search(r'<div class="Caption">(.*?)<div class="CaptionComments"', text, re.S)
+        if m:
+            body = re.sub(r'<a class="CaptionUsername".*?</a>', "", m.group(1), count=1, flags=re.S)
+            caption = html.unescape(re.sub(r"<[^>]+>", "", re.sub(r"<br\s*/?>", "\n", body))).strip()
+        return {"shortcode": shortcode, "username": html.unescape(user.group(1)).strip() if user else "",
+                "caption": caption, "date": None, "media": media,
+                "typename": typename}
+    except (requests.RequestException, ValueError, IndexError):
+        return None
+    finally:
+        metrics.observe("resolve.embed_scrape", time.perf_counter() - t0)
+
+
+def bundle_from_post(post: "Post") -> dict:
+    """
+    Bundle d'un Post Instaloader (sans fallback OG). Peut relancer des requêtes paresseuses:
+    le contexte Instaloader du post doit rester emprunté pendant l'appel.
+    """
+    caption = post.caption or ""
+    username = getattr(post, "owner_username", "") or ""
+    try:
+        date = int(post.date_utc.replace(tzinfo=timezone.utc).timestamp())
+    except Exception:
+        date = None
+    media: List[Dict[str, str]] = []
+
+    # Carrousel (renditions: nœuds bruts alignés par position, s'ils correspondent)
+    try:
+        nodes = list(post.get_sidecar_nodes())
+        if nodes:
+            raw = _sidecar_node_dicts(post)
+            raw = raw if len(raw) == len(nodes) else [None] * len(nodes)
+            for node, node_dict in zip(nodes, raw):
+                if getattr(node, "is_video", False):
+                    vurl = _node_to_best_video_url(node)
+                    if vurl:
+                        media.append(_with_renditions({"kind": "video", "url": vurl}, node_dict,
+                                                      node_dict and node_dict.get("video_duration")))
+                else:
+                    purl = _node_to_best_photo_url(node)
+                    if purl:
+                        media.append(_with_renditions({"kind": "photo", "url": purl}, node_dict))
+    except Exception:
+        pass
+
+    # Single
+    if not media:
+        node_dict = getattr(post, "_node", None)
+        if post.is_video:
+            v = _post_best_single_video_url(post)
+            if v:
+                media.append(_with_renditions({"kind": "video", "url": v}, node_dict,
+                                              isinstance(node_dict, dict) and node_dict.get("video_duration")))
+        else:
+            p = _post_best_single_photo_url(post)
+            if p:
+                media.append(_with_renditions({"kind": "photo", "url": p}, node_dict))
+
+    return {"shortcode": post.shortcode, "username": username, "caption": caption, "date": date, "media": media}
+
+
+# =========================
+# Stratégies de résolution (igdl.strategies)
+# =========================
+def _strategy_graphql(shortcode: str, use_auth: bool, attempts: int) -> StrategyResult:
+    """Instaloader (GraphQL / API web): carrousel complet, renditions, légende et date. Fait référence."""
+    def _from_instaloader() -> dict:
+        # Le contexte reste emprunté pendant l'extraction: Post peut relancer des requêtes paresseuses
+        with instaloader_client(use_auth) as L:
+            post = post_from_shortcode_with_backoff(L, shortcode, max_attempts=attempts)
+            return bundle_from_post(post)
+
+    # Plusieurs comptes: un compte sain est choisi (quarantaine / bascule sur un autre, igdl.accounts)
+    bundle = with_account(_from_instaloader, use_auth, failover=is_transient_error)
+    bundle["shortcode"] = shortcode
+    return StrategyResult(bundle, True)
+
+
+def _strategy_embed(shortcode: str, use_auth: bool, attempts: int) -> Optional[StrategyResult]:
+    bundle = scrape_embed(shortcode)
+    if bundle is None:
+        return None
+    typename = bundle.pop("typename")
+    bundle["lite"] = True
+    # carrousel: premier média seulement; photo sans type annoncé: peut-être la 1re d'un carrousel
+    single = typename in ("GraphImage", "GraphVideo") or (typename is None and bundle["media"][0]["kind"] == "video")
+    return StrategyResult(bundle, single)
+
+
+def _strategy_og(shortcode: str, use_auth: bool, attempts: int) -> Optional[StrategyResult]:
+    og = scrape_og_from_reel(shortcode)
+    if og is None:
+        return None
+    bundle = {"shortcode": shortcode, "username": "", "caption": "", "date": None, "media": [og], "lite": True}
+    return StrategyResult(bundle, og["kind"] == "video")  # og:image: peut-être un carrousel
+
+
+RESOLVE_STRATEGIES = [
+    Strategy("graphql", _strategy_graphql, retries=True, prior_success=0.9, prior_latency_s=1.5),
+    Strategy("embed", _strategy_embed, cheap=True, prior_success=0.35, prior_latency_s=0.6),
+    Strategy("og", _strategy_og, cheap=True, prior_success=0.3, prior_latency_s=0.6),
+]
+
+_chain: Optional[ResolverChain] = None
+_chain_lock = threading.Lock()
+
+
+def _fatal_error(e: Exception) -> bool:
+    """
+    Erreur qui arrête la chaîne: post introuvable / privé, compte bloqué, disjoncteur ouvert.
+    Un autre refus de GraphQL ("Fetching Post metadata failed", invité redirigé vers la connexion...)
+    laisse leur chance aux stratégies légères.
+    """
+    from instaloader.exceptions import PrivateProfileNotFollowedException, QueryReturnedNotFoundException
+
+    if isinstance(e, CircuitOpenError) or is_blocking_error(e):
+        return True
+    return (isinstance(e, (QueryReturnedNotFoundException, PrivateProfileNotFollowedException))
+            and not is_transient_error(e))
+
+
+def get_resolver_chain() -> ResolverChain:
+    """Chaîne de résolution du processus (statistiques partagées avec les autres processus)."""
+    global _chain
+    with _chain_lock:
+        if _chain is None:
+            _chain = ResolverChain(RESOLVE_STRATEGIES, fatal=_fatal_error, transient=is_transient_error)
+        return _chain
+
+
+def resolve_post_bundle(shortcode: str, use_auth: bool, max_attempts: int, kind: str = "p",
+                        race: Optional[bool] = None) -> dict:
+    """Résolution réseau d'un post, sans cache: chaîne de stratégies ordonnée pour ce type de lien."""
+    return get_resolver_chain().resolve(shortcode, kind, use_auth, max_attempts, race)
+
+
+def fetch_post_bundle(shortcode: str, use_auth: bool, scope: Optional[str] = None, max_attempts: int = 5,
+                      cache: Optional[BundleCache] = None, fresh: bool = False, kind: str = "p",
+                      race: Optional[bool] = None) -> dict:
+    """
+    Retourne un dict:
+    {
+        "shortcode": str,
+        "username": str,
+        "caption": str,
+        "date": int|None (publication, epoch UTC),
+        "media": List[{"kind": "photo"|"video", "url": str (meilleure qualité),
+                       "renditions"?: [{"url", "width", "height"[, "bitrate"]}] (plus grande d'abord),
+                       "duration"?: float (vidéo, secondes), "preview"?: str (petite image)}],
+        "lite"?: True (stratégie légère: URL seule, sans renditions, durée, aperçu ni date;
+                       gardé BUNDLE_LITE_TTL_S seulement dans le cache)
+    }
+    Le choix d'une rendition plus légère se fait par lot (igdl.renditions), pas dans le cache.
+    Lève PostUnavailable si le post est connu comme privé / introuvable (cache négatif).
+    `fresh=True` ignore le cache (URLs signées expirées) et le remplace par la nouvelle résolution.
+    `kind`: type du lien d'origine ("p", "reel", "tv", voir urls.post_kind), qui oriente l'ordre
+    des stratégies de résolution; `race`: course des stratégies légères (None = RESOLVE_RACE).
+    Les appels simultanés pour le même (scope, shortcode), d'autres lots compris, sont coalescés
+    (igdl.singleflight): une seule résolution, résultat ou erreur partagés.
+    """
+    # 'scope' isole le cache par utilisateur (hash du sessionid)
+    scope = scope if scope is not None else cache_scope()
+    cache = cache if cache is not None else get_bundle_cache()
+
+    def _resolve() -> dict:
+        try:
+            bundle = resolve_post_bundle(shortcode, use_auth, max_attempts, kind, race)
+        except Exception as e:
+            if is_negative_error(e):
+                cache.put_negative(scope, shortcode, str(e))
+            raise
+        if bundle["media"]:
+            cache.put(scope, shortcode, bundle)
+        else:
+            cache.put_negative(scope, shortcode, NO_MEDIA_MESSAGE)
+        return bundle
+
+    with metrics.timed("resolve.post"):
+        if fresh:
+            metrics.incr("cache.bundle.refresh")
+        else:
+            cached = _cached_bundle(cache, scope, shortcode)
+            if cached is not None:
+                return cached
+            metrics.incr("cache.bundle.miss")
+        # après l'attente d'un autre processus, son résultat est dans le cache disque (sauf `fresh`:
+        # le cache peut encore contenir les URLs refusées)
+        bundle, shared = _BUNDLE_FLIGHTS.do(
+            f"{scope}:{shortcode}", _resolve,
+            recheck=None if fresh else (lambda: _cached_bundle(cache, scope, shortcode)))
+        return copy.deepcopy(bundle) if shared else bundle  # chaque lot peut modifier son bundle
+
+
+def _cached_bundle(cache: BundleCache, scope: str, shortcode: str) -> Optional[dict]:
+    try:
+        cached = cache.get(scope, shortcode)
+    except PostUnavailable:
+        metrics.incr("cache.bundle.negative_hit")
+        raise
+    if cached is not None:
+        metrics.incr("cache.bundle.hit")
+    return cached
@@ -0,0 +1,152 @@
+# igdl/singleflight.py
+# Coalescence des requêtes identiques simultanées ("single-flight"): quand plusieurs lots
+# (onglets, utilisateurs, workers de la file) demandent en même temps le même post ou le même
+# média, un seul appel part vers Instagram / le CDN; les autres attendent son résultat.
+#
+# Deux niveaux:
+# - dans un processus: le premier appelant d'une clé exécute la fonction, les appels simultanés
+#   de même clé attendent et reçoivent le même résultat (ou la même exception);
+# - entre processus (workers igdl.jobs, CLI lancées en parallèle): un fichier marqueur par clé, posé
+#   sous le verrou fichier (flock) de sa tranche de clés; le verrou n'est tenu que pour vérifier et
+#   poser le marqueur, jamais pendant l'appel. Un processus qui trouve la clé réservée attend la
+#   disparition du marqueur (au plus SINGLEFLIGHT_WAIT_S), relit le résultat rangé par l'autre
+#   dans le cache disque partagé (`recheck`), et ne fait la requête lui-même qu'à défaut. Les erreurs
+#   passagères ne sont donc partagées qu'entre threads; les erreurs durables passent par le cache négatif.
+# Sans fcntl (Windows): coalescence dans le processus seulement.
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+from igdl import metrics
+from igdl.cache import CACHE_ROOT
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou inter-processus
+    fcntl = None
+
+SINGLEFLIGHT_DIR = os.getenv("IGDL_SINGLEFLIGHT_DIR", os.path.join(CACHE_ROOT, "flights"))
+SINGLEFLIGHT_STRIPES = 1024  # fichiers verrous par nom (clés réparties par hachage)
+SINGLEFLIGHT_WAIT_S = 30.0   # attente max du vol d'un autre processus (marqueur plus vieux: abandonné)
+SINGLEFLIGHT_POLL_S = 0.05
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Appels coalescés par clé. do(clé, fn, recheck) -> (résultat, partagé): `partagé` est vrai si
+    le résultat est l'objet rendu à un autre thread; l'appelant ne doit alors ni le modifier ni
+    réutiliser une ressource propre à cet appel (fichier ouvert...). Le résultat de `recheck`
+    (relu dans le cache après l'attente d'un autre processus) appartient à l'appelant.
+    Mesures: singleflight.<nom>.shared (threads), singleflight.<nom>.shared_process (processus).
+    """
+    def __init__(self, name: str, lock_dir: Optional[str] = SINGLEFLIGHT_DIR):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], T],
+           recheck: Optional[Callable[[], Optional[T]]] = None) -> Tuple[T, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            with self._interprocess(key) as waited:
+                res = recheck() if waited and recheck is not None else None
+                if res is None:
+                    res = fn()
+                else:
+                    metrics.incr(f"singleflight.{self.name}.shared_process")
+            call.result = res
+            return res, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    @contextmanager
+    def _interprocess(self, key: str) -> Iterator[bool]:
+        """Réserve `key` entre processus; rend True si un autre processus l'avait (son vol a été attendu)."""
+        if self.lock_dir is None:
+            yield False
+            return
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        stripe = int(digest[:8], 16) % SINGLEFLIGHT_STRIPES
+        os.makedirs(self.lock_dir, exist_ok=True)
+        marker = os.path.join(self.lock_dir, f"{self.name}-{digest[:20]}.flight")
+        if self._claim(os.path.join(self.lock_dir, f"{self.name}-{stripe:03d}.lock"), marker):
+            try:
+                yield False
+            finally:
+                try:
+                    os.remove(marker)
+                except FileNotFoundError:
+                    pass
+            return
+        deadline = time.monotonic() + SINGLEFLIGHT_WAIT_S
+        while self._live(marker) and time.monotonic() < deadline:
+            time.sleep(SINGLEFLIGHT_POLL_S)
+        yield True
+
+    @classmethod
+    def _claim(cls, lock_path: str, marker: str) -> bool:
+        """Pose le marqueur de la clé sauf si un autre processus vivant l'a déjà posé (verrou de tranche bref)."""
+        with open(lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if cls._live(marker):
+                    return False
+                tmp = f"{marker}.{os.getpid()}"
+                with open(tmp, "w") as m:
+                    m.write(str(os.getpid()))
+                os.replace(tmp, marker)  # jamais lu à moitié écrit par un processus qui attend
+                return True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _live(marker: str) -> bool:
+        """Marqueur présent, récent et posé par un processus encore en vie (sinon: vol abandonné)."""
+        try:
+            age = time.time() - os.path.getmtime(marker)
+            with open(marker) as m:
+                pid = int(m.read() or 0)
+        except (OSError, ValueError):
+            return False
+        if age > SINGLEFLIGHT_WAIT_S or pid <= 0:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass  # processus d'un autre utilisateur: vivant
+        return True
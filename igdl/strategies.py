@@ -0,0 +1,295 @@
+# igdl/strategies.py
+# Chaîne de résolveurs de métadonnées: plusieurs stratégies (GraphQL Instaloader, page embed,
+# balises OG...) essayées dans l'ordre le plus rapide d'après leurs statistiques par type de
+# lien (/p/, /reel/, /tv/), au lieu de toujours commencer par Instaloader et ses pauses.
+#
+# - Statistiques par (type, stratégie): tentatives, réussites complètes et latence, en moyennes
+#   décroissantes (STRATEGY_DECAY: l'ordre suit les changements d'Instagram). Persistées en SQLite
+#   (STRATEGY_STATS_PATH), partagées entre processus (workers de la file, CLI).
+# - Ordre: coût attendu croissant = latence / probabilité de réussite. Chaque stratégie a un
+#   a priori (prior_success, prior_latency_s): une stratégie peu essayée garde sa place par défaut.
+#   Exploration: une résolution sur STRATEGY_EXPLORE commence par la stratégie la moins mesurée
+#   (sinon une stratégie classée derrière une autre qui réussit toujours ne serait jamais remesurée).
+# - Un résultat partiel (ex. og:image d'un carrousel: première image seulement) n'arrête pas la
+#   chaîne: il ne sert qu'en dernier recours et ne compte pas comme une réussite.
+# - Stratégie à tentatives (GraphQL, `retries=True`): une seule tentative d'abord; sur erreur
+#   passagère les autres stratégies sont essayées, puis les tentatives restantes si aucune n'a
+#   abouti: les pauses de backoff ne sont payées que si rien d'autre ne marche.
+# - Erreur `fatal` (post introuvable / privé, compte bloqué, disjoncteur): la chaîne s'arrête.
+# - Course (optionnelle, `race`): les stratégies légères en tête d'ordre partent ensemble, la
+#   première réponse complète gagne (au plus RESOLVE_RACE_TIMEOUT_S, puis la suite de la chaîne).
+
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from igdl import metrics
+from igdl.cache import CACHE_ROOT, _sqlite
+
+STRATEGY_STATS_PATH = os.getenv("IGDL_STRATEGY_STATS", os.path.join(CACHE_ROOT, "strategies.sqlite"))
+STRATEGY_DECAY = 0.98          # poids gardé par l'historique à chaque nouvelle mesure
+STRATEGY_LATENCY_ALPHA = 0.2   # lissage de la latence (réagit vite: pauses de backoff, lenteurs)
+STRATEGY_PRIOR_WEIGHT = 5.0    # poids de l'a priori (en nombre de tentatives)
+STRATEGY_RELOAD_S = 30.0       # relecture des statistiques des autres processus
+STRATEGY_EXPLORE = 0.05        # part des résolutions qui commencent par la stratégie la moins mesurée
+RESOLVE_RACE = os.getenv("IGDL_RESOLVE_RACE", "0") == "1"
+RESOLVE_RACE_TIMEOUT_S = 8.0
+
+
+class StrategyResult(NamedTuple):
+    bundle: dict
+    complete: bool  # False: médias manquants possibles (dernier recours seulement)
+
+
+class Strategy(NamedTuple):
+    """
+    Une façon de résoudre un post. fn(shortcode, use_auth, attempts) -> StrategyResult | None
+    (None: rien trouvé). Une stratégie légère (`cheap`) ne lève que des erreurs fatales (disjoncteur
+    ouvert...): ses échecs réseau ou de lecture valent None.
+    """
+    name: str
+    fn: Callable[[str, bool, int], Optional[StrategyResult]]
+    cheap: bool = False
+    retries: bool = False          # accepte plusieurs tentatives (backoff): voir l'en-tête
+    prior_success: float = 0.5
+    prior_latency_s: float = 1.0
+
+
+class _Stat:
+    __slots__ = ("n", "ok", "latency")
+
+    def __init__(self, n: float = 0.0, ok: float = 0.0, latency: Optional[float] = None):
+        self.n, self.ok, self.latency = n, ok, latency
+
+
+class StrategyStats:
+    """Statistiques par (type de lien, stratégie), en mémoire et en SQLite (WAL, partagé entre processus)."""
+    def __init__(self, path: Optional[str] = STRATEGY_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], _Stat] = {}
+        self._loaded = 0.0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with _sqlite(path) as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("""CREATE TABLE IF NOT EXISTS stats (
+                    kind TEXT NOT NULL, strategy TEXT NOT NULL, n REAL NOT NULL, ok REAL NOT NULL,
+                    latency REAL, updated REAL NOT NULL, PRIMARY KEY (kind, strategy))""")
+
+    def _reload(self) -> None:
+        if not self.path or time.monotonic() - self._loaded < STRATEGY_RELOAD_S:
+            return
+        with _sqlite(self.path) as db:
+            rows = db.execute("SELECT kind, strategy, n, ok, latency FROM stats").fetchall()
+        with self._lock:
+            self._stats = {(k, s): _Stat(n, ok, lat) for k, s, n, ok, lat in rows}
+            self._loaded = time.monotonic()
+
+    def get(self, kind: str, strategy: str) -> _Stat:
+        self._reload()
+        with self._lock:
+            return self._stats.get((kind, strategy)) or _Stat()
+
+    def record(self, kind: str, strategy: str, ok: bool, latency: float) -> None:
+        d, a = STRATEGY_DECAY, STRATEGY_LATENCY_ALPHA
+        with self._lock:
+            st = self._stats.setdefault((kind, strategy), _Stat())
+            st.n = st.n * d + 1
+            st.ok = st.ok * d + (1 if ok else 0)
+            st.latency = latency if st.latency is None else st.latency * (1 - a) + latency * a
+        if self.path:
+            # même calcul côté SQLite: les mesures des autres processus ne sont pas écrasées
+            with _sqlite(self.path) as db:
+                db.execute("INSERT INTO stats (kind, strategy, n, ok, latency, updated) VALUES (?, ?, 1, ?, ?, ?) "
+                           "ON CONFLICT (kind, strategy) DO UPDATE SET n = n * ? + 1, ok = ok * ? + excluded.ok, "
+                           "latency = COALESCE(latency * ? + excluded.latency * ?, excluded.latency), "
+                           "updated = excluded.updated",
+                           (kind, strategy, int(ok), latency, time.time(), d, d, 1 - a, a))
+
+    def kinds(self) -> List[str]:
+        self._reload()
+        with self._lock:
+            return sorted({k for k, _ in self._stats})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.clear()
+        if self.path:
+            with _sqlite(self.path) as db:
+                db.execute("DELETE FROM stats")
+
+
+class ResolverChain:
+    """Stratégies de résolution ordonnées par type de lien d'après StrategyStats (voir l'en-tête)."""
+    def __init__(self, strategies: List[Strategy], stats: Optional[StrategyStats] = None,
+                 fatal: Optional[Callable[[Exception], bool]] = None,
+                 transient: Optional[Callable[[Exception], bool]] = None,
+                 race: bool = RESOLVE_RACE, race_timeout_s: float = RESOLVE_RACE_TIMEOUT_S):
+        self.strategies = list(strategies)
+        self.stats = stats if stats is not None else StrategyStats()
+        self.fatal = fatal or (lambda e: False)
+        self.transient = transient or (lambda e: False)
+        self.race = race
+        self.race_timeout_s = race_timeout_s
+        self._race_pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    # -------- ordre --------
+    def _score(self, kind: str, s: Strategy) -> Tuple[float, float]:
+        """(probabilité de réussite, latence) estimées: mesures lissées par l'a priori de la stratégie."""
+        st = self.stats.get(kind, s.name)
+        w = STRATEGY_PRIOR_WEIGHT
+        p = (st.ok + s.prior_success * w) / (st.n + w)
+        latency = s.prior_latency_s if st.latency is None else (st.latency * st.n + s.prior_latency_s * w) / (st.n + w)
+        return p, latency
+
+    def order(self, kind: str) -> List[Strategy]:
+        """Stratégies par coût attendu croissant (latence / probabilité de réussite)."""
+        def cost(s: Strategy) -> float:
+            p, latency = self._score(kind, s)
+            return latency / max(p, 0.01)
+        return sorted(self.strategies, key=cost)
+
+    def state(self) -> List[dict]:
+        """Une ligne par (type, stratégie) mesurée, dans l'ordre actuel (affichage, résumé JSON)."""
+        kinds = self.stats.kinds() or ["p"]
+        rows = []
+        for kind in kinds:
+            for rank, s in enumerate(self.order(kind), start=1):
+                st = self.stats.get(kind, s.name)
+                p, latency = self._score(kind, s)
+                rows.append({"type": kind, "rang": rank, "stratégie": s.name, "essais": round(st.n, 1),
+                             "réussite": round(p, 2), "latence_s": round(latency, 2)})
+        return rows
+
+    # -------- exécution --------
+    def _run(self, s: Strategy, kind: str, shortcode: str, use_auth: bool, attempts: int) -> Optional[StrategyResult]:
+        t0 = time.perf_counter()
+        res = None
+        try:
+            res = s.fn(shortcode, use_auth, attempts)
+            return res
+        except Exception as e:
+            if self.fatal(e):
+                t0 = None  # post introuvable, compte bloqué...: rien à apprendre sur la stratégie
+            raise
+        finally:
+            if t0 is not None:
+                elapsed = time.perf_counter() - t0
+                ok = res is not None and res.complete and bool(res.bundle["media"])
+                self.stats.record(kind, s.name, ok, elapsed)
+                metrics.observe(f"resolve.strategy.{s.name}", elapsed)
+                metrics.incr(f"resolve.strategy.{s.name}."
+                             + ("ok" if ok else "partial" if res and res.bundle["media"] else "fail"))
+
+    def _race(self, group: List[Strategy], kind: str, shortcode: str, use_auth: bool) -> List[StrategyResult]:
+        """Lance `group` en parallèle; s'arrête à la première réponse complète. Retourne les réponses reçues."""
+        with self._pool_lock:
+            if self._race_pool is None:
+                self._race_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="igdl-race")
+        futs = [self._race_pool.submit(contextvars.copy_context().run, self._run, s, kind, shortcode, use_auth, 1)
+                for s in group]
+        got: List[StrategyResult] = []
+        deadline = time.monotonic() + self.race_timeout_s
+        pending = set(futs)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break  # délai dépassé: les retardataires finissent seuls (statistiques comprises)
+            for f in done:
+                exc = f.exception()
+                if exc is not None:
+                    if self.fatal(exc):
+                        raise exc  # disjoncteur ouvert, compte bloqué: comme hors course
+                    continue
+                res = f.result()
+                if res:
+                    got.append(res)
+                    if res.complete and res.bundle["media"]:
+                        metrics.incr("resolve.race.won")
+                        return got
+        return got
+
+    def resolve(self, shortcode: str, kind: str, use_auth: bool, max_attempts: int,
+                race: Optional[bool] = None) -> dict:
+        """
+        Bundle du post: première réponse complète de la chaîne, sinon meilleure réponse partielle.
+        `race`: course des stratégies légères pour cet appel (None = réglage de la chaîne).
+        """
+        race = self.race if race is None else race
+        order = self.order(kind)
+        if len(order) > 1 and random.random() < STRATEGY_EXPLORE:
+            least = min(order, key=lambda st: self.stats.get(kind, st.name).n)
+            if least is not order[0]:
+                order.remove(least)
+                order.insert(0, least)
+                metrics.incr("resolve.strategy.explore")
+        found: List[dict] = []               # réponses incomplètes ou sans média, dans l'ordre reçu
+        deferred: Optional[Strategy] = None  # stratégie à tentatives restantes (erreur passagère)
+        last_exc: Optional[Exception] = None
+        i = 0
+        while i < len(order):
+            s = order[i]
+            if race and s.cheap:
+                j = i
+                while j < len(order) and order[j].cheap:
+                    j += 1
+                if j - i > 1:
+                    for res in self._race(order[i:j], kind, shortcode, use_auth):
+                        if res.complete and res.bundle["media"]:
+                            return self._done(res.bundle, found, s)
+                        found.append(res.bundle)
+                    i = j
+                    continue
+            attempts = 1 if s.retries and i < len(order) - 1 else max_attempts
+            try:
+                res = self._run(s, kind, shortcode, use_auth, attempts)
+            except Exception as e:
+                if self.fatal(e):
+                    raise
+                last_exc = e
+                if s.retries and attempts < max_attempts and self.transient(e):
+                    deferred = s
+                i += 1
+                continue
+            if res is not None:
+                if res.complete and res.bundle["media"]:
+                    return self._done(res.bundle, found, s)
+                found.append(res.bundle)
+            i += 1
+        if deferred is not None:
+            # rien de complet: les tentatives restantes (backoff compris) de la stratégie de référence
+            metrics.incr("resolve.strategy.deferred_retry")
+            try:
+                res = self._run(deferred, kind, shortcode, use_auth, max_attempts - 1)
+                if res is not None:
+                    if res.bundle["media"]:
+                        return self._done(res.bundle, found, deferred)
+                    found.append(res.bundle)
+            except Exception as e:
+                if self.fatal(e) or not found:
+                    raise
+        with_media = [b for b in found if b["media"]]
+        if with_media:
+            return self._done(with_media[0], found, None)
+        if found:
+            return found[0]  # réponse sans média: post vide ou privé (cache négatif)
+        if last_exc is not None:
+            raise last_exc
+        return {"shortcode": shortcode, "username": "", "caption": "", "date": None, "media": []}
+
+    @staticmethod
+    def _done(bundle: dict, found: List[dict], s: Optional[Strategy]) -> dict:
+        """Complète auteur / légende / date depuis les autres réponses (ex. GraphQL sans média + OG)."""
+        for other in found:
+            for k in ("username", "caption", "date"):
+                if not bundle.get(k) and other.get(k):
+                    bundle[k] = other[k]
+        if s is not None and s.cheap:
+            metrics.incr("resolve.fastpath")
+        return bundle
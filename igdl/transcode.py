@@ -0,0 +1,145 @@
+# igdl/transcode.py
+# Réencodage des photos (WebP / AVIF / JPEG, qualité, grand côté max) entre le téléchargement
+# et l'écriture du lot: pour l'archivage, les octets d'origine du CDN ne sont pas toujours utiles.
+#
+# Le travail (décodage, redimensionnement, encodage) est fait par un pool de processus
+# (TRANSCODE_WORKERS, tous les cœurs par défaut): les threads de téléchargement ne font que
+# transmettre les octets et restent libres pour le réseau (voir download.BatchWriter).
+# Pillow est optionnel: sans lui (ou sans support du format), le réglage n'est pas proposé.
+#
+# Règles:
+# - vidéos et images animées (GIF, WebP animé) inchangées;
+# - une photo dont le réencodage n'est pas plus petit (et sans redimensionnement) reste l'originale;
+# - image illisible / erreur du pool: l'originale est écrite, le lot continue;
+# - le point de reprise et le cache disque gardent les originaux (un autre réglage ne retélécharge rien).
+
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+TRANSCODE_FORMATS = {  # nom -> (format Pillow, content-type)
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+TRANSCODE_QUALITY = 80
+TRANSCODE_WORKERS = int(os.getenv("IGDL_TRANSCODE_WORKERS", "0")) or os.cpu_count() or 1
+
+
+class TranscodePolicy(NamedTuple):
+    format: Optional[str] = None     # webp | avif | jpeg; None = originaux
+    quality: int = TRANSCODE_QUALITY  # 1-100
+    max_side: Optional[int] = None   # pixels (grand côté), None = dimensions d'origine
+
+    @property
+    def active(self) -> bool:
+        return self.format is not None
+
+    @property
+    def content_type(self) -> str:
+        return TRANSCODE_FORMATS[self.format][1]
+
+    def describe(self) -> str:
+        if not self.active:
+            return "originaux"
+        return f"{self.format.upper()} q{self.quality}" + (f", ≤ {self.max_side} px" if self.max_side else "")
+
+
+def transcode_supported(fmt: str) -> bool:
+    """Pillow est installé et sait écrire ce format."""
+    if fmt not in TRANSCODE_FORMATS:
+        return False
+    try:
+        from PIL import features
+    except ImportError:
+        return False
+    return fmt == "jpeg" or bool(features.check(fmt))
+
+
+def supported_formats() -> List[str]:
+    return [f for f in TRANSCODE_FORMATS if transcode_supported(f)]
+
+
+def check_policy(policy: TranscodePolicy) -> TranscodePolicy:
+    """Valide la politique (format disponible, qualité, grand côté); ValueError sinon."""
+    if not policy.active:
+        return policy
+    if not transcode_supported(policy.format):
+        raise ValueError(f"Réencodage {policy.format} indisponible (Pillow absent ou sans support de ce format).")
+    if not 1 <= int(policy.quality) <= 100:
+        raise ValueError("La qualité de réencodage doit être entre 1 et 100.")
+    if policy.max_side is not None and policy.max_side < 16:
+        raise ValueError("Le grand côté max doit faire au moins 16 pixels.")
+    return policy
+
+
+# =========================
+# Réencodage (dans un processus du pool)
+# =========================
+def transcode_image(data: bytes, fmt: str, quality: int, max_side: Optional[int]) -> Optional[Tuple[bytes, bool]]:
+    """
+    Réencode une image: (octets, redimensionnée?), ou None si elle est à garder telle quelle
+    (image animée). Lève une exception si l'image est illisible.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as im:
+        if getattr(im, "n_frames", 1) > 1:
+            return None
+        icc = im.info.get("icc_profile")
+        if max_side:
+            im.draft("RGB", (max_side, max_side))  # JPEG: décodage directement à taille réduite
+        im = ImageOps.exif_transpose(im)  # l'orientation EXIF n'est pas recopiée: on l'applique
+        alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+        im = im.convert("RGBA" if alpha and fmt != "jpeg" else "RGB")
+        resized = bool(max_side) and max(im.size) > max_side
+        if resized:
+            im.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        pil_format = TRANSCODE_FORMATS[fmt][0]
+        opts = {"quality": int(quality)}
+        if icc:
+            opts["icc_profile"] = icc
+        if fmt == "jpeg":
+            opts.update(optimize=True, progressive=True)
+        elif fmt == "webp":
+            opts["method"] = 4
+        im.save(out, pil_format, **opts)
+    return out.getvalue(), resized
+
+
+class Transcoder:
+    """
+    Pool de processus de réencodage d'un lot (démarré au premier média). submit(octets) -> Future
+    de transcode_image(). Processus lancés en "spawn": rien n'est hérité des threads du parent.
+    """
+    def __init__(self, policy: TranscodePolicy, max_workers: Optional[int] = None):
+        self.policy = check_policy(policy)
+        self.max_workers = max(1, int(max_workers or TRANSCODE_WORKERS))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()  # submit() est appelé depuis les threads de téléchargement
+
+    def submit(self, data: bytes) -> Future:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            p = self.policy
+            return self._pool.submit(transcode_image, data, p.format, p.quality, p.max_side)
+
+    def shutdown(self, cancel: bool = False) -> None:
+        """Arrête le pool; `cancel=True` (lot abandonné) tue aussi les réencodages en cours."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        if cancel:
+            if hasattr(pool, "terminate_workers"):  # Python 3.14+
+                pool.terminate_workers()
+            else:
+                for proc in list((pool._processes or {}).values()):
+                    proc.terminate()  # les futures en cours échouent (BrokenProcessPool): originaux gardés
+        pool.shutdown(wait=True, cancel_futures=cancel)
@@ -0,0 +1,95 @@
+# igdl/urls.py
+# URL / filename helpers.
+
+import re
+import unicodedata
+from typing import List
+from urllib.parse import urlparse
+
+
+def extract_shortcode(url: str) -> str:
+    if not url:
+        raise ValueError("URL vide.")
+    clean = url.split("?")[0].split("#")[0]
+    u = urlparse(clean)
+    parts = [p for p in u.path.split("/") if p]
+
+    for tag in ("p", "reel", "tv"):
+        if tag in parts:
+            i = parts.index(tag)
+            if i + 1 < len(parts):
+                code = parts[i + 1]
+                if re.fullmatch(r"[A-Za-z0-9_\-]+", code):
+                    return code
+
+    m = re.search(r"(?:^|/)(?:p|reel|tv)/([A-Za-z0-9_\-]+)(?:/|$)", u.path)
+    if m:
+        return m.group(1)
+
+    raise ValueError("URL invalide. Exemple: https://www.instagram.com/p/XXXXXXXXX/ ou https://www.instagram.com/<user>/p/XXXXXXXXX/")
+
+
+def post_url(shortcode: str) -> str:
+    """URL canonique d'un post (une seule forme par shortcode, quel que soit le lien d'origine)."""
+    return f"https://www.instagram.com/p/{shortcode}/"
+
+
+_KIND_RE = re.compile(r"(?:^|/)(reel|tv)/[A-Za-z0-9_\-]+")
+
+
+def post_kind(url: str) -> str:
+    """Type d'un lien de post: "reel", "tv" ou "p" (par défaut, shortcode nu compris)."""
+    m = _KIND_RE.search(urlparse(url.split("?")[0].split("#")[0]).path) if url else None
+    return m.group(1) if m else "p"
+
+
+_USERNAME_RE = re.compile(r"[A-Za-z0-9._]{1,30}")
+_NOT_PROFILES = {"p", "reel", "reels", "tv", "stories", "explore", "accounts", "direct"}
+
+
+def extract_username(text: str) -> str:
+    """Nom d'utilisateur depuis "user", "@user" ou "https://www.instagram.com/user/" (en minuscules)."""
+    text = (text or "").strip()
+    if "/" in text:
+        if "://" not in text:
+            text = "https://" + text  # "instagram.com/user"
+        parts = [p for p in urlparse(text.split("?")[0].split("#")[0]).path.split("/") if p]
+        text = parts[0] if parts and parts[0] not in _NOT_PROFILES else ""
+    text = text.lstrip("@")
+    if not _USERNAME_RE.fullmatch(text):
+        raise ValueError("Profil invalide. Exemple: @utilisateur ou https://www.instagram.com/utilisateur/")
+    return text.lower()
+
+
+def sanitize_filename(text: str, max_len: int = 90) -> str:
+    if not text:
+        text = "sans_legende"
+    text = " ".join(text.split())
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    text = re.sub(r"[\\/:*?\"<>|#%&{}$!'@`+=~]", "", text)
+    text = re.sub(r"[^\w\s\-\.\(\)\[\]]", "", text)
+    text = text.strip()
+    if len(text) > max_len:
+        text = text[:max_len].rstrip()
+    return text or "sans_legende"
+
+
+def parse_urls(text: str) -> List[str]:
+    """
+    Découpe un texte en URLs, sans doublons: deux liens vers le même post (/p/X/, /reel/X/?igsh=...,
+    /user/p/X/) n'en font qu'un. Les entrées invalides sont gardées telles quelles (erreur au lot).
+    Pour de gros volumes ou des fichiers CSV / JSONL: igdl.ingest.UrlIngest.
+    """
+    raw = re.split(r"[,\s;]+", text.strip())
+    urls = [u for u in raw if u]
+    seen = set()
+    dedup = []
+    for u in urls:
+        try:
+            key = extract_shortcode(u)
+        except ValueError:
+            key = u
+        if key not in seen:
+            dedup.append(u)
+            seen.add(key)
+    return dedup